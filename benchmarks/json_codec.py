@@ -0,0 +1,62 @@
+"""
+Benchmarks the available JSON backends of n26.codec using the api response fixtures in tests/api_responses.
+
+Usage: python -m benchmarks.json_codec [--repeat N] [--number N] [--scale N] [--fixture NAME]
+
+--scale multiplies list payloads (f.ex. transactions) to simulate large responses.
+"""
+import argparse
+import glob
+import json
+import os
+import timeit
+
+from n26 import codec
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'api_responses')
+
+
+def _load_fixtures(scale: int) -> dict:
+    result = {}
+    for file_path in sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.json'))):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        if isinstance(data, list) and scale > 1:
+            data = data * scale
+        result[os.path.basename(file_path)] = json.dumps(data).encode('utf-8')
+    return result
+
+
+def _best_of(func: callable, repeat: int, number: int) -> float:
+    """
+    :return: the best time of a single call in microseconds
+    """
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--fixture', type=str, default=None, help='only benchmark the given fixture file')
+    args = parser.parse_args()
+
+    fixtures = _load_fixtures(args.scale)
+    backends = codec.available_backends()
+
+    print("{:<28} {:>9} {:<9} {:>12} {:>12}".format("fixture", "bytes", "backend", "loads [us]", "dumps [us]"))
+    for name, content in fixtures.items():
+        if args.fixture and name != args.fixture:
+            continue
+        data = json.loads(content)
+        for backend_name in backends:
+            backend = codec.create_backend(backend_name)
+            loads_time = _best_of(lambda: backend.loads(content), args.repeat, args.number)
+            dumps_time = _best_of(lambda: backend.dumps(data, indent=2, ensure_ascii=True), args.repeat, args.number)
+            print("{:<28} {:>9} {:<9} {:>12.1f} {:>12.1f}".format(name, len(content), backend_name,
+                                                                   loads_time, dumps_time))
+
+
+if __name__ == '__main__':
+    main()
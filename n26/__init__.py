@@ -1 +1,6 @@
 __version__ = '3.3.1'
+
+import time as _time
+
+# used to report the time spent importing the package, see n26.cli
+IMPORT_START = _time.perf_counter()
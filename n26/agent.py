@@ -0,0 +1,348 @@
+"""
+Authentication agent holding the token data of an account in memory and handing out valid tokens
+to all Api clients of the same user over a unix domain socket, similar to ssh-agent.
+
+The agent is the only process talking to the token endpoint: it refreshes the token before it expires
+and starts a new authentication flow if necessary. Clients select it using the "agent" token store.
+They only ever receive the access token and its expiration time, never the refresh token,
+and can't modify the token data of the agent.
+
+The socket is only accessible by its owner, connections of other users are rejected (where supported
+by the operating system). Requests and responses are JSON documents, one per line.
+"""
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pathlib import Path
+
+from n26 import codec
+from n26.api import Api, ACCESS_TOKEN_KEY, EXPIRATION_TIME_KEY
+from n26.token_store import TokenStore
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "~/.config/n26/agent.sock"
+
+# refresh the token this many seconds before it expires
+DEFAULT_REFRESH_MARGIN = 120
+# seconds to wait before retrying a failed refresh
+RETRY_INTERVAL = 30
+# seconds to wait for a response, long enough for the approval of a login
+CLIENT_TIMEOUT = 120
+# the only token data handed out to clients
+CLIENT_TOKEN_KEYS = [ACCESS_TOKEN_KEY, EXPIRATION_TIME_KEY]
+
+OP_READ = "read"
+OP_TOKEN = "token"
+OP_STATUS = "status"
+OP_STOP = "stop"
+
+
+class AgentError(Exception):
+    """
+    Error reported by the agent
+    """
+    pass
+
+
+def _client_token_data(token_data: dict) -> dict:
+    """
+    :return: the part of the token data clients may see, without the refresh token
+    """
+    return {key: token_data[key] for key in CLIENT_TOKEN_KEYS if key in token_data}
+
+
+def _socket_path(path: str or Path or None) -> Path:
+    return Path(path or DEFAULT_SOCKET_PATH).expanduser().resolve()
+
+
+def _peer_uid(connection: socket.socket) -> int or None:
+    """
+    :return: the user id of the process on the other end of a unix domain socket, None if unknown
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        uid = _peer_uid(self.request)
+        if uid is not None and uid != os.getuid():
+            LOGGER.warning("Rejecting connection of user {}".format(uid))
+            return
+
+        for line in self.rfile:
+            try:
+                response = self.server.agent.handle(codec.loads(line))
+            except Exception as e:
+                LOGGER.warning("Request failed: {}".format(e))
+                response = {"error": str(e) or e.__class__.__name__}
+            self.wfile.write(codec.dumps(response).encode('utf-8') + b"\n")
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, agent: 'Agent'):
+        self.agent = agent
+        super().__init__(path, _RequestHandler)
+
+
+class Agent(object):
+    """
+    Serves the token data of an Api client over a unix domain socket
+    """
+
+    def __init__(self, api: Api, socket_path: str or Path = None, refresh_margin: float = DEFAULT_REFRESH_MARGIN):
+        """
+        :param api: the client used to refresh and request tokens, its token store persists the token data
+        :param socket_path: path of the socket to listen on
+        :param refresh_margin: seconds before the expiration of the token to refresh it
+        """
+        self.api = api
+        self.socket_path = _socket_path(socket_path)
+        self.refresh_margin = refresh_margin
+        self.started = None
+        self.refreshes = 0
+        self._stopped = threading.Event()
+        self._server = None
+        self._refresher = None
+
+    def start(self):
+        """
+        Starts listening on the socket and refreshing the token in background threads
+        """
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        self._remove_stale_socket()
+
+        # the socket must never be accessible by other users, not even for a moment
+        umask = os.umask(0o177)
+        try:
+            self._server = _Server(str(self.socket_path), self)
+        finally:
+            os.umask(umask)
+
+        self.started = time.time()
+        threading.Thread(target=self._server.serve_forever, name="n26-agent-server", daemon=True).start()
+        self._refresher = threading.Thread(target=self._refresh_loop, name="n26-agent-refresher", daemon=True)
+        self._refresher.start()
+        LOGGER.info("Agent listening on {}".format(self.socket_path))
+
+    def _remove_stale_socket(self):
+        if not self.socket_path.exists():
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.socket_path))
+        except OSError:
+            # nobody is listening anymore
+            self.socket_path.unlink()
+            return
+        finally:
+            probe.close()
+        raise FileExistsError("An agent is already listening on {}".format(self.socket_path))
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until the agent has been stopped
+
+        :param timeout: maximum time to wait in seconds
+        :return: True if the agent has been stopped
+        """
+        return self._stopped.wait(timeout)
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        try:
+            self.socket_path.unlink()
+        except FileNotFoundError:
+            pass
+        LOGGER.info("Agent stopped")
+
+    def _expires_in(self) -> float or None:
+        token_data = self.api.token_data
+        if not self.api.is_authenticated():
+            return None
+        return token_data[EXPIRATION_TIME_KEY] - time.time()
+
+    def _refresh_loop(self):
+        while not self._stopped.is_set():
+            expires_in = self._expires_in()
+            if expires_in is None:
+                # there is nothing to refresh until a client requests a token
+                self._stopped.wait(RETRY_INTERVAL)
+                continue
+
+            if expires_in > self.refresh_margin:
+                self._stopped.wait(min(expires_in - self.refresh_margin, RETRY_INTERVAL))
+                continue
+
+            try:
+                self.api.refresh_authentication()
+                self.refreshes += 1
+                LOGGER.debug("Token refreshed")
+            except Exception as e:
+                LOGGER.warning("Unable to refresh token: {}".format(e))
+                self._stopped.wait(RETRY_INTERVAL)
+
+    def _valid_token_data(self) -> dict:
+        """
+        :return: valid token data, refreshing the token or starting a new authentication flow if necessary
+        """
+        expires_in = self._expires_in()
+        if expires_in is None:
+            # refreshes if possible and starts a new authentication flow otherwise
+            self.api.get_token()
+        elif expires_in <= self.refresh_margin:
+            self.api.refresh_authentication()
+            self.refreshes += 1
+        return self.api.token_data
+
+    def handle(self, request: dict) -> dict:
+        """
+        :param request: the request of a client
+        :return: the response
+        """
+        op = request.get("op")
+        if op == OP_READ:
+            return {"token_data": _client_token_data(self.api.token_store.read())}
+        elif op == OP_TOKEN:
+            return {"token_data": _client_token_data(self._valid_token_data())}
+        elif op == OP_STATUS:
+            return {
+                "pid": os.getpid(),
+                "started": self.started,
+                "authenticated": self.api.is_authenticated(),
+                "expires_in": self._expires_in(),
+                "refreshes": self.refreshes,
+            }
+        elif op == OP_STOP:
+            # can't shut down the server from within one of its requests
+            threading.Thread(target=self.stop, daemon=True).start()
+            return {}
+        raise ValueError("Unsupported operation: {}".format(op))
+
+
+class AgentClient(object):
+    """
+    Connection to an agent
+    """
+
+    def __init__(self, socket_path: str or Path = None, timeout: float = CLIENT_TIMEOUT):
+        """
+        :param socket_path: path of the socket the agent listens on
+        :param timeout: seconds to wait for a response
+        """
+        self.socket_path = _socket_path(socket_path)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._socket = None
+        self._reader = None
+
+    def _connect(self):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        try:
+            connection.connect(str(self.socket_path))
+        except OSError as e:
+            connection.close()
+            raise ConnectionError("Unable to connect to the agent at {}: {}".format(self.socket_path, e))
+        self._socket = connection
+        self._reader = connection.makefile("rb")
+
+    def request(self, op: str, **kwargs) -> dict:
+        """
+        :param op: one of the OP_* operations
+        :param kwargs: arguments of the operation
+        :return: the response
+        :raises AgentError: if the agent failed to handle the request
+        """
+        message = codec.dumps(dict(kwargs, op=op)).encode('utf-8') + b"\n"
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            try:
+                self._socket.sendall(message)
+                line = self._reader.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise ConnectionError("Connection to the agent closed")
+
+        response = codec.loads(line)
+        if "error" in response:
+            raise AgentError(response["error"])
+        return response
+
+    def close(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
+
+
+class AgentTokenStore(TokenStore):
+    """
+    Obtains token data from an agent, which refreshes (or requests) tokens on behalf of all its clients.
+    Reads are cached locally for a short amount of time. The token data is owned by the agent, it can't be
+    modified by its clients.
+    """
+
+    def __init__(self, socket_path: str or Path = None, cache_ttl: float = 1.0):
+        """
+        :param socket_path: path of the socket the agent listens on
+        :param cache_ttl: time in seconds to cache read results locally
+        """
+        self.client = AgentClient(socket_path)
+        self.cache_ttl = cache_ttl
+        self._local_lock = threading.RLock()
+        self._cache = None
+        self._cache_time = 0
+
+    def _cached(self, token_data: dict) -> dict:
+        self._cache = token_data
+        self._cache_time = time.monotonic()
+        return dict(token_data)
+
+    def read(self) -> dict:
+        if self._cache is not None and time.monotonic() - self._cache_time < self.cache_ttl:
+            return dict(self._cache)
+        return self._cached(self.client.request(OP_READ)["token_data"])
+
+    def write(self, token_data: dict):
+        raise PermissionError("The token data is managed by the agent at {}".format(self.client.socket_path))
+
+    def compare_and_swap(self, expected: dict, token_data: dict) -> bool:
+        raise PermissionError("The token data is managed by the agent at {}".format(self.client.socket_path))
+
+    def clear(self):
+        # only forgets the locally cached token, the login of the agent ends when it is stopped
+        self._cache = None
+
+    def ensure_valid(self) -> bool:
+        self._cached(self.client.request(OP_TOKEN)["token_data"])
+        return True
+
+    def lock(self):
+        # the agent serializes refreshes of all its clients
+        return self._local_lock
+
+    def close(self):
+        self.client.close()
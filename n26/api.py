@@ -1,24 +1,41 @@
 import base64
-import json
 import logging
-import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import date, datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlparse
 
 import click
-import requests
 from Crypto import Random
 from Crypto.Cipher import AES, PKCS1_v1_5
 from Crypto.Hash import SHA512
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.PublicKey import RSA
 from Crypto.Util.Padding import pad
-from requests import HTTPError
-from tenacity import retry, stop_after_delay, wait_fixed
+from requests import HTTPError, RequestException
+from tenacity import Retrying, RetryCallState, retry_if_exception, stop_after_delay, wait_none
 
+from n26 import balance_history, codec
+from n26.archive import ResponseArchive
+from n26.cache import MemoryCache, FileCache
 from n26.config import Config, MFA_TYPE_SMS
 from n26.const import DAILY_WITHDRAWAL_LIMIT, DAILY_PAYMENT_LIMIT
-from n26.util import create_request_url
+from n26.enrichment import Enricher
+from n26.iban import BankIndex, validate_transfer
+from n26.models import TransactionBatch
+from n26.reconcile import reconcile
+from n26.resilience import Backoff, CircuitBreakers, current_deadline, propagate_deadline, request_timeout, \
+    retry_after
+from n26.singleflight import SingleFlight
+from n26.streaming import CHUNK_SIZE, iter_json_array
+from n26.timing import timed, format_duration
+from n26.token_store import TokenStore, MemoryTokenStore, create_token_store, read_token_file, write_token_file
+from n26.transport import GET, POST, Transport, HttpTransport, _stream_kwargs
+from n26.util import create_request_url, split_time_range, period_start, PERIOD_MONTH
 
 LOGGER = logging.getLogger(__name__)
 
@@ -28,9 +45,6 @@ USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64) "
               "AppleWebKit/537.36 (KHTML, like Gecko) "
               "Chrome/59.0.3071.86 Safari/537.36")
 
-GET = "get"
-POST = "post"
-
 EXPIRATION_TIME_KEY = "expiration_time"
 ACCESS_TOKEN_KEY = "access_token"
 REFRESH_TOKEN_KEY = "refresh_token"
@@ -38,72 +52,151 @@ REFRESH_TOKEN_KEY = "refresh_token"
 GRANT_TYPE_PASSWORD = "password"
 GRANT_TYPE_REFRESH_TOKEN = "refresh_token"
 
+OVERVIEW_BALANCE = "balance"
+OVERVIEW_SPACES = "spaces"
+OVERVIEW_CARDS = "cards"
+OVERVIEW_LIMITS = "limits"
+OVERVIEW_STATUSES = "statuses"
+OVERVIEW_TRANSACTIONS = "transactions"
+OVERVIEW_ERRORS = "errors"
+
+# daily balances older than this many days are cached, younger ones might still change due to late bookings
+BALANCE_HISTORY_SETTLED_DAYS = 3
+# errors of the token endpoint while waiting for the approval of a login, any other error won't resolve by polling
+MFA_PENDING_ERRORS = ["authorization_pending", "slow_down"]
+# maximum age in seconds of the categories and contacts used to enrich transactions
+ENRICHMENT_MAX_AGE = 24 * 60 * 60
+
 
 class Api(object):
     """
     Api class can be imported as a library in order to use it within applications
     """
 
-    def __init__(self, cfg: Config = None):
+    def __init__(self, cfg: Config = None, transport: Transport = None, token_store: TokenStore = None):
         """
         Constructor accepting None to maintain backward compatibility
 
         :param cfg: configuration object
+        :param transport: transport used to execute http requests, defaults to a HttpTransport
+        :param token_store: store for token data, defaults to the store selected by the configuration
         """
         if not cfg:
             cfg = Config()
         self.config = cfg
-        self._token_data = {}
-        BASIC_AUTH_HEADERS["device-token"] = self.config.DEVICE_TOKEN.value
+        self.transport = transport or HttpTransport()
+        self._token_store_override = token_store
+        self._token_store = None
+        self._token_store_key = None
+        self._memory_token_store = MemoryTokenStore()
+        self._single_flight = SingleFlight()
+        self._session_lock = threading.Lock()
+        self._session_depth = 0
+        self._session_token_data = None
+        self._memory_cache = MemoryCache()
+        # maximum age in seconds of cached reference data like cards and categories, None disables caching
+        self.reference_data_max_age = None
+        self._reference_data = MemoryCache()
+        self._file_cache = None
+        self._archive = None
+        self._bank_index = None
+        threshold = self.config.CIRCUIT_BREAKER_THRESHOLD.value
+        self.circuit_breakers = CircuitBreakers(threshold, self.config.CIRCUIT_BREAKER_RESET_TIMEOUT.value) \
+            if threshold else None
+        # per instance, so multiple clients for different accounts can be used at the same time
+        self._basic_auth_headers = dict(BASIC_AUTH_HEADERS, **{"device-token": self.config.DEVICE_TOKEN.value})
+
+    @property
+    def token_store(self) -> TokenStore:
+        """
+        :return: the store for token data, selected by the TOKEN_STORE config
+        """
+        if self._token_store_override is not None:
+            return self._token_store_override
+
+        store_type = self.config.TOKEN_STORE.value
+        path = self.config.LOGIN_DATA_STORE_PATH.value
+        url = self.config.TOKEN_STORE_URL.value
+        agent_socket = self.config.AGENT_SOCKET.value
+        if store_type is None and path is None:
+            return self._memory_token_store
+
+        key = (store_type, str(path), url, str(agent_socket))
+        with self._session_lock:
+            if self._token_store is None or self._token_store_key != key:
+                self._token_store = create_token_store(store_type, path, url, agent_socket)
+                self._token_store_key = key
+            return self._token_store
 
     @property
     def token_data(self) -> dict:
-        if self.config.LOGIN_DATA_STORE_PATH.value is None:
-            return self._token_data
-        else:
-            return self._read_token_file(self.config.LOGIN_DATA_STORE_PATH.value)
+        return self.token_store.read()
 
     @token_data.setter
     def token_data(self, data: dict):
-        if self.config.LOGIN_DATA_STORE_PATH.value is None:
-            self._token_data = data
-        else:
-            self._write_token_file(data, self.config.LOGIN_DATA_STORE_PATH.value)
+        self.token_store.write(data)
 
     @staticmethod
     def _read_token_file(path: str) -> dict:
         """
         :return: the stored token data or an empty dict
         """
-        LOGGER.debug("Reading token data from {}".format(path))
-        path = Path(path).expanduser().resolve()
-        if not path.exists():
-            return {}
+        return read_token_file(path)
 
-        if not path.is_file():
-            raise IsADirectoryError("File path exists and is not a file: {}".format(path))
+    @staticmethod
+    def _write_token_file(token_data: dict, path: str):
+        write_token_file(token_data, path)
 
-        if path.stat().st_size <= 0:
-            # file is empty
-            return {}
+    def _token_lock(self):
+        """
+        :return: lock guarding token refreshes, shared with other processes if the token store supports it
+        """
+        return self.token_store.lock()
 
-        with open(path, "r") as file:
-            return json.loads(file.read())
+    @property
+    def cache(self) -> MemoryCache or FileCache:
+        """
+        :return: the cache for immutable api results, stored on disk if CACHE_DIR is configured
+        """
+        cache_dir = self.config.CACHE_DIR.value
+        if cache_dir is None:
+            return self._memory_cache
 
-    @staticmethod
-    def _write_token_file(token_data: dict, path: str):
-        LOGGER.debug("Writing token data to {}".format(path))
-        path = Path(path).expanduser().resolve()
+        if self._file_cache is None or self._file_cache.directory != Path(cache_dir).expanduser().resolve():
+            self._file_cache = FileCache(cache_dir)
+        return self._file_cache
 
-        # delete existing file if permissions don't match or file size is abnormally small
-        if path.exists() and (path.stat().st_mode != 0o100600 or path.stat().st_size < 10):
-            path.unlink()
+    @property
+    def archive(self) -> ResponseArchive or None:
+        """
+        :return: the archive for raw api responses if ARCHIVE_DIR is configured
+        """
+        archive_dir = self.config.ARCHIVE_DIR.value
+        if archive_dir is None:
+            return None
+
+        compression = self.config.ARCHIVE_COMPRESSION.value
+        with self._session_lock:
+            if self._archive is None or self._archive.directory != Path(archive_dir).expanduser() \
+                    or self._archive.compression != compression:
+                if self._archive is not None:
+                    self._archive.close()
+                self._archive = ResponseArchive(archive_dir, compression)
+            return self._archive
+
+    @property
+    def bank_index(self) -> BankIndex or None:
+        """
+        :return: the index of bank codes if BANK_INDEX_PATH is configured, it is loaded on first use
+        """
+        path = self.config.BANK_INDEX_PATH.value
+        if path is None:
+            return None
 
-        path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
-        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600), 'w') as file:
-            file.seek(0)
-            file.write(json.dumps(token_data, indent=2))
-            file.truncate()
+        with self._session_lock:
+            if self._bank_index is None or self._bank_index.path != Path(path).expanduser():
+                self._bank_index = BankIndex(path)
+            return self._bank_index
 
     # IDEA: @get_token decorator
     def get_account_info(self) -> dict:
@@ -143,7 +236,7 @@ class Api(object):
         """
         Retrieves a list of all cards
         """
-        return self._do_request(GET, BASE_URL_DE + '/api/v2/cards')
+        return self._get_reference_data("cards", BASE_URL_DE + '/api/v2/cards')
 
     def get_account_limits(self) -> list:
         """
@@ -182,6 +275,92 @@ class Api(object):
         """
         return self._do_request(GET, BASE_URL_DE + '/api/transactions/so')
 
+    def get_balance_history(self, from_time: int = None, to_time: int = None, intraday: bool = False,
+                            limit: int = 10000) -> list:
+        """
+        Reconstructs historical balances backwards from the current balance and the transaction history.
+
+        Daily balances of days that are settled (see BALANCE_HISTORY_SETTLED_DAYS) are cached (see CACHE_DIR),
+        so only transactions of new days have to be fetched on subsequent calls.
+
+        :param from_time: Timestamp - milliseconds since 1970, defaults to one year before to_time
+        :param to_time: Timestamp - milliseconds since 1970, defaults to now
+        :param intraday: return the balance after every transaction instead of the balance at the end of each day
+        :param limit: maximum number of transactions to fetch
+        :return: list of {"date": "YYYY-MM-DD", "balance": float} dicts for each (local) day,
+                 or {"timestamp": int, "balance": float} dicts for each transaction if intraday is set
+        """
+        now = int(time.time() * 1000)
+        # there is no history in the future
+        to_time = min(to_time or now, now)
+        if not from_time:
+            from_time = to_time - 365 * 24 * 60 * 60 * 1000
+
+        if intraday:
+            balance_cents, batch = self._get_balance_and_transactions(from_time, limit)
+            return [{"timestamp": timestamp, "balance": balance / 100}
+                    for timestamp, balance in balance_history.intraday_balances(balance_cents, batch)
+                    if from_time <= timestamp <= to_time]
+
+        days = balance_history.days_between(from_time, to_time)
+        cache_key = "balance-history/{}".format(self.config.USERNAME.value)
+        cached = self.cache.get(cache_key) or {}
+        settled_before = balance_history.day_start(
+            datetime.fromtimestamp(now / 1000).date() - timedelta(days=BALANCE_HISTORY_SETTLED_DAYS))
+
+        missing = [day for day in days
+                   if day.isoformat() not in cached or balance_history.day_start(day) >= settled_before]
+        if missing:
+            # everything from the first missing day until now is needed to calculate its balance
+            balance_cents, batch = self._get_balance_and_transactions(balance_history.day_start(missing[0]), limit)
+            today = datetime.fromtimestamp(now / 1000).date()
+            calculated_days = [missing[0] + timedelta(days=offset) for offset in range((today - missing[0]).days + 1)]
+            balances = balance_history.daily_balances(balance_cents, batch, calculated_days)
+
+            calculated = {day.isoformat(): balance for day, balance in zip(calculated_days, balances)}
+            settled = {key: balance for key, balance in calculated.items()
+                       if balance_history.day_start(date.fromisoformat(key)) < settled_before}
+            if len(batch) >= limit:
+                # balances calculated from a truncated history are wrong, never cache them
+                settled = {}
+            if settled:
+                cached = dict(cached, **settled)
+                self.cache.set(cache_key, cached)
+            cached = dict(cached, **calculated)
+
+        return [{"date": day.isoformat(), "balance": cached[day.isoformat()] / 100} for day in days]
+
+    def _get_balance_and_transactions(self, from_time: int, limit: int) -> tuple:
+        """
+        :return: the current available balance in cents and all transactions since the given time
+        """
+        with self.authenticated_session():
+            balance = self.get_balance()
+            batch = self.get_transaction_batch(from_time=from_time, to_time=int(time.time() * 1000), limit=limit)
+        if len(batch) >= limit:
+            LOGGER.warning("Transaction limit of {} reached, balance history may be incomplete".format(limit))
+        return int(round(balance["availableBalance"] * 100)), batch
+
+    def reconcile_standing_orders(self, from_time: int = None, to_time: int = None, limit: int = 10000) -> list:
+        """
+        Matches the scheduled executions of all standing orders with the transaction history
+        to find missed or late executions.
+
+        :param from_time: start of the history to check - milliseconds since 1970, defaults to one year before to_time
+        :param to_time: end of the history to check - milliseconds since 1970, defaults to now
+        :param limit: maximum number of transactions to fetch
+        :return: list of n26.reconcile.Reconciliation objects, one for each standing order
+        """
+        if not to_time:
+            to_time = int(time.time()) * 1000
+        if not from_time:
+            from_time = to_time - 365 * 24 * 60 * 60 * 1000
+
+        with self.authenticated_session():
+            standing_orders = self.get_standing_orders()["data"]
+            transactions = self.get_transactions(from_time=from_time, to_time=to_time, limit=limit)
+        return reconcile(standing_orders, transactions, from_time, to_time)
+
     def get_transactions(self, from_time: int = None, to_time: int = None, limit: int = 20, pending: bool = None,
                          categories: str = None, text_filter: str = None, last_id: str = None) -> dict:
         """
@@ -200,19 +379,72 @@ class Api(object):
         :param last_id: ??
         :return: list of transactions
         """
-        if pending and limit:
-            # pending does not support limit
-            limit = None
-
-        return self._do_request(GET, BASE_URL_DE + '/api/smrt/transactions', {
-            'from': from_time,
-            'to': to_time,
-            'limit': limit,
-            'pending': pending,
-            'categories': categories,
-            'textFilter': text_filter,
-            'lastId': last_id
-        })
+        return self._do_request(GET, BASE_URL_DE + '/api/smrt/transactions', _transaction_params(
+            from_time, to_time, limit, pending, categories, text_filter, last_id))
+
+    def iter_transactions(self, from_time: int = None, to_time: int = None, limit: int = 20, pending: bool = None,
+                          categories: str = None, text_filter: str = None, last_id: str = None,
+                          fields: list or tuple = None):
+        """
+        Get transactions one at a time while the response is still being received.
+
+        Accepts the same parameters as get_transactions(). Only a single transaction is decoded at a time,
+        so memory usage doesn't grow with the number of transactions (unless responses are archived).
+
+        :param fields: optional keys to keep of every transaction, f.ex. ["visibleTS", "amount"]
+        :return: generator of transactions
+        """
+        return self._stream_request(BASE_URL_DE + '/api/smrt/transactions', _transaction_params(
+            from_time, to_time, limit, pending, categories, text_filter, last_id), fields=fields)
+
+    def get_transaction_batch(self, from_time: int = None, to_time: int = None, limit: int = 20,
+                              pending: bool = None, categories: str = None, text_filter: str = None,
+                              last_id: str = None) -> TransactionBatch:
+        """
+        Get a list of transactions as a compact, columnar TransactionBatch.
+
+        Accepts the same parameters as get_transactions().
+
+        :return: batch of transactions
+        """
+        return TransactionBatch.from_dicts(self.iter_transactions(
+            from_time=from_time, to_time=to_time, limit=limit, pending=pending, categories=categories,
+            text_filter=text_filter, last_id=last_id))
+
+    def get_overview(self, transaction_limit: int = 5, max_workers: int = None) -> dict:
+        """
+        Retrieves balance, spaces, cards, account limits, account statuses and the latest transactions
+        concurrently using a single authentication.
+
+        Parts that could not be retrieved are set to None and the reason is stored in the "errors" dict
+        using the name of the part as key.
+
+        :param transaction_limit: number of latest transactions to include
+        :param max_workers: maximum number of concurrent requests, defaults to one per part
+        :return: dict containing all parts as well as errors
+        """
+        parts = {
+            OVERVIEW_BALANCE: self.get_balance,
+            OVERVIEW_SPACES: self.get_spaces,
+            OVERVIEW_CARDS: self.get_cards,
+            OVERVIEW_LIMITS: self.get_account_limits,
+            OVERVIEW_STATUSES: self.get_account_statuses,
+            OVERVIEW_TRANSACTIONS: lambda: self.get_transactions(limit=transaction_limit),
+        }
+
+        overview = {OVERVIEW_ERRORS: {}}
+        with self.authenticated_session():
+            with ThreadPoolExecutor(max_workers=max_workers or len(parts)) as executor:
+                futures = {name: executor.submit(propagate_deadline(func)) for name, func in parts.items()}
+                for name, future in futures.items():
+                    try:
+                        overview[name] = future.result()
+                    except Exception as e:
+                        LOGGER.warning("Unable to retrieve {} for overview: {}".format(name, e))
+                        overview[name] = None
+                        overview[OVERVIEW_ERRORS][name] = str(e)
+
+        return overview
 
     def get_transactions_limited(self, limit: int = 5) -> dict:
         import warnings
@@ -243,6 +475,7 @@ class Api(object):
         :param card_id: the id of the card to block
         :return: some info about the card (not including it's blocked state... thanks n26!)
         """
+        self._reference_data.delete("cards")
         return self._do_request(POST, BASE_URL_DE + '/api/cards/%s/block' % card_id)
 
     def unblock_card(self, card_id: str) -> dict:
@@ -253,12 +486,13 @@ class Api(object):
         :param card_id: the id of the card to block
         :return: some info about the card (not including it's unblocked state... thanks n26!)
         """
+        self._reference_data.delete("cards")
         return self._do_request(POST, BASE_URL_DE + '/api/cards/%s/unblock' % card_id)
 
     def get_savings(self) -> dict:
         return self._do_request(GET, BASE_URL_DE + '/api/hub/savings/accounts')
 
-    def get_statistics(self, from_time: int = 0, to_time: int = int(time.time()) * 1000) -> dict:
+    def get_statistics(self, from_time: int = 0, to_time: int = None) -> dict:
         """
         Get statistics in a given time frame
 
@@ -274,12 +508,105 @@ class Api(object):
 
         return self._do_request(GET, BASE_URL_DE + '/api/smrt/statistics/categories/%s/%s' % (from_time, to_time))
 
+    def get_statistics_by_period(self, from_time: int = None, to_time: int = None, period: str = PERIOD_MONTH,
+                                 max_workers: int = 4) -> list:
+        """
+        Get statistics for each calendar period (week, month or year) within a given time frame.
+
+        Periods are fetched concurrently. Statistics of periods that have already ended are cached
+        permanently (see CACHE_DIR) so only periods that are still ongoing are fetched again.
+
+        :param from_time: Timestamp - milliseconds since 1970 in CET, defaults to one year before to_time
+        :param to_time: Timestamp - milliseconds since 1970 in CET, defaults to now
+        :param period: one of "week", "month" or "year"
+        :param max_workers: maximum number of concurrent requests
+        :return: list of statistics, one for each period in chronological order
+        """
+        if not to_time:
+            to_time = int(time.time()) * 1000
+        if not from_time:
+            from_time = to_time - 365 * 24 * 60 * 60 * 1000
+
+        periods = split_time_range(from_time, to_time, period)
+        # everything before the start of the ongoing period can't change anymore
+        ongoing_period_start = period_start(int(time.time() * 1000), period)
+
+        def cache_key(start: int, end: int) -> str:
+            return "statistics/{}/{}/{}".format(self.config.USERNAME.value, start, end)
+
+        results = {}
+        missing = []
+        for start, end in periods:
+            cached = self.cache.get(cache_key(start, end)) if end < ongoing_period_start else None
+            if cached is not None:
+                results[start] = cached
+            else:
+                missing.append((start, end))
+
+        def fetch(bounds: tuple) -> dict:
+            start, end = bounds
+            statistics = self.get_statistics(from_time=start, to_time=end)
+            statistics.update({"from": start, "to": end})
+            if end < ongoing_period_start:
+                self.cache.set(cache_key(start, end), statistics)
+            return statistics
+
+        if missing:
+            with self.authenticated_session():
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    for bounds, statistics in zip(missing, executor.map(propagate_deadline(fetch), missing)):
+                        results[bounds[0]] = statistics
+
+        return [results[start] for start, _ in periods]
+
     def get_available_categories(self) -> list:
-        return self._do_request(GET, BASE_URL_DE + '/api/smrt/categories')
+        return self._get_reference_data("categories", BASE_URL_DE + '/api/smrt/categories')
+
+    def get_enricher(self, max_age: float = ENRICHMENT_MAX_AGE) -> Enricher:
+        """
+        Creates an enricher joining category names and contacts into transactions and statistics.
+        The categories and contacts are cached (see CACHE_DIR) for max_age seconds.
+
+        :param max_age: maximum age of the cached categories and contacts in seconds
+        :return: the enricher
+        """
+        cache_key = "enrichment/{}".format(self.config.USERNAME.value)
+        data = self.cache.get(cache_key, max_age=max_age)
+        if data is None:
+            with self.authenticated_session():
+                data = {
+                    "categories": self.get_available_categories(),
+                    "contacts": self.get_contacts(),
+                }
+            self.cache.set(cache_key, data)
+        return Enricher(data["categories"], data["contacts"])
 
     def get_invitations(self) -> list:
         return self._do_request(GET, BASE_URL_DE + '/api/aff/invitations')
 
+    def _get_reference_data(self, name: str, url: str) -> list or dict:
+        """
+        Retrieves data that rarely changes, cached for reference_data_max_age seconds if set
+
+        :param name: the cache key
+        :param url: the url to request
+        :return: the (possibly cached) response
+        """
+        if self.reference_data_max_age is None:
+            return self._do_request(GET, url)
+
+        data = self._reference_data.get(name, max_age=self.reference_data_max_age)
+        if data is None:
+            data = self._do_request(GET, url)
+            self._reference_data.set(name, data)
+        return deepcopy(data)
+
+    def clear_reference_data(self):
+        """
+        Drops all cached reference data
+        """
+        self._reference_data = MemoryCache()
+
     def _do_request(self, method: str = GET, url: str = "/", params: dict = None,
                     json: dict = None, headers: dict = None) -> list or dict or None:
         """
@@ -292,28 +619,107 @@ class Api(object):
         :param headers: custom headers
         :return: the response parsed as a json
         """
-        access_token = self.get_token()
-        _headers = {'Authorization': 'Bearer {}'.format(access_token)}
-        if headers is not None:
-            _headers.update(headers)
+        if method is GET and json is None:
+            # concurrent identical GET requests share a single http request
+            key = (method, create_request_url(url, params), tuple(sorted((headers or {}).items())))
+            return self._single_flight.do(key, lambda: self._execute_request(method, url, params, json, headers))
 
-        url = create_request_url(url, params)
+        return self._execute_request(method, url, params, json, headers)
 
-        if method is GET:
-            response = requests.get(url, headers=_headers, json=json)
-        elif method is POST:
-            response = requests.post(url, headers=_headers, json=json)
-        else:
-            raise ValueError("Unsupported method: {}".format(method))
+    def get_request_stats(self) -> dict:
+        """
+        :return: the number of GET calls, actual http requests and calls coalesced with an in-flight request
+        """
+        return self._single_flight.stats()
 
-        response.raise_for_status()
+    def _execute_request(self, method: str, url: str, params: dict = None, json: dict = None,
+                         headers: dict = None) -> list or dict or None:
+        response = self._send(method, url, params, json, headers)
         # some responses do not return data so we just ignore the body in that case
         if len(response.content) > 0:
             if "application/json" in response.headers.get("Content-Type", ""):
-                return response.json()
+                with timed("decode"):
+                    return codec.loads(response.content)
             else:
                 return response.content
 
+    def _stream_request(self, url: str, params: dict = None, fields: list or tuple = None):
+        """
+        Executes a GET request of an endpoint returning a JSON array and decodes its elements
+        while the body is being received. Concurrent identical requests are not coalesced.
+
+        :param url: the url to use
+        :param params: query parameters that will be appended to the url
+        :param fields: optional keys to keep of every element
+        :return: generator of the elements, the request has already been sent
+        """
+        response = self._send(GET, url, params, stream=True)
+
+        def elements():
+            try:
+                yield from iter_json_array(response.iter_content(CHUNK_SIZE), fields)
+            finally:
+                response.close()
+
+        return elements()
+
+    def _send(self, method: str, url: str, params: dict = None, json: dict = None, headers: dict = None,
+              stream: bool = False):
+        access_token = self.get_token()
+        _headers = {'Authorization': 'Bearer {}'.format(access_token)}
+        if headers is not None:
+            _headers.update(headers)
+
+        url = create_request_url(url, params)
+
+        with timed("http {} {}".format(method.upper(), urlparse(url).path)):
+            response = self._http_request(method, url, headers=_headers, json=json, stream=stream)
+        archive = self.archive
+        if archive is not None:
+            # reads the whole body of streamed responses
+            archive.append(method, url, response)
+        try:
+            response.raise_for_status()
+        except HTTPError:
+            response.close()
+            raise
+        return response
+
+    def _http_request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                      stream: bool = False):
+        """
+        Executes a http request using the transport, applying the configured timeouts,
+        the deadline of the current thread (see n26.resilience.deadline) and the circuit breaker of the endpoint
+
+        :return: the response
+        :raises DeadlineExceeded: if the deadline of the current thread has passed
+        :raises CircuitOpenError: if the circuit of the endpoint group is open
+        """
+        timeout = request_timeout(self.config.HTTP_CONNECT_TIMEOUT.value, self.config.HTTP_READ_TIMEOUT.value)
+        kwargs = _stream_kwargs(stream)
+        breaker = self.circuit_breakers.for_url(url) if self.circuit_breakers is not None else None
+        if breaker is None:
+            return self.transport.request(method, url, headers=headers, json=json, data=data, timeout=timeout,
+                                          **kwargs)
+
+        breaker.before_request()
+        try:
+            response = self.transport.request(method, url, headers=headers, json=json, data=data, timeout=timeout,
+                                              **kwargs)
+        except (RequestException, OSError):
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # f.ex. KeyboardInterrupt or an error of a replaying transport, nothing is known about the upstream
+            breaker.record_aborted()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            # client errors are answered by a healthy server
+            breaker.record_success()
+        return response
+
     def get_encryption_key(self, public_key: str = None) -> dict:
         """
         Receive public encryption key for the JSON String containing the PIN encryption key
@@ -343,7 +749,7 @@ class Api(object):
             'iv': iv64
         }
         # json string has to be represented in byte form for encryption
-        unencrypted_aes_secret = bytes(json.dumps(aes_secret), 'utf-8')
+        unencrypted_aes_secret = bytes(codec.dumps(aes_secret), 'utf-8')
         # Encrypt the secret JSON with RSA using the provided public key
         public_key = self.get_encryption_key()
         public_key_non64 = base64.b64decode(public_key['publicKey'])
@@ -369,7 +775,9 @@ class Api(object):
         :param reference: transaction reference
         :param amount: money amount
         :param pin: user PIN required for the transaction approval
+        :raises ValueError: if the IBAN or BIC is invalid, checked before the PIN is encrypted
         """
+        iban, bic = validate_transfer(iban, bic, self.bank_index)
         encrypted_secret, encrypted_pin = self.encrypt_user_pin(pin)
         pin_headers = {
             'encrypted-secret': encrypted_secret,
@@ -407,6 +815,10 @@ class Api(object):
 
         :raises PermissionError: if the token is invalid even after the refresh
         """
+        if self.token_store.ensure_valid():
+            # the store (f.ex. an agent) has authenticated on our behalf
+            return
+
         LOGGER.debug("Requesting token for username: {}".format(self.config.USERNAME.value))
         token_data = self._request_token(self.config.USERNAME.value, self.config.PASSWORD.value)
 
@@ -423,27 +835,70 @@ class Api(object):
     def refresh_authentication(self):
         """
         Refreshes an existing authentication using a (possibly expired) token.
+
+        Refreshes are serialized using a lock shared by all processes using the same token file.
+        If another process has refreshed the token while waiting for the lock its result is used instead.
+
         :raises AssertionError: if no existing token data was found
         :raises PermissionError: if the token is invalid even after the refresh
         """
-        token_data = self.token_data
-        if REFRESH_TOKEN_KEY in token_data:
-            LOGGER.debug("Trying to refresh existing token")
-            refresh_token = token_data[REFRESH_TOKEN_KEY]
-            token_data = self._refresh_token(refresh_token)
-        else:
-            raise AssertionError("Cant refresh token since no existing token data was found. "
-                                 "Please initiate a new authentication instead.")
+        if self.token_store.ensure_valid():
+            # the store (f.ex. an agent) has refreshed the token on our behalf
+            return
+
+        previous_refresh_token = self.token_data.get(REFRESH_TOKEN_KEY)
+        with self._token_lock():
+            # re-read after acquiring the lock, the token might have been refreshed by someone else
+            stored_token_data = self.token_data
+            if REFRESH_TOKEN_KEY in stored_token_data:
+                if stored_token_data[REFRESH_TOKEN_KEY] != previous_refresh_token \
+                        and self._validate_token(stored_token_data):
+                    LOGGER.debug("Token has been refreshed concurrently, skipping refresh")
+                    return
+
+                LOGGER.debug("Trying to refresh existing token")
+                refresh_token = stored_token_data[REFRESH_TOKEN_KEY]
+                token_data = self._refresh_token(refresh_token)
+            else:
+                raise AssertionError("Cant refresh token since no existing token data was found. "
+                                     "Please initiate a new authentication instead.")
 
-        # add expiration time to expiration in _validate_token()
-        token_data[EXPIRATION_TIME_KEY] = time.time() + token_data["expires_in"]
+            # add expiration time to expiration in _validate_token()
+            token_data[EXPIRATION_TIME_KEY] = time.time() + token_data["expires_in"]
 
-        # if it's still not valid, raise an exception
-        if not self._validate_token(token_data):
-            raise PermissionError("Unable to refresh authentication token")
+            # if it's still not valid, raise an exception
+            if not self._validate_token(token_data):
+                raise PermissionError("Unable to refresh authentication token")
 
-        # save token data
-        self.token_data = token_data
+            # save token data unless it has been replaced in the meantime, f.ex. by a client whose lock expired
+            if not self.token_store.compare_and_swap(stored_token_data, token_data):
+                if self._validate_token(self.token_data):
+                    LOGGER.debug("Token has been replaced concurrently, keeping the stored token")
+                else:
+                    self.token_data = token_data
+
+    @contextmanager
+    def authenticated_session(self):
+        """
+        Context manager authenticating once and reusing the same (valid) token for all requests
+        made within the context, including requests from other threads.
+        This avoids re-reading and validating the stored token data for every single request.
+        """
+        token_data = self.token_data
+        if not self._validate_token(token_data):
+            self.get_token()
+            token_data = self.token_data
+
+        with self._session_lock:
+            self._session_depth += 1
+            self._session_token_data = token_data
+        try:
+            yield self
+        finally:
+            with self._session_lock:
+                self._session_depth -= 1
+                if self._session_depth <= 0:
+                    self._session_token_data = None
 
     def get_token(self):
         """
@@ -454,21 +909,31 @@ class Api(object):
 
         :return: the access token
         """
-        new_auth = False
-        if not self._validate_token(self.token_data):
-            try:
-                self.refresh_authentication()
-            except HTTPError as http_error:
-                if http_error.response.status_code != 401:
-                    raise http_error
-                new_auth = True
-            except AssertionError:
-                new_auth = True
+        session_token_data = self._session_token_data
+        if session_token_data is not None and self._validate_token(session_token_data):
+            return session_token_data[ACCESS_TOKEN_KEY]
 
-        if new_auth:
-            self.authenticate()
-
-        return self.token_data[ACCESS_TOKEN_KEY]
+        token_data = self.token_data
+        if self._validate_token(token_data):
+            return token_data[ACCESS_TOKEN_KEY]
+
+        # only a single thread/process refreshes the token, all others wait and use its result
+        with self._token_lock():
+            new_auth = False
+            if not self._validate_token(self.token_data):
+                try:
+                    self.refresh_authentication()
+                except HTTPError as http_error:
+                    if http_error.response.status_code != 401:
+                        raise http_error
+                    new_auth = True
+                except AssertionError:
+                    new_auth = True
+
+            if new_auth:
+                self.authenticate()
+
+            return self.token_data[ACCESS_TOKEN_KEY]
 
     def _request_token(self, username: str, password: str) -> dict:
         """
@@ -487,12 +952,12 @@ class Api(object):
             "password": password
         }
         # TODO: Seems like the user-agent is not necessary but might be a good idea anyway
-        response = requests.post(f"{self.config.AUTH_BASE_URL.value}/oauth2/token", data=values_token,
-                                 headers=BASIC_AUTH_HEADERS)
+        response = self._http_request(POST, f"{self.config.AUTH_BASE_URL.value}/oauth2/token",
+                                      data=values_token, headers=self._basic_auth_headers)
         if response.status_code != 403:
             raise ValueError("Unexpected response for initial auth request: {}".format(response.text))
 
-        response_data = response.json()
+        response_data = codec.loads(response.content)
         if response_data.get("error", "") == "mfa_required":
             return response_data["mfaToken"]
         else:
@@ -510,10 +975,10 @@ class Api(object):
             'refresh_token': refresh_token,
         }
 
-        response = requests.post(f"{self.config.AUTH_BASE_URL.value}/oauth2/token", data=values_token,
-                                 headers=BASIC_AUTH_HEADERS)
+        response = self._http_request(POST, f"{self.config.AUTH_BASE_URL.value}/oauth2/token",
+                                      data=values_token, headers=self._basic_auth_headers)
         response.raise_for_status()
-        return response.json()
+        return codec.loads(response.content)
 
     def _request_mfa_approval(self, mfa_token: str):
         LOGGER.debug("Requesting MFA approval using mfa_token {}".format(mfa_token))
@@ -526,24 +991,66 @@ class Api(object):
         else:
             mfa_data['challengeType'] = "oob"
 
-        response = requests.post(
+        response = self._http_request(
+            POST,
             BASE_URL_DE + "/api/mfa/challenge",
             json=mfa_data,
             headers={
-                **BASIC_AUTH_HEADERS,
+                **self._basic_auth_headers,
                 "User-Agent": USER_AGENT,
                 "Content-Type": "application/json"
             })
         response.raise_for_status()
 
-    @retry(wait=wait_fixed(5), stop=stop_after_delay(60))
     def _complete_authentication_flow(self, mfa_token: str) -> dict:
+        """
+        Polls the token endpoint until the login has been approved (or the SMS code has been entered correctly).
+
+        The interval between polls starts short and grows up to MFA_POLL_MAX_INTERVAL, intervals requested
+        by the server are honored. Polling stops immediately on errors that won't resolve by waiting.
+
+        :param mfa_token: the token of the authentication flow
+        :return: the token data
+        """
+        sms = self.config.MFA_TYPE.value == MFA_TYPE_SMS
+        backoff = Backoff(self.config.MFA_POLL_INTERVAL.value, self.config.MFA_POLL_MAX_INTERVAL.value,
+                          self.config.MFA_POLL_BACKOFF.value)
+
+        def wait(retry_state: RetryCallState) -> float:
+            interval = backoff.interval(retry_state.attempt_number)
+            response = getattr(retry_state.outcome.exception(), "response", None)
+            requested = retry_after(response) if response is not None else None
+            if requested is not None:
+                interval = max(interval, requested)
+            current = current_deadline()
+            return min(interval, current.remaining) if current is not None else interval
+
+        def before_sleep(retry_state: RetryCallState):
+            LOGGER.debug("Login not approved yet after {} attempt(s) ({}), checking again in {}".format(
+                retry_state.attempt_number, retry_state.outcome.exception(),
+                format_duration(retry_state.next_action.sleep)))
+
+        retrying = Retrying(
+            retry=retry_if_exception(_is_mfa_pending),
+            # a wrong SMS code is entered again right away
+            wait=wait_none() if sms else wait,
+            stop=stop_after_delay(self.config.MFA_TIMEOUT.value),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+        start = time.perf_counter()
+        tokens = retrying(self._request_mfa_token, mfa_token, sms)
+        LOGGER.info("Login approved after {} attempt(s) in {}".format(
+            retrying.statistics.get("attempt_number"), format_duration(time.perf_counter() - start)))
+        return tokens
+
+    def _request_mfa_token(self, mfa_token: str, sms: bool) -> dict:
         LOGGER.debug("Completing authentication flow for mfa_token {}".format(mfa_token))
         mfa_response_data = {
             "mfaToken": mfa_token
         }
 
-        if self.config.MFA_TYPE.value == MFA_TYPE_SMS:
+        if sms:
             mfa_response_data['grant_type'] = "mfa_otp"
 
             hint = click.style("Enter the 6 digit SMS OTP code", fg="yellow")
@@ -553,9 +1060,10 @@ class Api(object):
         else:
             mfa_response_data['grant_type'] = "mfa_oob"
 
-        response = requests.post(BASE_URL_DE + "/oauth2/token", data=mfa_response_data, headers=BASIC_AUTH_HEADERS)
+        response = self._http_request(POST, BASE_URL_DE + "/oauth2/token", data=mfa_response_data,
+                                      headers=self._basic_auth_headers)
         response.raise_for_status()
-        tokens = response.json()
+        tokens = codec.loads(response.content)
         return tokens
 
     @staticmethod
@@ -573,3 +1081,42 @@ class Api(object):
             return False
 
         return ACCESS_TOKEN_KEY in token_data and token_data[ACCESS_TOKEN_KEY]
+
+
+def _transaction_params(from_time: int, to_time: int, limit: int, pending: bool, categories: str,
+                        text_filter: str, last_id: str) -> dict:
+    if pending and limit:
+        # pending does not support limit
+        limit = None
+
+    return {
+        'from': from_time,
+        'to': to_time,
+        'limit': limit,
+        'pending': pending,
+        'categories': categories,
+        'textFilter': text_filter,
+        'lastId': last_id
+    }
+
+
+def _is_mfa_pending(exception: BaseException) -> bool:
+    """
+    :param exception: the error of a request to complete the authentication flow
+    :return: whether the request should be repeated, f.ex. because the login has not been approved yet
+    """
+    if isinstance(exception, HTTPError):
+        response = exception.response
+        if response is None:
+            return False
+        if response.status_code == 429 or response.status_code >= 500:
+            return True
+        if response.status_code != 400:
+            return False
+        try:
+            error = codec.loads(response.content).get("error")
+        except (ValueError, AttributeError):
+            error = None
+        return error in MFA_PENDING_ERRORS
+    # connection errors and timeouts of single requests, but neither deadlines nor open circuits
+    return isinstance(exception, RequestException)
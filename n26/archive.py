@@ -0,0 +1,391 @@
+"""
+Compressed archive of raw api responses, f.ex. for audits.
+
+Every response is appended to an uncompressed journal right away, so it survives a crash of the process.
+The journal is compacted into blocks of about BLOCK_SIZE bytes, every block is compressed on its own
+(gzip, or zstd if the zstandard package is installed) and appended to a log file. An index file next to it
+contains one fixed-width record per block: its position in the log, the time range of its responses
+and a bit mask of the endpoints it contains. Queries scan the memory mapped index and only read and
+decompress the blocks that may contain matching responses, so seeking to a given day doesn't depend on
+the size of the archive.
+
+Archived responses can be replayed into the parsers of the library, either one by one (ArchivedResponse.parse())
+or as a transport serving them to an Api client (ArchiveTransport).
+"""
+import atexit
+import gzip
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import weakref
+from datetime import date, timedelta
+from pathlib import Path
+from urllib.parse import urlparse
+
+from n26 import codec
+from n26.balance_history import day_start
+from n26.config import ARCHIVE_COMPRESSION_GZIP, ARCHIVE_COMPRESSION_ZSTD
+from n26.filelock import FileLock
+from n26.transport import Transport, RecordedResponse, RECORDED_HEADERS, _encode_body, _decode_body
+
+LOGGER = logging.getLogger(__name__)
+
+LOG_FILE = "responses.log"
+INDEX_FILE = "responses.idx"
+JOURNAL_FILE = "responses.journal"
+ENDPOINTS_FILE = "endpoints.idx"
+LOCK_FILE = "archive.lock"
+
+# uncompressed size of a block
+BLOCK_SIZE = 256 * 1024
+# seconds a response may stay in the journal before it is compacted into a block
+MAX_DELAY = 60.0
+
+MAGIC = b"N26A"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+# offset and length of the block in the log, first and last timestamp (ms), number of responses, endpoint mask
+BLOCK = struct.Struct("<QIqqIQ")
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _compressor(compression: str) -> callable:
+    if compression == ARCHIVE_COMPRESSION_GZIP:
+        return gzip.compress
+    if compression == ARCHIVE_COMPRESSION_ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the zstandard package: pip3 install n26[zstd]")
+        return zstandard.ZstdCompressor().compress
+    raise ValueError("Unsupported compression: {}".format(compression))
+
+
+def _decompress(block: bytes) -> bytes:
+    if block.startswith(_ZSTD_MAGIC):
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(block)
+    return gzip.decompress(block)
+
+
+def endpoint_of(url: str) -> str:
+    """
+    :param url: the request url
+    :return: the endpoint of the url, i.e. its path without query parameters
+    """
+    return urlparse(url).path
+
+
+def _endpoint_bit(number: int) -> int:
+    return 1 << (number % 64)
+
+
+def day_range(day: date) -> tuple:
+    """
+    :param day: a (local) day
+    :return: (from_time, to_time) of the day in milliseconds since 1970, both inclusive
+    """
+    return day_start(day), day_start(day + timedelta(days=1)) - 1
+
+
+class ArchivedResponse(object):
+    """
+    A response read from the archive
+    """
+
+    def __init__(self, entry: dict):
+        """
+        :param entry: the archived entry
+        """
+        self.timestamp = entry["timestamp"]
+        self.method = entry["method"]
+        self.url = entry["url"]
+        self.status = entry["status"]
+        self.headers = entry.get("headers", {})
+        self.content = _decode_body(entry)
+
+    @property
+    def endpoint(self) -> str:
+        return endpoint_of(self.url)
+
+    def response(self) -> RecordedResponse:
+        """
+        :return: the response in the form returned by a transport
+        """
+        return RecordedResponse(self.url, self.status, self.headers, self.content)
+
+    def parse(self) -> list or dict or bytes or None:
+        """
+        :return: the body decoded the same way the Api client decodes responses
+        """
+        if len(self.content) == 0:
+            return None
+        if "application/json" in self.response().headers.get("Content-Type", ""):
+            return codec.loads(self.content)
+        return self.content
+
+    def __repr__(self):
+        return "ArchivedResponse({}, {} {}, {})".format(self.timestamp, self.method.upper(), self.url, self.status)
+
+
+class ResponseArchive(object):
+    """
+    Append-only archive of api responses in a directory, safe to be used by multiple processes
+    """
+
+    def __init__(self, directory: str or Path, compression: str = ARCHIVE_COMPRESSION_GZIP,
+                 block_size: int = BLOCK_SIZE, max_delay: float = MAX_DELAY):
+        """
+        :param directory: directory of the archive files, it is created if necessary
+        :param compression: ARCHIVE_COMPRESSION_GZIP or ARCHIVE_COMPRESSION_ZSTD, used for new blocks
+        :param block_size: uncompressed size of a block in bytes
+        :param max_delay: seconds a response may stay in the journal before its block is written
+        """
+        self.directory = Path(directory).expanduser()
+        self.log_path = self.directory / LOG_FILE
+        self.index_path = self.directory / INDEX_FILE
+        self.journal_path = self.directory / JOURNAL_FILE
+        self.endpoints_path = self.directory / ENDPOINTS_FILE
+        self.compression = compression
+        self.block_size = block_size
+        self.max_delay = max_delay
+        self._compress = _compressor(compression)
+        self._file_lock = FileLock(self.directory / LOCK_FILE)
+        self._lock = threading.Lock()
+        # time of the first response this instance has written to the journal since the last compaction
+        self._journal_started = None
+        self._endpoints = []
+        self._numbers = {}
+
+        # compact journaled responses when the process exits, other processes do it otherwise
+        atexit.register(_flush_on_exit, weakref.ref(self))
+
+    def _load_endpoints(self):
+        try:
+            with self.endpoints_path.open("rb") as file:
+                lines = file.read().splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines[len(self._endpoints):]:
+            endpoint = codec.loads(line)
+            self._numbers[endpoint] = len(self._endpoints)
+            self._endpoints.append(endpoint)
+
+    def _endpoint_number(self, endpoint: str) -> int:
+        """
+        :return: the number of the endpoint, it is added if necessary (requires the file lock)
+        """
+        number = self._numbers.get(endpoint)
+        if number is None:
+            with self.endpoints_path.open("ab") as file:
+                file.write(codec.dumps(endpoint).encode('utf-8') + b"\n")
+            number = self._numbers[endpoint] = len(self._endpoints)
+            self._endpoints.append(endpoint)
+        return number
+
+    def endpoints(self) -> list:
+        """
+        :return: all endpoints with archived responses
+        """
+        self._load_endpoints()
+        return list(self._endpoints)
+
+    def append(self, method: str, url: str, response, timestamp: int = None):
+        """
+        Adds a response to the journal, it is compacted into a block once the journal is full (or after max_delay)
+
+        :param method: the http method of the request
+        :param url: the full url of the request
+        :param response: the response
+        :param timestamp: time of the response in milliseconds since 1970, defaults to now
+        """
+        entry = {
+            "timestamp": int(time.time() * 1000) if timestamp is None else timestamp,
+            "method": method,
+            "url": url,
+            "status": response.status_code,
+            "headers": {key: response.headers[key] for key in RECORDED_HEADERS if key in response.headers},
+        }
+        entry.update(_encode_body(response.content or b""))
+        line = codec.dumps(entry).encode('utf-8') + b"\n"
+
+        self.directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+        with self._lock, self._file_lock:
+            descriptor = os.open(str(self.journal_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(descriptor, line)
+                journal_size = os.fstat(descriptor).st_size
+            finally:
+                os.close(descriptor)
+
+            if self._journal_started is None:
+                self._journal_started = time.monotonic()
+            if journal_size >= self.block_size or time.monotonic() - self._journal_started >= self.max_delay:
+                self._compact()
+
+    def flush(self):
+        """
+        Compacts all journaled responses into a block
+        """
+        if not self.journal_path.exists():
+            return
+        with self._lock, self._file_lock:
+            self._compact()
+
+    def close(self):
+        self.flush()
+
+    def _read_journal(self) -> list:
+        """
+        :return: the entries of the journal, an incomplete last line (of a crashed process) is skipped
+        """
+        try:
+            with self.journal_path.open("rb") as file:
+                lines = file.read().split(b"\n")
+        except FileNotFoundError:
+            return []
+        if lines[-1]:
+            LOGGER.warning("Skipping an incomplete response in {}".format(self.journal_path))
+        entries = []
+        for line in lines[:-1]:
+            try:
+                entries.append((codec.loads(line), line + b"\n"))
+            except ValueError:
+                LOGGER.warning("Skipping an invalid response in {}".format(self.journal_path))
+        return entries
+
+    def _compact(self):
+        """
+        Compresses the journaled responses of all processes into a block, appends it to the log
+        and empties the journal (requires both locks)
+        """
+        self._journal_started = None
+        entries = self._read_journal()
+        if entries:
+            block = self._compress(b"".join(line for _, line in entries))
+            timestamps = [entry["timestamp"] for entry, _ in entries]
+
+            self._load_endpoints()
+            mask = 0
+            for entry, _ in entries:
+                mask |= _endpoint_bit(self._endpoint_number(endpoint_of(entry["url"])))
+
+            with open(str(self.log_path), "ab") as log:
+                offset = log.seek(0, os.SEEK_END)
+                log.write(block)
+
+            with open(str(self.index_path), "ab") as index:
+                if index.seek(0, os.SEEK_END) == 0:
+                    index.write(HEADER.pack(MAGIC, VERSION, BLOCK.size))
+                index.write(BLOCK.pack(offset, len(block), min(timestamps), max(timestamps), len(entries), mask))
+            LOGGER.debug("Archived {} responses in {} bytes".format(len(entries), len(block)))
+        # a crash before this point leaves the responses in the journal, they are archived (again) later
+        with self.journal_path.open("wb"):
+            pass
+
+    def _blocks(self, from_time: int or None, to_time: int or None, mask: int or None) -> list:
+        """
+        :return: (offset, length) of all blocks that may contain matching responses
+        """
+        try:
+            file = open(str(self.index_path), "rb")
+        except FileNotFoundError:
+            return []
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if size <= HEADER.size:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                magic, version, record_size = HEADER.unpack_from(index)
+                if magic != MAGIC or version != VERSION or record_size != BLOCK.size:
+                    raise ValueError("Unsupported archive index: {}".format(self.index_path))
+                end = HEADER.size + (size - HEADER.size) // BLOCK.size * BLOCK.size
+                return [(offset, length)
+                        for offset, length, first, last, _, endpoints in BLOCK.iter_unpack(index[HEADER.size:end])
+                        if (from_time is None or last >= from_time) and (to_time is None or first <= to_time)
+                        and (mask is None or endpoints & mask)]
+
+    def query(self, from_time: int = None, to_time: int = None, endpoint: str = None):
+        """
+        Reads archived responses, including the ones not yet compacted
+
+        :param from_time: milliseconds since 1970 (inclusive)
+        :param to_time: milliseconds since 1970 (inclusive)
+        :param endpoint: only return responses of this endpoint, f.ex. "/api/smrt/transactions"
+        :return: generator of ArchivedResponse in the order they have been archived
+        """
+        mask = None
+        if endpoint is not None:
+            self._load_endpoints()
+            number = self._numbers.get(endpoint)
+            # an endpoint without a number is in no block yet, but may be in the journal
+            mask = 0 if number is None else _endpoint_bit(number)
+
+        def matches(entry: dict) -> bool:
+            return (from_time is None or entry["timestamp"] >= from_time) \
+                and (to_time is None or entry["timestamp"] <= to_time) \
+                and (endpoint is None or endpoint_of(entry["url"]) == endpoint)
+
+        with self._file_lock:
+            # blocks and journal have to be read consistently, the journal might be compacted meanwhile
+            blocks = self._blocks(from_time, to_time, mask)
+            journal = [entry for entry, _ in self._read_journal() if matches(entry)]
+
+        if blocks:
+            with open(str(self.log_path), "rb") as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                for offset, length in blocks:
+                    for line in _decompress(log[offset:offset + length]).splitlines():
+                        entry = codec.loads(line)
+                        if matches(entry):
+                            yield ArchivedResponse(entry)
+        for entry in journal:
+            yield ArchivedResponse(entry)
+
+    def day(self, day: date, endpoint: str = None):
+        """
+        :param day: a (local) day
+        :param endpoint: only return responses of this endpoint
+        :return: generator of the responses archived on the given day
+        """
+        from_time, to_time = day_range(day)
+        return self.query(from_time, to_time, endpoint)
+
+
+def _flush_on_exit(reference: weakref.ref):
+    archive = reference()
+    if archive is not None:
+        try:
+            archive.flush()
+        except Exception as e:
+            LOGGER.warning("Unable to write archived responses: {}".format(e))
+
+
+class ArchiveTransport(Transport):
+    """
+    Serves archived responses to an Api client, f.ex. to reprocess them with a newer version of the library.
+
+    Requests are matched by method and url, the latest archived response wins.
+    Authentication requests are never archived, use a token store with a (dummy) token.
+    """
+
+    def __init__(self, archive: ResponseArchive, from_time: int = None, to_time: int = None):
+        """
+        :param archive: the archive
+        :param from_time: only serve responses archived at or after this time (milliseconds since 1970)
+        :param to_time: only serve responses archived at or before this time (milliseconds since 1970)
+        """
+        self._responses = {}
+        for response in archive.query(from_time, to_time):
+            self._responses[(response.method, response.url)] = response
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        archived = self._responses.get((method, url))
+        if archived is None:
+            raise ValueError("No archived response for {} {}".format(method.upper(), url))
+        return archived.response()
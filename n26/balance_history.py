@@ -0,0 +1,80 @@
+"""
+Reconstruction of historical balances from the current balance and the transaction history.
+
+The balance at any point in time is the current balance minus the amounts of all transactions after it,
+so the series is calculated backwards using cumulative sums over the amount column of a TransactionBatch.
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate
+
+from n26.models import TransactionBatch
+
+
+def day_start(day: date) -> int:
+    """
+    :param day: the day
+    :return: the start of the day in local time - milliseconds since 1970
+    """
+    return int(datetime.combine(day, time()).timestamp() * 1000)
+
+
+def days_between(from_time: int, to_time: int) -> list:
+    """
+    :param from_time: milliseconds since 1970
+    :param to_time: milliseconds since 1970 (inclusive)
+    :return: list of all (local) days in the given range
+    """
+    first = datetime.fromtimestamp(from_time / 1000).date()
+    last = datetime.fromtimestamp(to_time / 1000).date()
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+
+def _sorted(batch: TransactionBatch) -> tuple:
+    """
+    :return: timestamps and amounts in cents sorted by time
+    """
+    timestamps = batch.timestamps
+    amounts = batch.amounts_cents
+    order = sorted(range(len(batch)), key=timestamps.__getitem__)
+    return [timestamps[i] for i in order], [amounts[i] for i in order]
+
+
+def daily_balances(balance_cents: int, batch: TransactionBatch, days: list) -> list:
+    """
+    Calculates the balance at the end of each of the given days
+
+    :param balance_cents: the current balance in cents, i.e. after the last transaction of the batch
+    :param batch: all transactions from the start of the first day until now
+    :param days: consecutive days in ascending order
+    :return: list of balances in cents, one for each day
+    """
+    if not days:
+        return []
+
+    timestamps, amounts = _sorted(batch)
+    # boundaries[i] is the end of days[i]
+    boundaries = [day_start(day + timedelta(days=1)) for day in days]
+
+    # net amount per day, the last slot collects everything after the last day
+    net = [0] * (len(days) + 1)
+    for timestamp, amount in zip(timestamps, amounts):
+        net[bisect_right(boundaries, timestamp)] += amount
+
+    # the balance at the end of a day is the current balance minus everything booked afterwards
+    later = list(accumulate(reversed(net)))
+    return [balance_cents - total for total in reversed(later[:len(days)])]
+
+
+def intraday_balances(balance_cents: int, batch: TransactionBatch) -> list:
+    """
+    Calculates the balance after every single transaction
+
+    :param balance_cents: the current balance in cents, i.e. after the last transaction of the batch
+    :param batch: the transactions
+    :return: list of (timestamp, balance in cents) tuples in ascending order
+    """
+    timestamps, amounts = _sorted(batch)
+    # sum of all amounts after each transaction
+    later = [0] + list(accumulate(reversed(amounts[1:])))
+    return [(timestamp, balance_cents - total) for timestamp, total in zip(timestamps, reversed(later))]
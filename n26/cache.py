@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from n26 import codec
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MemoryCache(object):
+    """
+    Simple in-process key value cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key: str, max_age: float = None) -> any:
+        """
+        :param key: the key of the entry
+        :param max_age: maximum age of the entry in seconds, None means the entry never expires
+        :return: the cached value or None if there is no (valid) entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        created, value = entry
+        if max_age is not None and time.time() - created > max_age:
+            return None
+        return value
+
+    def age(self, key: str) -> float or None:
+        """
+        :param key: the key of the entry
+        :return: the age of the entry in seconds or None if there is no entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.time() - entry[0]
+
+    def set(self, key: str, value: any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class FileCache(object):
+    """
+    Key value cache storing each entry as a JSON file within a directory.
+    Entries are written atomically so the cache can be shared between processes.
+    """
+
+    def __init__(self, directory: str or Path):
+        """
+        :param directory: the directory to store cache entries in, it is created if necessary
+        """
+        self.directory = Path(directory).expanduser().resolve()
+
+    def _path(self, key: str) -> Path:
+        # hash keys to get safe file names that don't leak f.ex. usernames
+        return self.directory / "{}.json".format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _read(self, key: str) -> dict or None:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                entry = codec.loads(file.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            LOGGER.warning("Ignoring corrupt cache entry {}".format(path))
+            return None
+
+        if entry.get("key") != key:
+            # hash collision or foreign file
+            return None
+        return entry
+
+    def get(self, key: str, max_age: float = None) -> any:
+        """
+        :param key: the key of the entry
+        :param max_age: maximum age of the entry in seconds, None means the entry never expires
+        :return: the cached value or None if there is no (valid) entry
+        """
+        entry = self._read(key)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() - entry["created"] > max_age:
+            return None
+        return entry["value"]
+
+    def age(self, key: str) -> float or None:
+        """
+        :param key: the key of the entry
+        :return: the age of the entry in seconds or None if there is no entry
+        """
+        entry = self._read(key)
+        return None if entry is None else time.time() - entry["created"]
+
+    def set(self, key: str, value: any):
+        self.directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+        content = codec.dumps({"key": key, "created": time.time(), "value": value})
+        file_descriptor, temp_path = tempfile.mkstemp(dir=str(self.directory), prefix=".tmp-")
+        try:
+            with os.fdopen(file_descriptor, 'w') as file:
+                file.write(content)
+            os.replace(temp_path, str(self._path(key)))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, key: str):
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
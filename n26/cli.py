@@ -1,25 +1,67 @@
+import cProfile
 import functools
+import io
 import logging
+import shlex
+import sys
+import threading
+import time
+import tracemalloc
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Tuple
 
 import click
-from requests import HTTPError
+from requests import HTTPError, RequestException, Timeout
 from tabulate import tabulate
 
+import n26
+import n26.agent as auth_agent
 import n26.api as api
-from n26.config import Config
+import n26.doctor as doctor_module
+import n26.fleet as fleet_module
+from n26 import codec, completion, resilience
+from n26.config import TOKEN_STORE_AGENT
+from n26.enrichment import Enricher, CATEGORY_NAME, CONTACT_NAME
+from n26.iban import validate_iban, validate_transfer
+from n26.reconcile import project_outflows
+from n26.resilience import CircuitOpenError, DeadlineExceeded
+from n26.shell import Shell
+from n26.snapshots import SnapshotStore, AGGREGATES, AGGREGATE_LAST, RESOLUTIONS
+from n26.timing import TIMINGS, timed, format_duration, format_size
+from n26.token_store import create_token_store
+from n26.transport import HttpTransport
 from n26.const import AMOUNT, CURRENCY, REFERENCE_TEXT, ATM_WITHDRAW, CARD_STATUS_ACTIVE, DATETIME_FORMATS
+from n26.util import PERIODS
 
 LOGGER = logging.getLogger(__name__)
 
+IMPORT_DURATION = time.perf_counter() - n26.IMPORT_START
+
+_config_start = time.perf_counter()
 API_CLIENT = api.Api()
+CONFIG_DURATION = time.perf_counter() - _config_start
 
 JSON_OUTPUT = False
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
+# state of the commands executed by the batch and shell commands, per thread since they may run in parallel
+_SESSION_STATE = threading.local()
+
+
+def _in_session() -> bool:
+    return getattr(_SESSION_STATE, "active", False)
+
+
+def _json_output() -> bool:
+    """
+    :return: whether the current command should print JSON
+    """
+    return getattr(_SESSION_STATE, "json_output", JSON_OUTPUT)
+
 
 def auth_decorator(func: callable):
     """
@@ -29,48 +71,449 @@ def auth_decorator(func: callable):
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        new_auth = False
         try:
-            API_CLIENT.refresh_authentication()
-        except HTTPError as http_error:
-            if http_error.response.status_code != 401:
-                raise http_error
-            new_auth = True
-        except AssertionError:
-            new_auth = True
+            # commands run by the batch and shell commands share their authentication
+            if not (_in_session() and API_CLIENT.is_authenticated()):
+                with timed("auth"):
+                    _authenticate()
 
-        if new_auth:
-            hint = click.style("Initiating authentication flow, please check your phone to approve login.", fg="yellow")
-            click.echo(hint)
+            with timed("command"):
+                return func(*args, **kwargs)
+        except (DeadlineExceeded, CircuitOpenError, Timeout) as e:
+            raise click.ClickException(str(e))
 
-            API_CLIENT.authenticate()
+    return wrapper
 
-            success = click.style("Authentication successful :)", fg="green")
-            click.echo(success)
 
-        return func(*args, **kwargs)
+def _authenticate():
+    new_auth = False
+    try:
+        API_CLIENT.refresh_authentication()
+    except HTTPError as http_error:
+        if http_error.response.status_code != 401:
+            raise http_error
+        new_auth = True
+    except AssertionError:
+        new_auth = True
 
-    return wrapper
+    if new_auth:
+        hint = click.style("Initiating authentication flow, please check your phone to approve login.", fg="yellow")
+        click.echo(hint)
+
+        API_CLIENT.authenticate()
+
+        success = click.style("Authentication successful :)", fg="green")
+        click.echo(success)
+
+
+def _complete(source: str, separator: str = None) -> callable:
+    """
+    :param source: one of the n26.completion.SOURCE_* names
+    :param separator: separator of options accepting a list of values
+    :return: shell_complete callback of an option completing cached values, see n26.completion
+    """
+
+    def shell_complete(ctx: click.Context, param: click.Parameter, incomplete: str) -> list:
+        return completion.complete(API_CLIENT, source, incomplete, separator)
+
+    return shell_complete
 
 
 # Cli returns command line requests
 @click.group(context_settings=CONTEXT_SETTINGS)
 @click.option("-json", default=False, type=bool, is_flag=True)
+@click.option("--timings", "show_timings", default=False, is_flag=True,
+              help="Print the time spent per phase (import, config, auth, http, decode, render) to stderr.")
+@click.option("--profile", "profile_path", default=None, type=click.Path(dir_okay=False, writable=True),
+              help="Write cProfile statistics of the command to the given file, inspect it using 'python -m pstats'.")
+@click.option("--trace-memory", default=False, is_flag=True,
+              help="Print the peak memory allocated by python while running the command to stderr.")
+@click.option("--deadline", default=None, type=click.FloatRange(min=0, min_open=True),
+              help="Abort the command if it takes longer than the given number of seconds, "
+                   "including authentication and retries.")
 @click.version_option()
-def cli(json: bool):
+@click.pass_context
+def cli(ctx: click.Context, json: bool, show_timings: bool, profile_path: str or None, trace_memory: bool,
+        deadline: float or None):
     """Interact with the https://n26.com API via the command line."""
+    if _in_session():
+        # all other global options apply to the batch command as a whole
+        _SESSION_STATE.json_output = json
+        return
+
     global JSON_OUTPUT
     JSON_OUTPUT = json
 
+    if deadline is not None:
+        ctx.with_resource(resilience.deadline(deadline))
+
+    if show_timings:
+        TIMINGS.clear()
+        TIMINGS.enabled = True
+        start = time.perf_counter()
+        ctx.call_on_close(lambda: _report_timings(time.perf_counter() - start))
+
+    if trace_memory:
+        tracemalloc.start()
+        ctx.call_on_close(_report_memory)
+
+    if profile_path is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        ctx.call_on_close(lambda: _write_profile(profiler, profile_path))
+
+
+def _report_timings(command_duration: float):
+    """
+    Prints the recorded timings to stderr
+    :param command_duration: wall time from parsing the global options until the command finished
+    """
+    TIMINGS.enabled = False
+    rows = [
+        ["import", 1, IMPORT_DURATION],
+        ["config", 1, CONFIG_DURATION],
+    ]
+    for name, count, total, total_self in TIMINGS.summary():
+        if name == "command":
+            # everything not spent in nested phases like http requests, mostly formatting the output
+            rows.append(["render", count, total_self])
+        else:
+            rows.append([name, count, total])
+    rows.append(["total", 1, IMPORT_DURATION + CONFIG_DURATION + command_duration])
+    TIMINGS.clear()
+
+    table = tabulate([[name, count, format_duration(duration)] for name, count, duration in rows],
+                     headers=["Phase", "Calls", "Time"], colalign=("left", "right", "right"))
+    click.echo(table, err=True)
+
+
+def _report_memory():
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    click.echo("Peak memory allocated: {}".format(format_size(peak)), err=True)
+
+
+def _write_profile(profiler: cProfile.Profile, path: str):
+    profiler.disable()
+    profiler.dump_stats(path)
+    click.echo("Profile written to {}".format(path), err=True)
+
+
+class _SessionOutput(object):
+    """
+    Replacement for sys.stdout which redirects the output of commands run by the batch command
+    to the buffer of the current thread
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _target(self):
+        buffer = getattr(_SESSION_STATE, "output", None)
+        return self._stream if buffer is None else buffer
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return False
+
+    def __getattr__(self, name: str):
+        return getattr(self._stream, name)
+
+
+def _read_batch_commands(file) -> list:
+    """
+    :param file: file containing one command per line, empty lines and lines starting with "#" are ignored
+    :return: list of argument lists
+    """
+    commands = []
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        args = shlex.split(line)
+        if args[0] == "n26":
+            args = args[1:]
+        if args:
+            commands.append(args)
+    return commands
+
+
+@contextmanager
+def _warm_session(pool_size: int):
+    """
+    Keeps the token and connections of API_CLIENT warm for all commands run within the context
+
+    :param pool_size: number of connections to keep open, should match the number of threads running commands
+    """
+    previous_transport = API_CLIENT.transport
+    if type(previous_transport) is HttpTransport and previous_transport.session is None:
+        API_CLIENT.transport = HttpTransport.pooled(pool_size)
+    try:
+        with API_CLIENT.authenticated_session():
+            yield
+    finally:
+        if API_CLIENT.transport is not previous_transport:
+            API_CLIENT.transport.close()
+            API_CLIENT.transport = previous_transport
+
+
+def _run_session_command(args: list, capture: bool = True) -> Tuple[str, bool, str or None]:
+    """
+    Runs a single command of a batch or shell in the current thread
+
+    :param args: the command line arguments
+    :param capture: capture the output of the command instead of writing it to stdout
+    :return: the output of the command, whether it printed JSON and an error message if it failed
+    """
+    output = io.StringIO() if capture else None
+    _SESSION_STATE.active = True
+    _SESSION_STATE.output = output
+    _SESSION_STATE.json_output = JSON_OUTPUT
+    error = None
+    try:
+        exit_code = cli.main(args=args, prog_name="n26", standalone_mode=False)
+        if exit_code:
+            error = "Exit code {}".format(exit_code)
+    except click.ClickException as e:
+        error = e.format_message()
+    except click.Abort:
+        error = "Aborted"
+    except Exception as e:
+        LOGGER.debug("Command failed: {}".format(" ".join(args)), exc_info=True)
+        error = str(e) or type(e).__name__
+    finally:
+        json_output = _json_output()
+        del _SESSION_STATE.active, _SESSION_STATE.output, _SESSION_STATE.json_output
+    return "" if output is None else output.getvalue(), json_output, error
+
+
+@cli.command()
+@click.argument('file', default='-', type=click.File('r'))
+@click.option('--parallel', default=1, type=click.IntRange(1, 32), show_default=True,
+              help='Number of commands to run concurrently.')
+@click.option('--output-dir', default=None, type=click.Path(file_okay=False, writable=True),
+              help='Write the output of every command to a separate file in this directory '
+                   'instead of a tagged stream on stdout.')
+@auth_decorator
+def batch(file, parallel: int, output_dir: str or None):
+    """ Run many commands in a single process
+
+    Reads one command per line (f.ex. "-json transactions --limit 10") from FILE or stdin
+    and runs them sharing a single authentication and connection pool.
+    """
+    if _in_session():
+        raise click.UsageError("Batches can not be nested")
+
+    commands = _read_batch_commands(file)
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    stdout = sys.stdout
+    sys.stdout = _SessionOutput(stdout)
+    failed = 0
+    try:
+        with _warm_session(parallel), ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = [executor.submit(resilience.propagate_deadline(_run_session_command), args) for args in commands]
+            # report results in input order
+            for index, (args, future) in enumerate(zip(commands, futures), start=1):
+                output, json_output, error = future.result()
+                name = next((arg for arg in args if not arg.startswith("-")), "n26")
+                tag = "{}:{}".format(index, name)
+                if output_dir is not None:
+                    file_name = "{:02d}-{}.{}".format(index, name, "json" if json_output else "txt")
+                    Path(output_dir, file_name).write_text(output)
+                else:
+                    for line in output.splitlines():
+                        stdout.write("[{}] {}\n".format(tag, line))
+                    stdout.flush()
+                if error is not None:
+                    failed += 1
+                    click.echo("[{}] Error: {}".format(tag, error), err=True)
+    finally:
+        sys.stdout = stdout
+
+    if failed > 0:
+        raise click.ClickException("{} of {} commands failed".format(failed, len(commands)))
+
+
+@cli.command()
+@click.option('--cache-ttl', default=300, type=click.IntRange(0), show_default=True,
+              help='Seconds to cache reference data like cards and categories, use "reload" to refresh it earlier.')
+@auth_decorator
+def shell(cache_ttl: int):
+    """ Interactive shell keeping the session warm """
+    if _in_session():
+        raise click.UsageError("Shells can not be nested")
+
+    def run_command(args: list):
+        _, _, error = _run_session_command(args, capture=False)
+        if error is not None:
+            click.echo(click.style("Error: {}".format(error), fg="red"), err=True)
+
+    previous_max_age = API_CLIENT.reference_data_max_age
+    API_CLIENT.reference_data_max_age = cache_ttl
+    try:
+        with _warm_session(1):
+            Shell(cli, run_command, on_reload=API_CLIENT.clear_reference_data).cmdloop()
+    finally:
+        API_CLIENT.reference_data_max_age = previous_max_age
+        API_CLIENT.clear_reference_data()
+
+
+@cli.command("agent")
+@click.option('--socket', 'socket_path', default=None, type=click.Path(dir_okay=False),
+              help='Socket to listen on (default: agent_socket config or {}).'.format(auth_agent.DEFAULT_SOCKET_PATH))
+@click.option('--refresh-margin', default=auth_agent.DEFAULT_REFRESH_MARGIN, type=click.FloatRange(min=0),
+              show_default=True, help='Seconds before the expiration of the token to refresh it.')
+@click.option('--status', default=False, is_flag=True, help='Show the status of a running agent.')
+@click.option('--stop', default=False, is_flag=True, help='Stop a running agent.')
+def agent(socket_path: str or None, refresh_margin: float, status: bool, stop: bool):
+    """ Run an agent providing tokens to all other commands """
+    socket_path = socket_path or API_CLIENT.config.AGENT_SOCKET.value
+    if status or stop:
+        client = auth_agent.AgentClient(socket_path)
+        try:
+            response = client.request(auth_agent.OP_STOP if stop else auth_agent.OP_STATUS)
+        except (ConnectionError, auth_agent.AgentError) as e:
+            raise click.ClickException(str(e))
+        finally:
+            client.close()
+        if status:
+            if _json_output():
+                _print_json(response)
+                return
+            expires_in = response.get("expires_in")
+            click.echo(tabulate([
+                ["PID", response.get("pid")],
+                ["Running since", _timestamp_ms_to_date(int(response["started"] * 1000))],
+                ["Authenticated", response.get("authenticated")],
+                ["Token expires in", format_duration(expires_in) if expires_in is not None else "-"],
+                ["Refreshes", response.get("refreshes")],
+            ]))
+        return
+
+    # the agent itself must not use the agent token store
+    config = API_CLIENT.config
+    store_type = config.TOKEN_STORE.value
+    token_store = create_token_store(None if store_type == TOKEN_STORE_AGENT else store_type,
+                                     config.LOGIN_DATA_STORE_PATH.value, config.TOKEN_STORE_URL.value)
+    server = auth_agent.Agent(api.Api(config, token_store=token_store), socket_path, refresh_margin)
+    try:
+        server.start()
+    except FileExistsError as e:
+        raise click.ClickException(str(e))
+
+    click.echo("Agent listening on {}, use it by setting N26_TOKEN_STORE={}{}".format(
+        server.socket_path, TOKEN_STORE_AGENT,
+        "" if socket_path is None else " and N26_AGENT_SOCKET={}".format(server.socket_path)), err=True)
+    try:
+        server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+@cli.command()
+@click.option('--count', default=5, type=click.IntRange(1), show_default=True,
+              help='Number of times to repeat the probes.')
+@click.option('--api-url', default=api.BASE_URL_DE, show_default=True,
+              help='Base url of the api, f.ex. of a local stand-in server.')
+@click.option('--path', default=doctor_module.DEFAULT_PATH, show_default=True,
+              help='Path of the authenticated request.')
+def doctor(count: int, api_url: str, path: str):
+    """ Diagnose connectivity and latency problems """
+    report = doctor_module.diagnose(API_CLIENT, count=count, api_url=api_url, path=path)
+
+    if _json_output():
+        _print_json(report.to_dict())
+        return
+
+    def duration(value: float or None) -> str:
+        if value is None:
+            return "-"
+        return format_duration(value) if value >= 0 else "-" + format_duration(-value)
+
+    click.echo(tabulate([[row["phase"], row["target"], row["count"], row["errors"], duration(row["min"]),
+                          duration(row["p50"]), duration(row["p99"])] for row in report.stats()],
+                        headers=["Phase", "Target", "Samples", "Errors", "Min", "p50", "p99"],
+                        colalign=("left", "left", "right", "right", "right", "right", "right")))
+    click.echo()
+
+    click.echo(tabulate([
+        ["Token", report.token_state],
+        ["Token expires in", duration(report.token_expires_in)],
+        ["Token expires in (server time)", duration(report.token_expires_in_server_time)],
+        ["Token refreshed", "yes" if report.token_refreshed else "no"],
+        ["Clock skew", "{:+.1f} s".format(report.clock_skew) if report.clock_skew is not None else "-"],
+    ]))
+
+    for (phase, target), messages in report.errors.items():
+        for message in sorted(set(messages)):
+            click.echo(click.style("{} {}: {} ({}x)".format(phase, target, message, messages.count(message)),
+                                   fg="red"), err=True)
+
+
+@cli.command()
+@click.argument('config_dir', type=click.Path(exists=True, file_okay=False))
+@click.argument('operation', type=click.Choice(list(fleet_module.OPERATIONS)))
+@click.option('--workers', default=4, type=click.IntRange(1, 64), show_default=True,
+              help='Number of accounts processed at the same time.')
+@click.option('--processes', default=False, is_flag=True,
+              help='Process every account in a separate process instead of a thread.')
+@click.option('--rate-limit', default=None, type=click.FloatRange(min=0, min_open=True),
+              help='Maximum number of requests per second of all accounts together.')
+@click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='Start time limit for transactions.')
+@click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='End time limit for transactions.')
+@click.option('--limit', default=None, type=click.IntRange(1, 10000), help='Limit transactions per account.')
+@click.option('--output-dir', default=None, type=click.Path(file_okay=False, writable=True),
+              help='Directory to download statements to, one subdirectory per account.')
+def fleet(config_dir: str, operation: str, workers: int, processes: bool, rate_limit: float or None,
+          param_from: datetime or None, param_to: datetime or None, limit: int or None, output_dir: str or None):
+    """ Run an operation for every account config in a directory """
+    if operation == fleet_module.OPERATION_STATEMENTS and output_dir is None:
+        raise click.UsageError("--output-dir is required to download statements")
+    configs = fleet_module.find_configs(config_dir)
+    if not configs:
+        raise click.ClickException("No config files found in {}".format(config_dir))
+
+    from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+    report = fleet_module.run_fleet(configs, operation, max_workers=workers, rate_limit=rate_limit,
+                                    processes=processes, from_time=from_timestamp, to_time=to_timestamp,
+                                    limit=limit, output_dir=output_dir)
+
+    if _json_output():
+        _print_json(report.to_dict())
+    else:
+        headers = ['Account', 'Status', 'Time', 'Result']
+        lines = []
+        for result in report.results:
+            if result.error is not None:
+                summary = click.style(result.error, fg="red")
+            elif isinstance(result.data, list):
+                summary = "{} entries".format(len(result.data))
+            else:
+                summary = "{availableBalance} {currency}".format(**result.data) \
+                    if "availableBalance" in result.data else ""
+            lines.append([result.account, result.status, format_duration(result.duration), summary])
+        click.echo(tabulate(lines, headers, colalign=("left", "left", "right", "left")))
+        click.echo("\n{} accounts in {}".format(len(report.results), format_duration(report.duration)))
+
+    if report.failed:
+        raise click.ClickException("{} of {} accounts failed".format(len(report.failed), len(report.results)))
+
 
 @cli.command()
 def logout():
     """ Logout """
-    cfg = Config()
-    login_data_file = cfg.LOGIN_DATA_STORE_PATH.value
-    if login_data_file is not None:
-        login_data_file = login_data_file.expanduser().resolve()
-        login_data_file.unlink(missing_ok=True)
+    API_CLIENT.token_store.clear()
 
 
 @cli.command()
@@ -78,7 +521,7 @@ def logout():
 def addresses():
     """ Show account addresses """
     addresses_data = API_CLIENT.get_addresses().get('data')
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(addresses_data)
         return
 
@@ -97,7 +540,7 @@ def addresses():
 def info():
     """ Get account information """
     account_info = API_CLIENT.get_account_info()
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(account_info)
         return
 
@@ -119,7 +562,7 @@ def info():
 def status():
     """ Get account statuses """
     account_statuses = API_CLIENT.get_account_statuses()
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(account_statuses)
         return
 
@@ -152,11 +595,83 @@ def status():
 
 
 @cli.command()
+@click.option('--transactions', 'transaction_limit', default=5, type=click.IntRange(0, 100),
+              help='Number of latest transactions to show.')
 @auth_decorator
-def balance():
+def overview(transaction_limit: int):
+    """ Show balance, spaces, cards, limits, status and latest transactions at once """
+    overview_data = API_CLIENT.get_overview(transaction_limit=transaction_limit)
+    if _json_output():
+        _print_json(overview_data)
+        return
+
+    sections = []
+
+    balance_data = overview_data.get(api.OVERVIEW_BALANCE)
+    if balance_data:
+        sections.append("Balance: {} {}".format(balance_data.get('availableBalance'), balance_data.get('currency')))
+
+    spaces_data = overview_data.get(api.OVERVIEW_SPACES)
+    if spaces_data:
+        keys = ['name', lambda x: "{} {}".format(x['balance']['availableBalance'], x['balance']['currency'])]
+        sections.append(_create_table_from_dict(['Space', 'Balance'], keys, spaces_data.get('spaces'),
+                                                colalign=['left', 'right']))
+
+    cards_data = overview_data.get(api.OVERVIEW_CARDS)
+    if cards_data:
+        keys = ['maskedPan', 'cardType',
+                lambda x: "active" if (x.get('status') == CARD_STATUS_ACTIVE) else x.get('status'),
+                _datetime_extractor('expirationDate', date_only=True)]
+        sections.append(_create_table_from_dict(['Card', 'Type', 'Status', 'Expires'], keys, cards_data))
+
+    limits_data = overview_data.get(api.OVERVIEW_LIMITS)
+    if limits_data:
+        sections.append(_create_table_from_dict(['Limit', 'Amount'], ['limit', 'amount'], limits_data,
+                                                numalign='right'))
+
+    statuses_data = overview_data.get(api.OVERVIEW_STATUSES)
+    if statuses_data:
+        lines = [
+            ["Account created:", _timestamp_ms_to_date(statuses_data.get('created'))],
+            ["Account closed:", statuses_data.get('accountClosed')],
+            ["Pairing State:", statuses_data.get('pairingState')],
+        ]
+        sections.append(tabulate(lines, [], tablefmt="plain", colalign=["right", "left"]))
+
+    transactions_data = overview_data.get(api.OVERVIEW_TRANSACTIONS)
+    if transactions_data:
+        keys = [_datetime_extractor('visibleTS'),
+                lambda x: "{} {}".format(x.get(AMOUNT), x.get(CURRENCY)),
+                lambda x: x.get('merchantName', x.get('partnerName', '')),
+                lambda x: _insert_newlines(x.get(REFERENCE_TEXT))]
+        sections.append(_create_table_from_dict(['Date', 'Amount', 'Partner', 'Message'], keys, transactions_data,
+                                                numalign='right'))
+
+    for name, error in overview_data.get(api.OVERVIEW_ERRORS, {}).items():
+        sections.append(click.style("Unable to retrieve {}: {}".format(name, error), fg="red"))
+
+    click.echo("\n\n".join(section.strip() for section in sections))
+
+
+@cli.command()
+@click.option('--history', default=False, is_flag=True,
+              help='Show the balance at the end of each day (default range: last year).')
+@click.option('--intraday', default=False, is_flag=True,
+              help='Show the balance after each transaction instead of each day, requires --history.')
+@click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='Start of the balance history.')
+@click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='End of the balance history.')
+@auth_decorator
+def balance(history: bool, intraday: bool, param_from: datetime or None, param_to: datetime or None):
     """ Show account balance """
+    if history or intraday:
+        from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+        _balance_history(from_timestamp, to_timestamp, intraday)
+        return
+
     balance_data = API_CLIENT.get_balance()
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(balance_data)
         return
 
@@ -165,6 +680,104 @@ def balance():
     click.echo("{} {}".format(amount, currency))
 
 
+def _balance_history(from_timestamp: int or None, to_timestamp: int or None, intraday: bool):
+    history_data = API_CLIENT.get_balance_history(from_time=from_timestamp, to_time=to_timestamp, intraday=intraday)
+    if _json_output():
+        _print_json(history_data)
+        return
+
+    if intraday:
+        headers = ['Time', 'Balance']
+        values = [_datetime_extractor('timestamp'), 'balance']
+    else:
+        headers = ['Date', 'Balance']
+        values = ['date', 'balance']
+    text = _create_table_from_dict(headers, values, history_data, numalign='right', floatfmt='.2f')
+    click.echo(text.strip())
+
+
+def _snapshot_store() -> SnapshotStore:
+    return SnapshotStore(API_CLIENT.config.SNAPSHOT_DIR.value)
+
+
+@cli.command()
+@auth_decorator
+def snapshot():
+    """ Record the current balances of the account and all spaces """
+    store = _snapshot_store()
+    count = store.record(API_CLIENT.get_balance(), API_CLIENT.get_spaces()["spaces"])
+    if _json_output():
+        _print_json({"recorded": count, "total": len(store)})
+        return
+    click.echo("Recorded {} balances, {} in total".format(count, len(store)))
+
+
+@cli.command()
+@click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='Start of the snapshot history.')
+@click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='End of the snapshot history.')
+@click.option('--resolution', default=None, type=click.Choice(list(RESOLUTIONS)),
+              help='Show only one balance per series and period.')
+@click.option('--aggregate', default=AGGREGATE_LAST, type=click.Choice(list(AGGREGATES)),
+              help='How to combine the balances of a period, requires --resolution.')
+def snapshots(param_from: datetime or None, param_to: datetime or None, resolution: str or None, aggregate: str):
+    """ Show recorded balance snapshots """
+    from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+    store = _snapshot_store()
+    if resolution is None:
+        snapshot_data = store.query(from_timestamp, to_timestamp)
+    else:
+        snapshot_data = store.downsample(RESOLUTIONS[resolution], from_timestamp, to_timestamp,
+                                         aggregate=aggregate)
+
+    names = {entry["id"]: entry["name"] or entry["id"] for entry in store.series()}
+    snapshot_data = [dict(item.to_dict(), name=names[item.series]) for item in snapshot_data]
+    if _json_output():
+        _print_json(snapshot_data)
+        return
+
+    headers = ['Time', 'Name', 'Balance']
+    values = [_datetime_extractor('timestamp'), 'name', 'balance']
+    text = _create_table_from_dict(headers, values, snapshot_data, numalign='right', floatfmt='.2f')
+    click.echo(text.strip())
+
+
+@cli.command()
+@click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='Start of the time range.')
+@click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='End of the time range.')
+@click.option('--endpoint', default=None, type=str, help='Only show responses of this endpoint, f.ex. /api/spaces.')
+def archive(param_from: datetime or None, param_to: datetime or None, endpoint: str or None):
+    """ Show archived api responses (see archive_dir) """
+    response_archive = API_CLIENT.archive
+    if response_archive is None:
+        raise click.UsageError("No archive_dir configured")
+
+    from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+    archive_data = []
+    for response in response_archive.query(from_timestamp, to_timestamp, endpoint):
+        data = response.parse()
+        archive_data.append({
+            "timestamp": response.timestamp,
+            "method": response.method.upper(),
+            "url": response.url,
+            "status": response.status,
+            "size": len(response.content),
+            # binary bodies like pdf statements are only listed
+            "data": None if isinstance(data, bytes) else data,
+        })
+    if _json_output():
+        _print_json(archive_data)
+        return
+
+    headers = ['Time', 'Method', 'Url', 'Status', 'Size']
+    values = [_datetime_extractor('timestamp'), 'method', 'url', 'status', lambda x: format_size(x['size'])]
+    text = _create_table_from_dict(headers, values, archive_data, numalign='right')
+    click.echo(text.strip())
+
+
 @cli.command()
 def browse():
     """ Browse on the web https://app.n26.com/ """
@@ -176,7 +789,7 @@ def browse():
 def spaces():
     """ Show spaces """
     spaces_data = API_CLIENT.get_spaces()["spaces"]
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(spaces_data)
         return
 
@@ -213,7 +826,7 @@ def spaces():
 def cards():
     """ Shows a list of cards """
     cards_data = API_CLIENT.get_cards()
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(cards_data)
         return
 
@@ -234,7 +847,8 @@ def cards():
 
 
 @cli.command()
-@click.option('--card', default=None, type=str, help='ID of the card to block. Omitting this will block all cards.')
+@click.option('--card', default=None, type=str, shell_complete=_complete(completion.SOURCE_CARDS),
+              help='ID of the card to block. Omitting this will block all cards.')
 @auth_decorator
 def card_block(card: str):
     """ Blocks the card/s """
@@ -249,7 +863,8 @@ def card_block(card: str):
 
 
 @cli.command()
-@click.option('--card', default=None, type=str, help='ID of the card to unblock. Omitting this will unblock all cards.')
+@click.option('--card', default=None, type=str, shell_complete=_complete(completion.SOURCE_CARDS),
+              help='ID of the card to unblock. Omitting this will unblock all cards.')
 @auth_decorator
 def card_unblock(card: str):
     """ Unblocks the card/s """
@@ -283,7 +898,7 @@ def set_limits(withdrawal: int, payment: int):
 def _limits():
     limits_data = API_CLIENT.get_account_limits()
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(limits_data)
         return
 
@@ -300,7 +915,7 @@ def contacts():
     """ Show your n26 contacts """
     contacts_data = API_CLIENT.get_contacts()
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(contacts_data)
         return
 
@@ -312,7 +927,7 @@ def contacts():
 
 
 @cli.command()
-@click.option('--id', default=None, type=str,
+@click.option('--id', default=None, type=str, shell_complete=_complete(completion.SOURCE_STATEMENTS),
               help='Id of a single statement')
 @click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
               help='Start time limit for statements.')
@@ -336,7 +951,7 @@ def statements(id: str or None, param_from: datetime or None, param_to: datetime
     if statements_filter:
         statements_data = list(filter(statements_filter, statements_data))
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(statements_data)
         return
 
@@ -363,7 +978,7 @@ def statements(id: str or None, param_from: datetime or None, param_to: datetime
 
 
 @cli.command()
-@click.option('--categories', default=None, type=str,
+@click.option('--categories', default=None, type=str, shell_complete=_complete(completion.SOURCE_CATEGORIES, ","),
               help='Comma separated list of category IDs.')
 @click.option('--pending', default=None, type=bool,
               help='Whether to show only pending transactions.')
@@ -373,11 +988,12 @@ def statements(id: str or None, param_from: datetime or None, param_to: datetime
               help='End time limit for transactions.')
 @click.option('--text-filter', default=None, type=str, help='Text filter.')
 @click.option('--limit', default=None, type=click.IntRange(1, 10000), help='Limit transaction output.')
+@click.option('--enrich', default=False, is_flag=True, help='Show category names and contacts.')
 @auth_decorator
 def transactions(categories: str, pending: bool, param_from: datetime or None, param_to: datetime or None,
-                 text_filter: str, limit: int):
+                 text_filter: str, limit: int, enrich: bool):
     """ Show transactions (default: 5) """
-    if not JSON_OUTPUT and not pending and not param_from and not limit:
+    if not _json_output() and not pending and not param_from and not limit:
         limit = 5
         click.echo(click.style("Output is limited to {} entries.".format(limit), fg="yellow"))
 
@@ -386,22 +1002,23 @@ def transactions(categories: str, pending: bool, param_from: datetime or None, p
                                                     limit=limit, pending=pending, text_filter=text_filter,
                                                     categories=categories)
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(transactions_data)
         return
 
     lines = []
-    for i, transaction in enumerate(transactions_data):
+    for i, transaction in enumerate(_enricher(enrich).enrich_transactions(transactions_data)):
         amount = transaction.get(AMOUNT, 0)
         currency = transaction.get(CURRENCY, None)
 
         if amount < 0:
             sender_name = "You"
             sender_iban = ""
-            recipient_name = transaction.get('merchantName', transaction.get('partnerName', ''))
+            recipient_name = transaction.get(CONTACT_NAME,
+                                             transaction.get('merchantName', transaction.get('partnerName', '')))
             recipient_iban = transaction.get('partnerIban', '')
         else:
-            sender_name = transaction.get('partnerName', '')
+            sender_name = transaction.get(CONTACT_NAME, transaction.get('partnerName', ''))
             sender_iban = transaction.get('partnerIban', '')
             recipient_name = "You"
             recipient_iban = ""
@@ -413,28 +1030,61 @@ def transactions(categories: str, pending: bool, param_from: datetime or None, p
         else:
             message = transaction.get(REFERENCE_TEXT)
 
-        lines.append([
+        line = [
             _datetime_extractor('visibleTS')(transaction),
             "{} {}".format(amount, currency),
             "{}\n{}".format(sender_name, sender_iban),
             "{}\n{}".format(recipient_name, recipient_iban),
             _insert_newlines(message),
             recurring
-        ])
+        ]
+        if enrich:
+            line.insert(4, transaction.get(CATEGORY_NAME, ''))
+        lines.append(line)
 
     headers = ['Date', 'Amount', 'From', 'To', 'Message', 'Recurring']
+    if enrich:
+        headers.insert(4, 'Category')
     text = tabulate(lines, headers, numalign='right')
 
     click.echo(text.strip())
 
 
+def _validated(validate: callable) -> callable:
+    """
+    :param validate: function validating a prompted value, raising a ValueError if it is invalid
+    :return: value_proc for click.prompt() asking again for invalid values
+    """
+
+    def value_proc(value: str):
+        try:
+            return validate(value)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+
+    return value_proc
+
+
 @cli.command("transaction")
 @auth_decorator
 def transaction():
     """Create a bank transfer"""
-    # Get all the necessary transfer information from user's input
-    iban = click.prompt("Recipient's IBAN (spaces are allowed): ", type=str)
-    bic = click.prompt("Recipient's BIC (optional): ", type=str, default="", show_default=False)
+    bank_index = API_CLIENT.bank_index
+    if bank_index is not None:
+        try:
+            # a broken index is a configuration problem, no input can fix it
+            bank_index.open()
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+    # Get all the necessary transfer information from user's input,
+    # invalid IBANs and BICs are asked for again before the (slow) PIN encryption
+    iban = click.prompt("Recipient's IBAN (spaces are allowed): ", type=str, value_proc=_validated(validate_iban))
+    # a missing BIC is derived from the IBAN if a bank index is configured
+    iban, bic = click.prompt("Recipient's BIC (optional): ", type=str, default="", show_default=False,
+                             value_proc=_validated(lambda bic_value: validate_transfer(iban, bic_value, bank_index)))
+    if bic:
+        click.echo("Using BIC {}".format(bic))
     name = click.prompt("Recipient's name: ", type=str)
     reference = click.prompt("Transfer reference (optional): ", type=str, default="", show_default=False)
     amount = click.prompt("Transfer amount (only numeric value, dot separated): ", type=str)
@@ -442,17 +1092,30 @@ def transaction():
 
     response = API_CLIENT.create_transaction(iban, bic, name, reference, amount, pin)
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(response)
 
 
 @cli.command("standing-orders")
+@click.option('--reconcile', 'reconcile_orders', default=False, is_flag=True,
+              help='Match standing orders with executed transactions to find missed or late executions.')
+@click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='Start of the history to reconcile (default: one year ago).')
+@click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
+              help='End of the history to reconcile (default: now).')
+@click.option('--horizon', default=30, type=click.IntRange(0), show_default=True,
+              help='Number of days to project upcoming executions for when reconciling.')
 @auth_decorator
-def standing_orders():
+def standing_orders(reconcile_orders: bool, param_from: datetime or None, param_to: datetime or None, horizon: int):
     """Show your standing orders"""
+    if reconcile_orders:
+        from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+        _reconcile_standing_orders(from_timestamp, to_timestamp, horizon)
+        return
+
     standing_orders_data = API_CLIENT.get_standing_orders()
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(standing_orders_data)
         return
 
@@ -479,19 +1142,79 @@ def standing_orders():
     click.echo(text.strip())
 
 
+def _reconcile_standing_orders(from_timestamp: int or None, to_timestamp: int or None, horizon: int):
+    reconciliations = API_CLIENT.reconcile_standing_orders(from_time=from_timestamp, to_time=to_timestamp)
+    now = int(time.time() * 1000)
+    upcoming = project_outflows([r.standing_order for r in reconciliations if r.standing_order.get('nextExecutingTS')],
+                                now, now + horizon * 24 * 60 * 60 * 1000)
+
+    if _json_output():
+        _print_json({
+            'standingOrders': [{
+                'id': r.standing_order.get('id'),
+                'partnerName': r.standing_order.get('partnerName'),
+                'amount': r.standing_order.get('amount'),
+                'executions': [{
+                    'expectedTS': execution.expected_ts,
+                    'status': execution.status,
+                    'transactionId': None if execution.transaction is None else execution.transaction.get('id'),
+                    'visibleTS': None if execution.transaction is None else execution.transaction.get('visibleTS'),
+                } for execution in r.executions],
+            } for r in reconciliations],
+            'upcoming': [{
+                'executionTS': timestamp,
+                'id': standing_order.get('id'),
+                'partnerName': standing_order.get('partnerName'),
+                'amount': standing_order.get('amount'),
+            } for timestamp, standing_order in upcoming],
+        })
+        return
+
+    def dates(executions: list) -> str:
+        return ", ".join(_timestamp_ms_to_date(execution.expected_ts).strftime('%x') for execution in executions)
+
+    headers = ['To', 'Amount', 'Frequency', 'On time', 'Late', 'Missed', 'Last execution']
+    values = [lambda r: r.standing_order.get('partnerName'),
+              lambda r: r.standing_order.get('amount'),
+              lambda r: r.standing_order.get('executionFrequency'),
+              lambda r: len(r.on_time),
+              lambda r: dates(r.late),
+              lambda r: dates(r.missed),
+              lambda r: None if r.last_execution is None else _timestamp_ms_to_date(
+                  r.last_execution.get('visibleTS')).strftime('%x')]
+    text = _create_table_from_dict(headers, values, reconciliations, numalign='right')
+
+    text += "\n\nUpcoming executions (next {} days):\n".format(horizon)
+    headers = ['Date', 'To', 'Amount']
+    values = [lambda x: _timestamp_ms_to_date(x[0]).strftime('%x'),
+              lambda x: x[1].get('partnerName'),
+              lambda x: x[1].get('amount')]
+    text += _create_table_from_dict(headers, values, upcoming, numalign='right', floatfmt='.2f')
+    text += "\nTotal: {:.2f}".format(sum(standing_order.get('amount') or 0 for _, standing_order in upcoming))
+
+    click.echo(text.strip())
+
+
 @cli.command()
 @click.option('--from', 'param_from', default=None, type=click.DateTime(DATETIME_FORMATS),
               help='Start time limit for statistics.')
 @click.option('--to', 'param_to', default=None, type=click.DateTime(DATETIME_FORMATS),
               help='End time limit for statistics.')
+@click.option('--by', 'period', default=None, type=click.Choice(PERIODS),
+              help='Show statistics for each week, month or year (default range: last year).')
+@click.option('--enrich', default=False, is_flag=True, help='Show category names.')
 @auth_decorator
-def statistics(param_from: datetime or None, param_to: datetime or None):
+def statistics(param_from: datetime or None, param_to: datetime or None, period: str or None, enrich: bool):
     """Show your n26 statistics"""
 
     from_timestamp, to_timestamp = _parse_from_to_timestamps(param_from, param_to)
+    if period:
+        _statistics_by_period(from_timestamp, to_timestamp, period)
+        return
+
     statistics_data = API_CLIENT.get_statistics(from_time=from_timestamp, to_time=to_timestamp)
 
-    if JSON_OUTPUT:
+    if _json_output():
         _print_json(statistics_data)
         return
 
@@ -508,19 +1231,52 @@ def statistics(param_from: datetime or None, param_to: datetime or None):
     text += "\n\n"
 
     headers = ['Category', 'Income', 'Expense', 'Total']
-    keys = ['id', 'income', 'expense', 'total']
-    text += _create_table_from_dict(headers, keys, statistics_data["items"], numalign='right')
+    keys = [CATEGORY_NAME, 'income', 'expense', 'total']
+    items = _enricher(enrich).enrich_statistics(statistics_data)["items"]
+    text += _create_table_from_dict(headers, keys, items, numalign='right')
+
+    click.echo(text.strip())
+
+
+def _statistics_by_period(from_timestamp: int or None, to_timestamp: int or None, period: str):
+    statistics_data = API_CLIENT.get_statistics_by_period(from_time=from_timestamp, to_time=to_timestamp,
+                                                          period=period)
+
+    if _json_output():
+        _print_json(statistics_data)
+        return
+
+    headers = ['From', 'To', 'Income', 'Expense', 'Total']
+    values = [_datetime_extractor('from', date_only=True), _datetime_extractor('to', date_only=True),
+              lambda x: round(x.get('totalIncome', 0), 2),
+              lambda x: round(x.get('totalExpense', 0), 2),
+              lambda x: round(x.get('total', 0), 2)]
+    text = _create_table_from_dict(headers, values, statistics_data, numalign='right', floatfmt='.2f')
 
     click.echo(text.strip())
 
 
+def _enricher(enrich: bool) -> Enricher:
+    """
+    :param enrich: whether to retrieve categories and contacts (two additional requests unless they are cached)
+    :return: an enricher for category names and contacts, an empty one if they aren't requested or can't be retrieved
+    """
+    if not enrich:
+        return Enricher()
+    try:
+        return API_CLIENT.get_enricher()
+    except RequestException as e:
+        # enrichment is cosmetic, never fail a command because of it
+        LOGGER.warning("Unable to retrieve categories and contacts: {}".format(e))
+        return Enricher()
+
+
 def _print_json(data: dict or list):
     """
     Pretty-Prints the given object to the  console
     :param data: data to print
     """
-    import json
-    json_data = json.dumps(data, indent=2)
+    json_data = codec.dumps(data, indent=2)
     click.echo(json_data)
 
 
@@ -0,0 +1,221 @@
+"""
+Pluggable JSON codec used for decoding api responses and encoding cli output.
+
+The fastest installed backend is selected automatically (orjson, ujson, simdjson),
+falling back to the json module of the standard library.
+A backend can be forced using the N26_JSON_BACKEND environment variable or set_backend().
+"""
+import json
+import logging
+import math
+import os
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+ENV_JSON_BACKEND = "N26_JSON_BACKEND"
+
+BACKEND_ORJSON = "orjson"
+BACKEND_SIMDJSON = "simdjson"
+BACKEND_UJSON = "ujson"
+BACKEND_STDLIB = "json"
+
+# preferred order when selecting a backend automatically
+BACKEND_PRIORITY = [BACKEND_ORJSON, BACKEND_UJSON, BACKEND_SIMDJSON, BACKEND_STDLIB]
+
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+
+def _escape_non_ascii(text: str) -> str:
+    """
+    Escapes all non-ascii characters the same way json.dumps(ensure_ascii=True) does.
+    Non-ascii characters can only occur within json strings so this is safe to apply to a whole document.
+    """
+
+    def escape(match) -> str:
+        code_point = ord(match.group(0))
+        if code_point > 0xFFFF:
+            code_point -= 0x10000
+            return '\\u{:04x}\\u{:04x}'.format(0xD800 | (code_point >> 10), 0xDC00 | (code_point & 0x3FF))
+        return '\\u{:04x}'.format(code_point)
+
+    return _NON_ASCII.sub(escape, text)
+
+
+def _has_special_floats(data) -> bool:
+    """
+    :return: whether the data contains floats the fast backends format differently than the standard library,
+             i.e. NaN, Infinity and floats in exponent notation
+    """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value) or "e" in repr(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class Backend(object):
+    """
+    A JSON backend consisting of a loads and a dumps function
+    """
+
+    def __init__(self, name: str, loads: callable, dumps: callable):
+        """
+        :param name: name of the backend
+        :param loads: function parsing str or bytes into python objects
+        :param dumps: function with the signature (data, indent, ensure_ascii) -> str
+        """
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return "Backend({})".format(self.name)
+
+
+def _stdlib_dumps(data, indent: int = None, ensure_ascii: bool = True) -> str:
+    return json.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
+
+
+def _create_stdlib_backend() -> Backend:
+    return Backend(BACKEND_STDLIB, json.loads, _stdlib_dumps)
+
+
+def _create_orjson_backend() -> Backend:
+    import orjson
+
+    def dumps(data, indent: int = None, ensure_ascii: bool = True) -> str:
+        if indent != 2 or _has_special_floats(data):
+            # orjson only supports an indentation of 2 spaces and
+            # uses different separators than the standard library for compact output
+            return _stdlib_dumps(data, indent, ensure_ascii)
+        try:
+            text = orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            # f.ex. integers exceeding 64 bit or non-str dict keys
+            return _stdlib_dumps(data, indent, ensure_ascii)
+        return _escape_non_ascii(text) if ensure_ascii and not text.isascii() else text
+
+    return Backend(BACKEND_ORJSON, orjson.loads, dumps)
+
+
+def _create_simdjson_backend() -> Backend:
+    import simdjson
+
+    # simdjson is a decoder only, simdjson.loads() uses a new parser
+    # for every call which is required for thread safety
+    return Backend(BACKEND_SIMDJSON, simdjson.loads, _stdlib_dumps)
+
+
+def _create_ujson_backend() -> Backend:
+    import ujson
+
+    def dumps(data, indent: int = None, ensure_ascii: bool = True) -> str:
+        if indent is None or _has_special_floats(data):
+            # match the separators and float formatting of the standard library
+            return _stdlib_dumps(data, indent, ensure_ascii)
+        try:
+            return ujson.dumps(data, indent=indent, ensure_ascii=ensure_ascii, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(data, indent, ensure_ascii)
+
+    return Backend(BACKEND_UJSON, ujson.loads, dumps)
+
+
+_BACKEND_FACTORIES = {
+    BACKEND_ORJSON: _create_orjson_backend,
+    BACKEND_UJSON: _create_ujson_backend,
+    BACKEND_SIMDJSON: _create_simdjson_backend,
+    BACKEND_STDLIB: _create_stdlib_backend,
+}
+
+
+def create_backend(name: str) -> Backend:
+    """
+    Creates the backend with the given name
+
+    :param name: name of the backend
+    :return: the backend
+    :raises ValueError: if the backend is unknown
+    :raises ImportError: if the backend is not installed
+    """
+    factory = _BACKEND_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError("Unknown JSON backend: {}".format(name))
+    return factory()
+
+
+def available_backends() -> list:
+    """
+    :return: names of all installed backends in order of preference
+    """
+    result = []
+    for name in BACKEND_PRIORITY:
+        try:
+            create_backend(name)
+            result.append(name)
+        except ImportError:
+            pass
+    return result
+
+
+def _select_backend() -> Backend:
+    name = os.environ.get(ENV_JSON_BACKEND)
+    if name:
+        return create_backend(name)
+
+    for name in BACKEND_PRIORITY:
+        try:
+            return create_backend(name)
+        except ImportError:
+            continue
+
+
+_backend = _select_backend()
+LOGGER.debug("Using JSON backend: {}".format(_backend.name))
+
+
+def get_backend() -> Backend:
+    """
+    :return: the currently active backend
+    """
+    return _backend
+
+
+def set_backend(backend: str or Backend):
+    """
+    Sets the backend to use for all subsequent calls
+
+    :param backend: name of a built-in backend or a custom Backend instance
+    """
+    global _backend
+    _backend = backend if isinstance(backend, Backend) else create_backend(backend)
+
+
+def loads(data: str or bytes):
+    """
+    Parses a JSON document
+
+    :param data: the document as str or (utf-8 encoded) bytes
+    :return: the parsed object
+    """
+    return _backend.loads(data)
+
+
+def dumps(data, indent: int = None, ensure_ascii: bool = True) -> str:
+    """
+    Serializes an object to a JSON document.
+    Output is formatted like json.dumps() of the standard library with the same arguments.
+
+    :param data: the object to serialize
+    :param indent: number of spaces to indent nested structures with
+    :param ensure_ascii: escape non-ascii characters
+    :return: the JSON document
+    """
+    return _backend.dumps(data, indent=indent, ensure_ascii=ensure_ascii)
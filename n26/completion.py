@@ -0,0 +1,138 @@
+"""
+Shell completion of card ids, statement ids and categories.
+
+Completing must be fast and must never ask for a login approval, so candidates are always read from an
+on-disk cache (CACHE_DIR or ~/.cache/n26/). If the cached candidates are missing or older than
+completion_cache_ttl, a detached process refreshes them in the background (only if a login can be refreshed
+without user interaction) while the current completion is answered with what is there.
+"""
+import logging
+import os
+import subprocess
+import sys
+
+from click.shell_completion import CompletionItem
+from requests import HTTPError
+
+from n26.api import Api
+from n26.cache import FileCache
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "~/.cache/n26/"
+
+SOURCE_CARDS = "cards"
+SOURCE_STATEMENTS = "statements"
+SOURCE_CATEGORIES = "categories"
+
+# minimum seconds between two background refreshes of the same candidates
+REFRESH_INTERVAL = 60
+
+
+def _cards(api: Api) -> list:
+    return [[card["id"], "{} {}".format(card.get("cardType"), card.get("maskedPan"))] for card in api.get_cards()]
+
+
+def _statements(api: Api) -> list:
+    return [[statement["id"], "{:02d}/{}".format(statement["month"], statement["year"])]
+            for statement in api.get_statements()]
+
+
+def _categories(api: Api) -> list:
+    return [[category["id"], category.get("name")] for category in api.get_available_categories()]
+
+
+# functions returning the candidates as [value, help] pairs
+SOURCES = {
+    SOURCE_CARDS: _cards,
+    SOURCE_STATEMENTS: _statements,
+    SOURCE_CATEGORIES: _categories,
+}
+
+
+class CompletionCache(object):
+    """
+    Cached completion candidates of an account
+    """
+
+    def __init__(self, api: Api):
+        """
+        :param api: the client of the account
+        """
+        self.api = api
+        self.cache = FileCache(api.config.CACHE_DIR.value or DEFAULT_CACHE_DIR)
+        self.ttl = api.config.COMPLETION_CACHE_TTL.value
+
+    def _key(self, source: str) -> str:
+        return "completion/{}/{}".format(self.api.config.USERNAME.value, source)
+
+    def candidates(self, source: str) -> list:
+        """
+        :param source: one of the SOURCE_* names
+        :return: the cached candidates as [value, help] pairs, a refresh is started if they are stale
+        """
+        key = self._key(source)
+        age = self.cache.age(key)
+        if age is None or age > self.ttl:
+            self._schedule_refresh(source)
+        return self.cache.get(key) or []
+
+    def _schedule_refresh(self, source: str):
+        marker = self._key(source) + "/refresh"
+        age = self.cache.age(marker)
+        if age is not None and age < REFRESH_INTERVAL:
+            # a refresh has been started recently, it is either running or has failed
+            return
+        self.cache.set(marker, os.getpid())
+
+        LOGGER.debug("Refreshing {} completions in the background".format(source))
+        subprocess.Popen([sys.executable, "-m", __name__, source], stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def refresh(self, source: str) -> bool:
+        """
+        Fetches the candidates, if possible without user interaction
+
+        :param source: one of the SOURCE_* names
+        :return: True if the candidates have been updated
+        """
+        if not self.api.is_authenticated():
+            try:
+                self.api.refresh_authentication()
+            except (AssertionError, HTTPError, PermissionError) as e:
+                # a new login requires an approval nobody is there to give
+                LOGGER.debug("Not refreshing {} completions without a login: {}".format(source, e))
+                return False
+
+        self.cache.set(self._key(source), SOURCES[source](self.api))
+        return True
+
+
+def complete(api: Api, source: str, incomplete: str, separator: str = None) -> list:
+    """
+    :param api: the client of the account
+    :param source: one of the SOURCE_* names
+    :param incomplete: the value typed so far
+    :param separator: separator of options accepting a list of values, only the last one is completed
+    :return: list of click CompletionItem
+    """
+    prefix = ""
+    if separator is not None and separator in incomplete:
+        prefix, incomplete = incomplete.rsplit(separator, 1)
+        prefix += separator
+
+    try:
+        candidates = CompletionCache(api).candidates(source)
+    except Exception as e:
+        # completion must never fail loudly
+        LOGGER.debug("Unable to complete {}: {}".format(source, e))
+        return []
+    return [CompletionItem(prefix + value, help=help_text) for value, help_text in candidates
+            if value.startswith(incomplete)]
+
+
+if __name__ == '__main__':
+    try:
+        CompletionCache(Api()).refresh(sys.argv[1])
+    except Exception as e:
+        LOGGER.debug("Refreshing {} completions failed: {}".format(sys.argv[1], e))
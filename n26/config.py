@@ -1,5 +1,7 @@
 from container_app_conf import ConfigBase
-from container_app_conf.entry.file import FileConfigEntry
+from container_app_conf.entry.file import FileConfigEntry, DirectoryConfigEntry
+from container_app_conf.entry.float import FloatConfigEntry
+from container_app_conf.entry.int import IntConfigEntry
 from container_app_conf.entry.string import StringConfigEntry
 from container_app_conf.source.env_source import EnvSource
 from container_app_conf.source.toml_source import TomlSource
@@ -10,6 +12,15 @@ NODE_ROOT = "n26"
 MFA_TYPE_APP = "app"
 MFA_TYPE_SMS = "sms"
 
+TOKEN_STORE_MEMORY = "memory"
+TOKEN_STORE_FILE = "file"
+TOKEN_STORE_SQLITE = "sqlite"
+TOKEN_STORE_REDIS = "redis"
+TOKEN_STORE_AGENT = "agent"
+
+ARCHIVE_COMPRESSION_GZIP = "gzip"
+ARCHIVE_COMPRESSION_ZSTD = "zstd"
+
 
 class Config(ConfigBase):
 
@@ -80,6 +91,45 @@ class Config(ConfigBase):
         default=None
     )
 
+    TOKEN_STORE = StringConfigEntry(
+        description="Backend to store login data in. "
+                    "'file' and 'sqlite' use the login_data_store_path, 'redis' uses the token_store_url, "
+                    "'agent' obtains tokens from the 'n26 agent' listening on the agent_socket. "
+                    "If not set, 'file' is used if a login_data_store_path is configured and 'memory' otherwise.",
+        example=TOKEN_STORE_FILE,
+        key_path=[
+            NODE_ROOT,
+            "token_store"
+        ],
+        regex="^({})$".format("|".join([TOKEN_STORE_MEMORY, TOKEN_STORE_FILE, TOKEN_STORE_SQLITE, TOKEN_STORE_REDIS,
+                                         TOKEN_STORE_AGENT])),
+        required=False,
+        default=None
+    )
+
+    TOKEN_STORE_URL = StringConfigEntry(
+        description="Url of the redis server used by the 'redis' token store, "
+                    "f.ex. redis://localhost:6379/0 or unix:///run/redis/redis.sock",
+        example="redis://localhost:6379/0",
+        key_path=[
+            NODE_ROOT,
+            "token_store_url"
+        ],
+        required=False,
+        default=None
+    )
+
+    AGENT_SOCKET = FileConfigEntry(
+        description="Unix domain socket of the 'n26 agent', defaults to ~/.config/n26/agent.sock",
+        example="~/.config/n26/agent.sock",
+        key_path=[
+            NODE_ROOT,
+            "agent_socket"
+        ],
+        required=False,
+        default=None
+    )
+
     MFA_TYPE = StringConfigEntry(
         description="Multi-Factor-Authentication type to use",
         example=MFA_TYPE_APP,
@@ -90,3 +140,154 @@ class Config(ConfigBase):
         regex="^({})$".format("|".join([MFA_TYPE_APP, MFA_TYPE_SMS])),
         default=MFA_TYPE_APP
     )
+
+    MFA_POLL_INTERVAL = FloatConfigEntry(
+        description="Seconds to wait before checking if the login has been approved in the app for the first time, "
+                    "the interval grows by mfa_poll_backoff with every check",
+        example=0.5,
+        key_path=[
+            NODE_ROOT,
+            "mfa_poll_interval"
+        ],
+        default=0.5
+    )
+
+    MFA_POLL_MAX_INTERVAL = FloatConfigEntry(
+        description="Maximum seconds between checks if the login has been approved in the app",
+        example=5.0,
+        key_path=[
+            NODE_ROOT,
+            "mfa_poll_max_interval"
+        ],
+        default=5.0
+    )
+
+    MFA_POLL_BACKOFF = FloatConfigEntry(
+        description="Factor the interval between checks if the login has been approved in the app grows by",
+        example=1.5,
+        key_path=[
+            NODE_ROOT,
+            "mfa_poll_backoff"
+        ],
+        default=1.5
+    )
+
+    MFA_TIMEOUT = FloatConfigEntry(
+        description="Seconds to wait for the approval of a login before giving up",
+        example=60.0,
+        key_path=[
+            NODE_ROOT,
+            "mfa_timeout"
+        ],
+        default=60.0
+    )
+
+    HTTP_CONNECT_TIMEOUT = FloatConfigEntry(
+        description="Seconds to wait for a connection to the N26 servers",
+        example=5.0,
+        key_path=[
+            NODE_ROOT,
+            "http_connect_timeout"
+        ],
+        default=5.0
+    )
+
+    HTTP_READ_TIMEOUT = FloatConfigEntry(
+        description="Seconds to wait for the N26 servers to send data",
+        example=30.0,
+        key_path=[
+            NODE_ROOT,
+            "http_read_timeout"
+        ],
+        default=30.0
+    )
+
+    CIRCUIT_BREAKER_THRESHOLD = IntConfigEntry(
+        description="Consecutive failed requests (connection errors, timeouts and server errors) to a group "
+                    "of endpoints after which all further requests to it fail fast. 0 disables the circuit breaker.",
+        example=5,
+        key_path=[
+            NODE_ROOT,
+            "circuit_breaker_threshold"
+        ],
+        default=5
+    )
+
+    CIRCUIT_BREAKER_RESET_TIMEOUT = FloatConfigEntry(
+        description="Seconds until a request is let through an open circuit to check if the servers have recovered",
+        example=30.0,
+        key_path=[
+            NODE_ROOT,
+            "circuit_breaker_reset_timeout"
+        ],
+        default=30.0
+    )
+
+    SNAPSHOT_DIR = DirectoryConfigEntry(
+        description="Directory to store the balance snapshots recorded by 'n26 snapshot' in, "
+                    "defaults to ~/.config/n26/snapshots/",
+        example="~/.config/n26/snapshots/",
+        key_path=[
+            NODE_ROOT,
+            "snapshot_dir"
+        ],
+        required=False,
+        default=None
+    )
+
+    ARCHIVE_DIR = DirectoryConfigEntry(
+        description="Directory to archive all raw api responses in (compressed), f.ex. for audits. "
+                    "If not set, responses are not archived.",
+        example="~/.local/share/n26/archive/",
+        key_path=[
+            NODE_ROOT,
+            "archive_dir"
+        ],
+        required=False,
+        default=None
+    )
+
+    ARCHIVE_COMPRESSION = StringConfigEntry(
+        description="Compression of archived responses, zstd requires the zstandard package",
+        example=ARCHIVE_COMPRESSION_GZIP,
+        key_path=[
+            NODE_ROOT,
+            "archive_compression"
+        ],
+        regex="^({})$".format("|".join([ARCHIVE_COMPRESSION_GZIP, ARCHIVE_COMPRESSION_ZSTD])),
+        default=ARCHIVE_COMPRESSION_GZIP
+    )
+
+    COMPLETION_CACHE_TTL = FloatConfigEntry(
+        description="Seconds until cached shell completions of card ids, statement ids and categories "
+                    "are refreshed in the background",
+        example=3600.0,
+        key_path=[
+            NODE_ROOT,
+            "completion_cache_ttl"
+        ],
+        default=3600.0
+    )
+
+    BANK_INDEX_PATH = FileConfigEntry(
+        description="Bank index (see n26.iban.build_bank_index) used to derive and verify the BIC of transfers",
+        example="~/.config/n26/bank_codes.idx",
+        key_path=[
+            NODE_ROOT,
+            "bank_index_path"
+        ],
+        required=False,
+        default=None
+    )
+
+    CACHE_DIR = DirectoryConfigEntry(
+        description="Directory to cache api results in that don't change anymore, f.ex. statistics of past periods. "
+                    "If not set, results are only cached in memory.",
+        example="~/.cache/n26/",
+        key_path=[
+            NODE_ROOT,
+            "cache_dir"
+        ],
+        required=False,
+        default=None
+    )
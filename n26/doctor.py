@@ -0,0 +1,251 @@
+"""
+Connectivity and latency diagnostics.
+
+diagnose() repeats a sequence of probes against the authentication server and the api to find out where
+time is spent: resolving the host name (dns), connecting (tcp), the tls handshake (tls), reading and
+validating the token from the token store (token) and a cheap authenticated request (request).
+The token is reported as it was before probing. A new login is never started, an expired token is refreshed once
+and the refresh is reported as its own phase against the authentication server (refresh).
+"""
+import email.utils
+import logging
+import math
+import socket
+import ssl
+import time
+from urllib.parse import urlparse
+
+from requests import RequestException
+
+from n26.api import Api, BASE_URL_DE, ACCESS_TOKEN_KEY, EXPIRATION_TIME_KEY
+from n26.resilience import request_timeout
+from n26.transport import GET
+
+LOGGER = logging.getLogger(__name__)
+
+PHASE_DNS = "dns"
+PHASE_TCP = "tcp"
+PHASE_TLS = "tls"
+PHASE_TOKEN = "token"
+PHASE_REFRESH = "refresh"
+PHASE_REQUEST = "request"
+
+TOKEN_STATE_MISSING = "missing"
+TOKEN_STATE_VALID = "valid"
+TOKEN_STATE_EXPIRED = "expired"
+
+# a cheap endpoint requiring authentication
+DEFAULT_PATH = "/api/me"
+# timeout of the connection probes if none is configured
+DEFAULT_TIMEOUT = 10.0
+
+
+def percentile(values: list, percent: float) -> float or None:
+    """
+    :param values: the samples
+    :param percent: the percentile to calculate (0-100)
+    :return: the nearest-rank percentile of the samples, None if there are none
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def probe_connection(url: str, timeout: float = DEFAULT_TIMEOUT) -> list:
+    """
+    Opens (and closes) a connection to the host of a url, measuring each step
+
+    :param url: the url of the server
+    :param timeout: timeout of each step in seconds
+    :return: list of (phase, duration in seconds) tuples, there is no tls phase for http urls
+    :raises OSError: if a step fails, the exception has a "phase" attribute
+    """
+    parsed = urlparse(url)
+    secure = parsed.scheme == "https"
+    port = parsed.port or (443 if secure else 80)
+    durations = []
+
+    def step(phase: str, function: callable):
+        start = time.perf_counter()
+        try:
+            result = function()
+        except OSError as e:
+            e.phase = phase
+            raise
+        durations.append((phase, time.perf_counter() - start))
+        return result
+
+    family, kind, proto, _, address = step(
+        PHASE_DNS, lambda: socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)[0])
+    sock = socket.socket(family, kind, proto)
+    try:
+        sock.settimeout(timeout)
+        step(PHASE_TCP, lambda: sock.connect(address))
+        if secure:
+            context = ssl.create_default_context()
+            sock = step(PHASE_TLS, lambda: context.wrap_socket(sock, server_hostname=parsed.hostname))
+    finally:
+        sock.close()
+    return durations
+
+
+class Report(object):
+    """
+    Results of diagnose()
+    """
+
+    def __init__(self):
+        # (phase, target) -> list of durations in seconds
+        self.samples = {}
+        # (phase, target) -> list of error messages
+        self.errors = {}
+        # state of the token before probing
+        self.token_state = TOKEN_STATE_MISSING
+        # seconds until the token expires according to the local clock, before probing
+        self.token_expires_in = None
+        # whether the stored token has been replaced by a refreshed one
+        self.token_refreshed = False
+        # seconds the clock of the server is ahead of the local one, from the Date header of the api responses
+        self.clock_skew = None
+
+    def add(self, phase: str, target: str, duration: float):
+        self.samples.setdefault((phase, target), []).append(duration)
+        self.errors.setdefault((phase, target), [])
+
+    def add_error(self, phase: str, target: str, error: str):
+        self.samples.setdefault((phase, target), [])
+        self.errors.setdefault((phase, target), []).append(error)
+
+    @property
+    def token_expires_in_server_time(self) -> float or None:
+        """
+        :return: seconds until the token expires according to the clock of the server
+        """
+        if self.token_expires_in is None or self.clock_skew is None:
+            return None
+        return self.token_expires_in - self.clock_skew
+
+    def stats(self) -> list:
+        """
+        :return: list of dicts with phase, target, count, errors, min, p50 and p99 (in seconds) in probe order
+        """
+        return [{
+            "phase": phase,
+            "target": target,
+            "count": len(samples),
+            "errors": len(self.errors[(phase, target)]),
+            "min": min(samples) if samples else None,
+            "p50": percentile(samples, 50),
+            "p99": percentile(samples, 99),
+        } for (phase, target), samples in self.samples.items()]
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": self.stats(),
+            "errors": [{"phase": phase, "target": target, "error": error}
+                       for (phase, target), errors in self.errors.items() for error in errors],
+            "token": {
+                "state": self.token_state,
+                "expiresIn": self.token_expires_in,
+                "expiresInServerTime": self.token_expires_in_server_time,
+                "refreshed": self.token_refreshed,
+            },
+            "clockSkew": self.clock_skew,
+        }
+
+
+def _token_state(token_data: dict) -> tuple:
+    expiration_time = token_data.get(EXPIRATION_TIME_KEY)
+    if not token_data.get(ACCESS_TOKEN_KEY) or expiration_time is None:
+        return TOKEN_STATE_MISSING, None
+    expires_in = expiration_time - time.time()
+    return TOKEN_STATE_VALID if expires_in > 0 else TOKEN_STATE_EXPIRED, expires_in
+
+
+def _server_time(response) -> float or None:
+    date = response.headers.get("Date")
+    if not date:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def diagnose(api: Api, count: int = 5, api_url: str = BASE_URL_DE, path: str = DEFAULT_PATH) -> Report:
+    """
+    Runs the probes
+
+    :param api: the client whose config, token store and transport are used
+    :param count: number of times to repeat the probes
+    :param api_url: base url of the api, f.ex. of a local stand-in server
+    :param path: path of the authenticated GET request
+    :return: the report
+    """
+    report = Report()
+    targets = []
+    for url in [api.config.AUTH_BASE_URL.value, api_url]:
+        if urlparse(url).netloc not in [urlparse(target).netloc for target in targets]:
+            targets.append(url)
+    auth_host = urlparse(api.config.AUTH_BASE_URL.value).netloc
+    request_url = api_url.rstrip("/") + path
+    connect_timeout = api.config.HTTP_CONNECT_TIMEOUT.value or DEFAULT_TIMEOUT
+    skews = []
+    # before the probes, which may refresh the token
+    report.token_state, report.token_expires_in = _token_state(api.token_data)
+
+    for _ in range(count):
+        for url in targets:
+            host = urlparse(url).netloc
+            try:
+                for phase, duration in probe_connection(url, connect_timeout):
+                    report.add(phase, host, duration)
+            except OSError as e:
+                report.add_error(getattr(e, "phase", PHASE_DNS), host, str(e))
+
+        start = time.perf_counter()
+        token_data = api.token_data
+        token_state, _ = _token_state(token_data)
+        if token_state == TOKEN_STATE_MISSING:
+            # without a token there is nothing to request, a login requires user interaction
+            report.add_error(PHASE_TOKEN, "", "No login, run any command to log in")
+            continue
+        report.add(PHASE_TOKEN, "", time.perf_counter() - start)
+
+        if token_state == TOKEN_STATE_EXPIRED:
+            start = time.perf_counter()
+            try:
+                # raises AssertionError without a refresh token
+                api.refresh_authentication()
+                token_data = api.token_data
+            except (AssertionError, RequestException, PermissionError) as e:
+                report.add_error(PHASE_REFRESH, auth_host, str(e) or "Refresh failed, run any command to log in")
+                continue
+            report.add(PHASE_REFRESH, auth_host, time.perf_counter() - start)
+            report.token_refreshed = True
+        access_token = token_data[ACCESS_TOKEN_KEY]
+
+        host = urlparse(request_url).netloc
+        timeout = request_timeout(api.config.HTTP_CONNECT_TIMEOUT.value, api.config.HTTP_READ_TIMEOUT.value)
+        start = time.perf_counter()
+        try:
+            # bypasses the circuit breakers, the single flight group and the archive of the client
+            response = api.transport.request(GET, request_url, timeout=timeout,
+                                             headers={"Authorization": "Bearer {}".format(access_token)})
+            local_time = time.time()
+            response.raise_for_status()
+        except (RequestException, OSError) as e:
+            report.add_error(PHASE_REQUEST, host, str(e))
+            continue
+        report.add(PHASE_REQUEST, host, time.perf_counter() - start)
+
+        server_time = _server_time(response)
+        if server_time is not None:
+            # the Date header has a resolution of a second
+            skews.append(server_time + 0.5 - local_time)
+
+    if skews:
+        report.clock_skew = percentile(skews, 50)
+    return report
@@ -0,0 +1,102 @@
+"""
+Enrichment of transactions and statistics with human readable category names and matching contacts.
+
+The categories (Api.get_available_categories()) and contacts (Api.get_contacts()) are indexed once,
+so every record is enriched using dictionary lookups only. Records can be enriched one by one,
+which allows to use an Enricher as a streaming transform over arbitrarily long transaction histories.
+"""
+from n26.models import CATEGORY, PARTNER_IBAN, PARTNER_NAME
+from n26.util import normalize_partner_iban, normalize_partner_name
+
+# keys added to enriched records
+CATEGORY_NAME = "categoryName"
+CONTACT_ID = "contactId"
+CONTACT_NAME = "contactName"
+
+# keys of the category items of a statistics response
+STATISTICS_ITEM_KEYS = ["items", "incomeItems", "expenseItems"]
+
+
+class Enricher(object):
+    """
+    Joins category names and contacts into transaction and statistics records
+    """
+
+    def __init__(self, categories: list = None, contacts: list = None):
+        """
+        :param categories: the categories as returned by Api.get_available_categories()
+        :param contacts: the contacts as returned by Api.get_contacts()
+        """
+        self._category_names = {}
+        for category in categories or []:
+            if category.get("id") and category.get("name"):
+                self._category_names[category["id"]] = category["name"]
+
+        self._contacts_by_iban = {}
+        self._contacts_by_name = {}
+        for contact in contacts or []:
+            iban = normalize_partner_iban((contact.get("account") or {}).get("iban"))
+            name = normalize_partner_name(contact.get("name"))
+            # the first contact wins if several contacts share an iban or name
+            if iban:
+                self._contacts_by_iban.setdefault(iban, contact)
+            if name:
+                self._contacts_by_name.setdefault(name, contact)
+
+    def category_name(self, category_id: str or None) -> str or None:
+        """
+        :param category_id: the id of a category, f.ex. "micro-v2-food-groceries"
+        :return: the name of the category or the id itself if it is unknown
+        """
+        return self._category_names.get(category_id, category_id)
+
+    def contact(self, transaction: dict) -> dict or None:
+        """
+        Finds the contact of the partner of a transaction, matched by iban first and by name second
+
+        :param transaction: the transaction
+        :return: the contact or None
+        """
+        iban = normalize_partner_iban(transaction.get(PARTNER_IBAN))
+        if iban:
+            contact = self._contacts_by_iban.get(iban)
+            if contact is not None:
+                return contact
+        name = normalize_partner_name(transaction.get(PARTNER_NAME))
+        return self._contacts_by_name.get(name) if name else None
+
+    def enrich_transaction(self, transaction: dict) -> dict:
+        """
+        :param transaction: the transaction, it is not modified
+        :return: a copy of the transaction including the category name and matching contact (if any)
+        """
+        enriched = dict(transaction)
+        if transaction.get(CATEGORY):
+            enriched[CATEGORY_NAME] = self.category_name(transaction[CATEGORY])
+        contact = self.contact(transaction)
+        if contact is not None:
+            enriched[CONTACT_ID] = contact.get("id")
+            enriched[CONTACT_NAME] = contact.get("name")
+        return enriched
+
+    def enrich_transactions(self, transactions):
+        """
+        Enriches transactions lazily, one at a time
+
+        :param transactions: any iterable of transactions
+        :return: generator of enriched transactions
+        """
+        for transaction in transactions:
+            yield self.enrich_transaction(transaction)
+
+    def enrich_statistics(self, statistics: dict) -> dict:
+        """
+        :param statistics: the statistics as returned by Api.get_statistics(), it is not modified
+        :return: a copy of the statistics with the category name added to every category item
+        """
+        enriched = dict(statistics)
+        for key in STATISTICS_ITEM_KEYS:
+            if isinstance(statistics.get(key), list):
+                enriched[key] = [dict(item, **{CATEGORY_NAME: self.category_name(item.get("id"))})
+                                 for item in statistics[key]]
+        return enriched
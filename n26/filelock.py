@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on windows
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+POLL_INTERVAL = 0.05
+
+
+class FileLock(object):
+    """
+    Advisory, reentrant lock based on a lock file which can be used to synchronize
+    threads as well as processes.
+
+    On platforms without support for file locking only threads of the same process are synchronized.
+    """
+
+    def __init__(self, path: str or Path, timeout: float = None):
+        """
+        :param path: path of the lock file, it is created if necessary
+        :param timeout: maximum time to wait for the lock in seconds, None waits forever
+        """
+        self.path = Path(path).expanduser()
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file_descriptor = None
+
+    def acquire(self):
+        """
+        Acquires the lock
+
+        :raises TimeoutError: if the lock could not be acquired within the timeout
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if not self._thread_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            raise TimeoutError("Unable to acquire lock {}".format(self.path))
+
+        try:
+            if self._depth == 0:
+                self._file_descriptor = self._lock_file(deadline)
+            self._depth += 1
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        """
+        Releases the lock
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            file_descriptor, self._file_descriptor = self._file_descriptor, None
+            self._unlock_file(file_descriptor)
+        self._thread_lock.release()
+
+    def _lock_file(self, deadline: float or None) -> int:
+        self.path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        file_descriptor = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            while not self._try_lock(file_descriptor, blocking=deadline is None):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("Unable to acquire lock {}".format(self.path))
+                time.sleep(POLL_INTERVAL)
+        except BaseException:
+            os.close(file_descriptor)
+            raise
+        return file_descriptor
+
+    @staticmethod
+    def _try_lock(file_descriptor: int, blocking: bool) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(file_descriptor, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                while True:
+                    try:
+                        msvcrt.locking(file_descriptor, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+                        time.sleep(POLL_INTERVAL)
+        except (BlockingIOError, OSError):
+            return False
+        return True
+
+    @staticmethod
+    def _unlock_file(file_descriptor: int):
+        try:
+            if fcntl is not None:
+                fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(file_descriptor, 0, os.SEEK_SET)
+                msvcrt.locking(file_descriptor, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(file_descriptor)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,245 @@
+"""
+Execution of an operation for many accounts, each configured by its own config file.
+
+Every account uses its own Api client (and therefore its own token store), so a failing account doesn't
+affect the others. Accounts are processed by a thread pool or, to isolate them even further,
+a process pool. The rate of requests is limited globally and the results are merged into one report.
+
+Accounts need stored login data (see login_data_store_path) since nobody is there to approve a login.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from pathlib import Path
+
+from container_app_conf.source.toml_source import TomlSource
+from container_app_conf.source.yaml_source import YamlSource
+
+from n26.api import Api
+from n26.config import Config
+from n26.resilience import RateLimiter
+from n26.transport import HttpTransport, RateLimitedTransport
+
+LOGGER = logging.getLogger(__name__)
+
+OPERATION_BALANCE = "balance"
+OPERATION_SPACES = "spaces"
+OPERATION_TRANSACTIONS = "transactions"
+OPERATION_STATEMENTS = "statements"
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+CONFIG_EXTENSIONS = {
+    ".yml": YamlSource,
+    ".yaml": YamlSource,
+    ".toml": TomlSource,
+    ".tml": TomlSource,
+}
+
+# rate limiter of the current worker process
+_PROCESS_LIMITER = None
+
+
+def find_configs(directory: str or Path) -> list:
+    """
+    :param directory: directory containing one config file per account
+    :return: sorted list of config file paths
+    """
+    directory = Path(directory).expanduser()
+    if not directory.is_dir():
+        raise NotADirectoryError("Not a directory: {}".format(directory))
+    return sorted(path for path in directory.iterdir() if path.is_file() and path.suffix in CONFIG_EXTENSIONS)
+
+
+def load_config(path: str or Path) -> Config:
+    """
+    :param path: a yaml or toml config file
+    :return: the config of the file, independent from the global config
+    """
+    path = Path(path).expanduser()
+    source = CONFIG_EXTENSIONS[path.suffix](path.stem, str(path.parent), file_extension=path.suffix[1:])
+    config = Config(singleton=False, data_sources=[source], validate=False)
+    # the entries of non-singleton configs are copies including the values of the global config,
+    # an account must never inherit anything from another one
+    for entry in config._config_entries.values():
+        entry._value = entry.default
+    config.load_config(validate=True)
+    return config
+
+
+def _balance(api: Api, options: dict) -> dict:
+    return api.get_balance()
+
+
+def _spaces(api: Api, options: dict) -> list:
+    return api.get_spaces()["spaces"]
+
+
+def _transactions(api: Api, options: dict) -> list:
+    return api.get_transactions(from_time=options.get("from_time"), to_time=options.get("to_time"),
+                                limit=options.get("limit") or 10000)
+
+
+def _statements(api: Api, options: dict) -> list:
+    """
+    Downloads all statements that have not been downloaded before
+
+    :return: the downloaded statements
+    """
+    output_dir = options.get("output_dir")
+    if output_dir is None:
+        raise ValueError("An output directory is required to download statements")
+    output_dir = Path(output_dir).expanduser() / options["account"]
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    downloaded = []
+    for statement in api.get_statements():
+        path = output_dir / "{}.pdf".format(statement["id"])
+        if path.exists():
+            continue
+        path.write_bytes(api.get_balance_statement(statement["url"]))
+        downloaded.append({"id": statement["id"], "path": str(path)})
+    return downloaded
+
+
+OPERATIONS = {
+    OPERATION_BALANCE: _balance,
+    OPERATION_SPACES: _spaces,
+    OPERATION_TRANSACTIONS: _transactions,
+    OPERATION_STATEMENTS: _statements,
+}
+
+
+class AccountResult(object):
+    """
+    Result of an operation for a single account
+    """
+
+    def __init__(self, account: str, status: str, duration: float, data: dict or list = None, error: str = None):
+        """
+        :param account: name of the account, the name of its config file
+        :param status: STATUS_OK or STATUS_ERROR
+        :param duration: time in seconds the operation took
+        :param data: the result of the operation
+        :param error: the error message if the operation failed
+        """
+        self.account = account
+        self.status = status
+        self.duration = duration
+        self.data = data
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            "account": self.account,
+            "status": self.status,
+            "duration": round(self.duration, 6),
+            "error": self.error,
+        }
+
+    def __repr__(self):
+        return "AccountResult({!r}, {})".format(self.account, self.status)
+
+
+class FleetReport(object):
+    """
+    Results of an operation for all accounts
+    """
+
+    def __init__(self, operation: str, results: list, duration: float):
+        self.operation = operation
+        self.results = results
+        self.duration = duration
+
+    @property
+    def failed(self) -> list:
+        return [result for result in self.results if result.status != STATUS_OK]
+
+    def rows(self) -> list:
+        """
+        :return: the results of all successful accounts merged into a single list of dicts,
+                 every row has an additional "account" key
+        """
+        rows = []
+        for result in self.results:
+            if result.status != STATUS_OK:
+                continue
+            items = result.data if isinstance(result.data, list) else [result.data]
+            rows.extend(dict(item, account=result.account) for item in items)
+        return rows
+
+    def to_dict(self) -> dict:
+        return {
+            "operation": self.operation,
+            "duration": round(self.duration, 6),
+            "accounts": [result.to_dict() for result in self.results],
+            "data": self.rows(),
+        }
+
+
+def _init_process(rate_limit: float or None):
+    global _PROCESS_LIMITER
+    _PROCESS_LIMITER = RateLimiter(rate_limit) if rate_limit else None
+
+
+def _run_account(path: str, operation: str, options: dict, limiter: RateLimiter = None) -> AccountResult:
+    """
+    Runs an operation for a single account, never raises
+
+    :param path: the config file of the account
+    :param operation: one of the OPERATION_* names
+    :param options: options of the operation
+    :param limiter: rate limiter shared by all accounts, defaults to the limiter of the worker process
+    :return: the result
+    """
+    account = Path(path).stem
+    limiter = limiter or _PROCESS_LIMITER
+    start = time.perf_counter()
+    api = None
+    try:
+        transport = HttpTransport()
+        if limiter is not None:
+            transport = RateLimitedTransport(transport, limiter)
+        api = Api(load_config(path), transport=transport)
+        with api.authenticated_session():
+            data = OPERATIONS[operation](api, dict(options, account=account))
+        return AccountResult(account, STATUS_OK, time.perf_counter() - start, data=data)
+    except Exception as e:
+        LOGGER.warning("{} failed for {}: {}".format(operation, account, e))
+        return AccountResult(account, STATUS_ERROR, time.perf_counter() - start, error=str(e) or repr(e))
+    finally:
+        if api is not None:
+            api.transport.close()
+
+
+def run_fleet(configs: list, operation: str, max_workers: int = 4, rate_limit: float = None,
+              processes: bool = False, **options) -> FleetReport:
+    """
+    Runs an operation for many accounts
+
+    :param configs: config file paths, one per account, see find_configs()
+    :param operation: one of the OPERATION_* names
+    :param max_workers: number of accounts processed at the same time
+    :param rate_limit: maximum number of requests per second of all accounts together
+    :param processes: use a process instead of a thread pool,
+                      the rate limit is split evenly between the worker processes
+    :param options: options of the operation: from_time, to_time and limit for transactions,
+                    output_dir for statements
+    :return: the report, results are in the order of the configs
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unsupported operation: {}".format(operation))
+
+    start = time.perf_counter()
+    paths = [str(path) for path in configs]
+    if processes:
+        per_process = rate_limit / max_workers if rate_limit else None
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_process,
+                                 initargs=(per_process,)) as executor:
+            results = list(executor.map(_run_account, paths, [operation] * len(paths), [options] * len(paths)))
+    else:
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda path: _run_account(path, operation, options, limiter), paths))
+    return FleetReport(operation, results, time.perf_counter() - start)
@@ -0,0 +1,264 @@
+"""
+Offline validation of IBANs and BICs, so invalid transfers fail before the (expensive) PIN encryption
+and the request.
+
+IBANs are checked for their structure, the length of their country and their mod-97 check digits.
+Optionally, a bank index maps national bank codes to BICs to derive a missing BIC from an IBAN or to
+verify a given one. The index is a file of sorted fixed-width records which is memory mapped on first use
+and searched using binary search, build it from a csv file using build_bank_index().
+"""
+import csv
+import logging
+import mmap
+import re
+import struct
+import threading
+from pathlib import Path
+
+LOGGER = logging.getLogger(__name__)
+
+# lengths of the IBANs of all countries of the SWIFT IBAN registry
+IBAN_LENGTHS = {
+    "AD": 24, "AE": 23, "AL": 28, "AT": 20, "AZ": 28, "BA": 20, "BE": 16, "BG": 22, "BH": 22, "BI": 27, "BR": 29,
+    "BY": 28, "CH": 21, "CR": 22, "CY": 28, "CZ": 24, "DE": 22, "DJ": 27, "DK": 18, "DO": 28, "EE": 20, "EG": 29,
+    "ES": 24, "FI": 18, "FK": 18, "FO": 18, "FR": 27, "GB": 22, "GE": 22, "GI": 23, "GL": 18, "GR": 27, "GT": 28,
+    "HR": 21, "HU": 28, "IE": 22, "IL": 23, "IQ": 23, "IS": 26, "IT": 27, "JO": 30, "KW": 30, "KZ": 20, "LB": 28,
+    "LC": 32, "LI": 21, "LT": 20, "LU": 20, "LV": 21, "LY": 25, "MC": 27, "MD": 24, "ME": 22, "MK": 19, "MN": 20,
+    "MR": 27, "MT": 31, "MU": 30, "NI": 28, "NL": 18, "NO": 15, "OM": 23, "PK": 24, "PL": 28, "PS": 29, "PT": 25,
+    "QA": 29, "RO": 24, "RS": 22, "RU": 33, "SA": 24, "SC": 31, "SD": 18, "SE": 24, "SI": 19, "SK": 24, "SM": 27,
+    "SO": 23, "ST": 25, "SV": 28, "TL": 23, "TN": 24, "TR": 26, "UA": 29, "VA": 22, "VG": 24, "XK": 20,
+}
+
+# position of the national bank code within the BBAN (the IBAN without country code and check digits)
+BANK_CODE_POSITIONS = {
+    "AT": (0, 5),
+    "BE": (0, 3),
+    "CH": (0, 5),
+    "DE": (0, 8),
+    "ES": (0, 4),
+    "FR": (0, 5),
+    "GB": (0, 4),
+    "IE": (0, 4),
+    "IT": (1, 6),
+    "LI": (0, 5),
+    "LU": (0, 3),
+    "NL": (0, 4),
+    "PT": (0, 4),
+}
+
+_IBAN_PATTERN = re.compile(r"^[A-Z]{2}[0-9]{2}[A-Z0-9]{1,30}$")
+_BIC_PATTERN = re.compile(r"^[A-Z]{4}[A-Z]{2}[A-Z0-9]{2}([A-Z0-9]{3})?$")
+
+MAGIC = b"N26B"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+# country code and bank code (the key the records are sorted by), BIC
+KEY_SIZE = 14
+RECORD = struct.Struct("<{}s11s".format(KEY_SIZE))
+
+
+def normalize_iban(iban: str) -> str:
+    """
+    :param iban: an IBAN as typed by a user, f.ex. "de89 3704 0044 0532 0130 00"
+    :return: the IBAN in electronic format, f.ex. "DE89370400440532013000"
+    """
+    return "".join(iban.split()).upper()
+
+
+def _mod97(value: str) -> int:
+    # letters count as two digits: A = 10, ..., Z = 35
+    return int("".join(str(int(char, 36)) for char in value)) % 97
+
+
+def validate_iban(iban: str) -> str:
+    """
+    :param iban: the IBAN to check, spaces are allowed
+    :return: the normalized IBAN
+    :raises ValueError: if the IBAN is invalid
+    """
+    normalized = normalize_iban(iban)
+    if not _IBAN_PATTERN.match(normalized):
+        raise ValueError("Invalid IBAN format: {}".format(iban))
+
+    country = normalized[:2]
+    expected_length = IBAN_LENGTHS.get(country)
+    if expected_length is None:
+        raise ValueError("Unknown IBAN country code: {}".format(country))
+    if len(normalized) != expected_length:
+        raise ValueError("IBANs of {} have {} characters, got {}: {}".format(
+            country, expected_length, len(normalized), iban))
+    if _mod97(normalized[4:] + normalized[:4]) != 1:
+        raise ValueError("Invalid IBAN check digits: {}".format(iban))
+    return normalized
+
+
+def validate_bic(bic: str) -> str:
+    """
+    :param bic: the BIC to check
+    :return: the normalized BIC
+    :raises ValueError: if the BIC is invalid
+    """
+    normalized = bic.strip().upper()
+    if not _BIC_PATTERN.match(normalized):
+        raise ValueError("Invalid BIC format: {}".format(bic))
+    return normalized
+
+
+def bank_code(iban: str) -> tuple or None:
+    """
+    :param iban: a normalized IBAN
+    :return: (country code, national bank code) of the IBAN, None if the position of the bank code is unknown
+    """
+    country = iban[:2]
+    position = BANK_CODE_POSITIONS.get(country)
+    if position is None:
+        return None
+    start, end = position
+    return country, iban[4 + start:4 + end]
+
+
+def _key(country: str, code: str) -> bytes:
+    return (country + code).encode('ascii').ljust(KEY_SIZE, b" ")
+
+
+def build_bank_index(rows, path: str or Path) -> int:
+    """
+    Writes a bank index
+
+    :param rows: iterable of (country code, national bank code, BIC) tuples, or the path of a csv file
+                 with the columns "country", "bank_code" and "bic"
+    :param path: the index file to write
+    :return: the number of entries
+    """
+    if isinstance(rows, (str, Path)):
+        with open(str(Path(rows).expanduser()), newline="", encoding="utf-8") as file:
+            rows = [(row["country"], row["bank_code"], row["bic"]) for row in csv.DictReader(file)]
+
+    records = set()
+    for country, code, bic in rows:
+        country = country.strip().upper()
+        code = code.strip().upper()
+        if len(country) + len(code) > KEY_SIZE:
+            raise ValueError("Bank code too long: {} {}".format(country, code))
+        records.add((_key(country, code), validate_bic(bic).encode('ascii').ljust(11, b" ")))
+
+    path = Path(path).expanduser()
+    with open(str(path), "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(records)))
+        for key, bic in sorted(records):
+            file.write(RECORD.pack(key, bic))
+    return len(records)
+
+
+class BankIndex(object):
+    """
+    Read-only mapping of national bank codes to BICs, the file is memory mapped on first use
+    """
+
+    def __init__(self, path: str or Path):
+        """
+        :param path: an index written by build_bank_index()
+        """
+        self.path = Path(path).expanduser()
+        self._lock = threading.Lock()
+        self._file = None
+        self._data = None
+        self._count = 0
+
+    def open(self):
+        """
+        Opens the index, it is opened on first use otherwise
+
+        :raises ValueError: if the index can't be read or is invalid
+        """
+        with self._lock:
+            if self._data is not None:
+                return
+            try:
+                file = open(str(self.path), "rb")
+            except OSError as e:
+                # a misconfigured path is an invalid value, like a corrupt index
+                raise ValueError("Unable to read bank index {}: {}".format(self.path, e.strerror or e)) from e
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                file.close()
+                raise ValueError("Invalid bank index: {}".format(self.path))
+            magic, version, record_size, count = HEADER.unpack_from(data) if len(data) >= HEADER.size \
+                else (None, None, None, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size \
+                    or len(data) < HEADER.size + count * RECORD.size:
+                data.close()
+                file.close()
+                raise ValueError("Unsupported bank index: {}".format(self.path))
+            self._file, self._data, self._count = file, data, count
+
+    def _key_at(self, index: int) -> bytes:
+        offset = HEADER.size + index * RECORD.size
+        return self._data[offset:offset + KEY_SIZE]
+
+    def bics(self, country: str, code: str) -> list:
+        """
+        :param country: the country code
+        :param code: the national bank code
+        :return: all BICs of the bank code, an empty list if it is unknown
+        """
+        self.open()
+        key = _key(country, code)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        bics = []
+        while low < self._count and self._key_at(low) == key:
+            bics.append(RECORD.unpack_from(self._data, HEADER.size + low * RECORD.size)[1].decode('ascii').strip())
+            low += 1
+        return bics
+
+    def __len__(self):
+        self.open()
+        return self._count
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.close()
+                self._file.close()
+                self._data = None
+                self._file = None
+
+
+def validate_transfer(iban: str, bic: str or None = None, index: BankIndex = None) -> tuple:
+    """
+    Validates the recipient of a transfer
+
+    :param iban: the IBAN of the recipient, spaces are allowed
+    :param bic: the (optional) BIC of the recipient
+    :param index: optional bank index to derive a missing BIC or verify the given one
+    :return: (normalized IBAN, normalized or derived BIC - an empty string if unknown)
+    :raises ValueError: if the IBAN or BIC is invalid or the BIC doesn't belong to the bank of the IBAN,
+        or the bank index can't be read
+    """
+    iban = validate_iban(iban)
+    bic = validate_bic(bic) if bic and bic.strip() else ""
+
+    code = bank_code(iban) if index is not None else None
+    if code is None:
+        return iban, bic
+    known = index.bics(*code)
+    if not known:
+        return iban, bic
+
+    if not bic:
+        if len(known) > 1:
+            LOGGER.debug("Bank code {} {} has {} BICs, using {}".format(code[0], code[1], len(known), known[0]))
+        return iban, known[0]
+    # the first 8 characters identify the institution, the rest is an (optional) branch code
+    if not any(bic[:8] == candidate[:8] for candidate in known):
+        raise ValueError("BIC {} doesn't belong to bank code {} of {}, expected one of: {}".format(
+            bic, code[1], iban, ", ".join(known)))
+    return iban, bic
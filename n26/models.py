@@ -0,0 +1,383 @@
+import sys
+from array import array
+
+from n26.const import AMOUNT, CURRENCY, REFERENCE_TEXT
+
+ID = 'id'
+VISIBLE_TS = 'visibleTS'
+TYPE = 'type'
+CATEGORY = 'category'
+PARTNER_NAME = 'partnerName'
+PARTNER_IBAN = 'partnerIban'
+PENDING = 'pending'
+
+# order of the columns when converting a batch to a dataframe or table
+COLUMNS = [ID, VISIBLE_TS, AMOUNT, CURRENCY, TYPE, CATEGORY, PARTNER_NAME, PARTNER_IBAN, REFERENCE_TEXT, PENDING]
+
+
+def _to_cents(amount: float or None) -> int:
+    """
+    Converts a (float) money amount as returned by the api to integer cents
+
+    :param amount: the amount to convert
+    :return: amount in cents
+    """
+    if not amount:
+        return 0
+    return int(round(amount * 100))
+
+
+def _intern(value: str or None) -> str or None:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class _Dictionary(object):
+    """
+    Dictionary encoding for low cardinality string columns.
+    Code 0 is reserved for missing values.
+    """
+
+    def __init__(self):
+        self.values = [None]
+        self._codes = {None: 0}
+
+    def encode(self, value: str or None) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(_intern(value))
+            self._codes[value] = code
+        return code
+
+    def code_of(self, value: str or None) -> int or None:
+        return self._codes.get(value)
+
+
+class TransactionRow(object):
+    """
+    Lightweight read-only view of a single row of a TransactionBatch.
+    Supports dict-like access using the keys of the n26 api.
+    """
+
+    __slots__ = ('_batch', '_index')
+
+    def __init__(self, batch: 'TransactionBatch', index: int):
+        self._batch = batch
+        self._index = index
+
+    @property
+    def id(self) -> str or None:
+        return self._batch._ids[self._index]
+
+    @property
+    def visible_ts(self) -> int:
+        return self._batch._timestamps[self._index]
+
+    @property
+    def amount_cents(self) -> int:
+        return self._batch._amounts[self._index]
+
+    @property
+    def amount(self) -> float:
+        return self.amount_cents / 100
+
+    @property
+    def currency(self) -> str or None:
+        return self._batch._currencies.values[self._batch._currency_codes[self._index]]
+
+    @property
+    def type(self) -> str or None:
+        return self._batch._types.values[self._batch._type_codes[self._index]]
+
+    @property
+    def category(self) -> str or None:
+        return self._batch._categories.values[self._batch._category_codes[self._index]]
+
+    @property
+    def partner_name(self) -> str or None:
+        return self._batch._partner_names[self._index]
+
+    @property
+    def partner_iban(self) -> str or None:
+        return self._batch._partner_ibans[self._index]
+
+    @property
+    def reference_text(self) -> str or None:
+        return self._batch._reference_texts[self._index]
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._batch._pending[self._index])
+
+    def to_dict(self) -> dict:
+        """
+        :return: the row as a dictionary using the keys of the n26 api
+        """
+        return {key: self[key] for key in COLUMNS}
+
+    def get(self, key: str, default=None):
+        if key not in _ROW_ACCESSORS:
+            return default
+        value = self[key]
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        accessor = _ROW_ACCESSORS.get(key)
+        if accessor is None:
+            raise KeyError(key)
+        return accessor(self)
+
+    def __eq__(self, other):
+        if isinstance(other, TransactionRow):
+            return self.to_dict() == other.to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return "TransactionRow({})".format(self.to_dict())
+
+
+_ROW_ACCESSORS = {
+    ID: lambda row: row.id,
+    VISIBLE_TS: lambda row: row.visible_ts,
+    AMOUNT: lambda row: row.amount,
+    CURRENCY: lambda row: row.currency,
+    TYPE: lambda row: row.type,
+    CATEGORY: lambda row: row.category,
+    PARTNER_NAME: lambda row: row.partner_name,
+    PARTNER_IBAN: lambda row: row.partner_iban,
+    REFERENCE_TEXT: lambda row: row.reference_text,
+    PENDING: lambda row: row.pending,
+}
+
+
+class TransactionBatch(object):
+    """
+    Compact, columnar representation of a list of transactions.
+
+    Amounts are stored as integer cents and timestamps as int64 values in typed arrays,
+    low cardinality columns (category, type and currency) are dictionary encoded.
+    Rows can be accessed as lightweight TransactionRow views.
+    """
+
+    def __init__(self, categories: _Dictionary = None, types: _Dictionary = None, currencies: _Dictionary = None):
+        """
+        Creates an empty batch, use from_dicts() to create a batch from api results
+
+        :param categories: dictionary to use for encoding categories
+        :param types: dictionary to use for encoding transaction types
+        :param currencies: dictionary to use for encoding currency codes
+        """
+        self._categories = categories or _Dictionary()
+        self._types = types or _Dictionary()
+        self._currencies = currencies or _Dictionary()
+
+        self._ids = []
+        self._timestamps = array('q')
+        self._amounts = array('q')
+        self._currency_codes = array('I')
+        self._type_codes = array('I')
+        self._category_codes = array('I')
+        self._partner_names = []
+        self._partner_ibans = []
+        self._reference_texts = []
+        self._pending = array('b')
+
+    @classmethod
+    def from_dicts(cls, transactions: list) -> 'TransactionBatch':
+        """
+        Creates a batch from a list of transactions as returned by Api.get_transactions()
+
+        :param transactions: list of transaction dictionaries
+        :return: the batch
+        """
+        batch = cls()
+        for transaction in transactions or []:
+            batch.append(transaction)
+        return batch
+
+    def append(self, transaction: dict):
+        """
+        Appends a single transaction to this batch
+
+        :param transaction: transaction dictionary as returned by the api
+        """
+        self._ids.append(transaction.get(ID))
+        self._timestamps.append(transaction.get(VISIBLE_TS) or 0)
+        self._amounts.append(_to_cents(transaction.get(AMOUNT)))
+        self._currency_codes.append(self._currencies.encode(transaction.get(CURRENCY)))
+        self._type_codes.append(self._types.encode(transaction.get(TYPE)))
+        self._category_codes.append(self._categories.encode(transaction.get(CATEGORY)))
+        self._partner_names.append(_intern(transaction.get(PARTNER_NAME)))
+        self._partner_ibans.append(_intern(transaction.get(PARTNER_IBAN)))
+        self._reference_texts.append(transaction.get(REFERENCE_TEXT))
+        self._pending.append(1 if transaction.get(PENDING) else 0)
+
+    @property
+    def amounts_cents(self) -> array:
+        """
+        :return: the amount column in cents
+        """
+        return self._amounts
+
+    @property
+    def timestamps(self) -> array:
+        """
+        :return: the visibleTS column in milliseconds since 1970
+        """
+        return self._timestamps
+
+    @property
+    def categories(self) -> list:
+        """
+        :return: all distinct categories contained in this batch
+        """
+        return sorted({self._categories.values[code] for code in set(self._category_codes)} - {None})
+
+    def total_cents(self) -> int:
+        """
+        :return: the sum of all amounts in cents
+        """
+        return sum(self._amounts)
+
+    def take(self, indices: list) -> 'TransactionBatch':
+        """
+        Creates a new batch containing only the rows at the given indices.
+        Dictionaries are shared with this batch.
+
+        :param indices: row indices to select
+        :return: the new batch
+        """
+        batch = TransactionBatch(self._categories, self._types, self._currencies)
+        for column in self._column_names():
+            source = getattr(self, column)
+            target = getattr(batch, column)
+            if isinstance(source, array):
+                target.extend(array(source.typecode, (source[i] for i in indices)))
+            else:
+                target.extend(source[i] for i in indices)
+        return batch
+
+    def filter(self, predicate: callable = None, category: str = None, type: str = None, currency: str = None,
+               from_time: int = None, to_time: int = None) -> 'TransactionBatch':
+        """
+        Filters the rows of this batch.
+        Conditions are evaluated on the encoded columns and only the predicate (if any) sees row views.
+
+        :param predicate: optional function receiving a TransactionRow, return True to keep the row
+        :param category: only keep rows of this category
+        :param type: only keep rows of this transaction type
+        :param currency: only keep rows with this currency code
+        :param from_time: only keep rows with a visibleTS >= from_time
+        :param to_time: only keep rows with a visibleTS <= to_time
+        :return: a new batch containing the matching rows
+        """
+        conditions = []
+        for dictionary, codes, value in [(self._categories, self._category_codes, category),
+                                         (self._types, self._type_codes, type),
+                                         (self._currencies, self._currency_codes, currency)]:
+            if value is None:
+                continue
+            code = dictionary.code_of(value)
+            if code is None:
+                # value does not occur in this batch at all
+                return self.take([])
+            conditions.append(lambda i, codes=codes, code=code: codes[i] == code)
+        if from_time is not None:
+            conditions.append(lambda i: self._timestamps[i] >= from_time)
+        if to_time is not None:
+            conditions.append(lambda i: self._timestamps[i] <= to_time)
+        if predicate is not None:
+            conditions.append(lambda i: predicate(TransactionRow(self, i)))
+
+        return self.take([i for i in range(len(self)) if all(condition(i) for condition in conditions)])
+
+    def to_dicts(self) -> list:
+        """
+        :return: the rows of this batch as a list of dictionaries
+        """
+        return [row.to_dict() for row in self]
+
+    def to_pandas(self):
+        """
+        Converts this batch to a pandas DataFrame.
+        Dictionary encoded columns are converted to categoricals without decoding them.
+
+        :return: the DataFrame
+        """
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("pandas is required for TransactionBatch.to_pandas()") from e
+
+        def categorical(dictionary: _Dictionary, codes: array):
+            return pd.Categorical.from_codes([code - 1 for code in codes], categories=dictionary.values[1:])
+
+        return pd.DataFrame({
+            ID: self._ids,
+            VISIBLE_TS: pd.Series(self._timestamps, dtype='int64'),
+            AMOUNT: pd.Series(self._amounts, dtype='int64') / 100,
+            CURRENCY: categorical(self._currencies, self._currency_codes),
+            TYPE: categorical(self._types, self._type_codes),
+            CATEGORY: categorical(self._categories, self._category_codes),
+            PARTNER_NAME: self._partner_names,
+            PARTNER_IBAN: self._partner_ibans,
+            REFERENCE_TEXT: self._reference_texts,
+            PENDING: pd.Series(self._pending, dtype='bool'),
+        }, columns=COLUMNS)
+
+    def to_arrow(self):
+        """
+        Converts this batch to a pyarrow Table.
+        Dictionary encoded columns are converted to arrow dictionary arrays.
+
+        :return: the Table
+        """
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("pyarrow is required for TransactionBatch.to_arrow()") from e
+
+        def dictionary_array(dictionary: _Dictionary, codes: array):
+            indices = pa.array([code - 1 if code else None for code in codes], type=pa.int32())
+            return pa.DictionaryArray.from_arrays(indices, pa.array(dictionary.values[1:], type=pa.string()))
+
+        return pa.table({
+            ID: pa.array(self._ids, type=pa.string()),
+            VISIBLE_TS: pa.array(self._timestamps, type=pa.int64()),
+            AMOUNT: pa.array([amount / 100 for amount in self._amounts], type=pa.float64()),
+            CURRENCY: dictionary_array(self._currencies, self._currency_codes),
+            TYPE: dictionary_array(self._types, self._type_codes),
+            CATEGORY: dictionary_array(self._categories, self._category_codes),
+            PARTNER_NAME: pa.array(self._partner_names, type=pa.string()),
+            PARTNER_IBAN: pa.array(self._partner_ibans, type=pa.string()),
+            REFERENCE_TEXT: pa.array(self._reference_texts, type=pa.string()),
+            PENDING: pa.array([bool(p) for p in self._pending], type=pa.bool_()),
+        })
+
+    @staticmethod
+    def _column_names() -> list:
+        return ['_ids', '_timestamps', '_amounts', '_currency_codes', '_type_codes', '_category_codes',
+                '_partner_names', '_partner_ibans', '_reference_texts', '_pending']
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TransactionRow(self, i)
+
+    def __getitem__(self, item: int or slice) -> TransactionRow or 'TransactionBatch':
+        if isinstance(item, slice):
+            batch = TransactionBatch(self._categories, self._types, self._currencies)
+            for column in self._column_names():
+                setattr(batch, column, getattr(self, column)[item])
+            return batch
+
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("TransactionBatch index out of range")
+        return TransactionRow(self, item)
+
+    def __repr__(self):
+        return "TransactionBatch(rows={})".format(len(self))
@@ -0,0 +1,270 @@
+"""
+Reconciliation of standing orders (as returned by Api.get_standing_orders()) with the transactions
+that actually executed them.
+
+Transactions are indexed by partner iban (or name) and amount, so every expected execution is matched
+using a dictionary lookup and a binary search by date instead of scanning the whole history.
+"""
+from bisect import bisect_left
+from datetime import datetime, timezone, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from n26.const import AMOUNT
+from n26.models import ID, VISIBLE_TS, PARTNER_IBAN, PARTNER_NAME, _to_cents
+from n26.util import normalize_partner_iban, normalize_partner_name
+
+FREQUENCY_WEEKLY = "WEEKLY"
+FREQUENCY_MONTHLY = "MONTHLY"
+FREQUENCY_QUARTERLY = "QUARTERLY"
+FREQUENCY_HALF_YEARLY = "HALF_YEARLY"
+FREQUENCY_YEARLY = "YEARLY"
+
+# months between executions
+FREQUENCY_MONTHS = {
+    FREQUENCY_MONTHLY: 1,
+    FREQUENCY_QUARTERLY: 3,
+    FREQUENCY_HALF_YEARLY: 6,
+    FREQUENCY_YEARLY: 12,
+}
+
+STATUS_ON_TIME = "on time"
+STATUS_LATE = "late"
+STATUS_MISSED = "missed"
+STATUS_PENDING = "pending"
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+# executions may be booked a little before the scheduled day
+EARLY_TOLERANCE_DAYS = 2
+# executions on weekends and holidays are moved to the next business day
+GRACE_DAYS = 3
+# maximum delay of an execution, later transactions are not considered to be executions
+TOLERANCE_DAYS = 10
+
+
+def _to_datetime(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc)
+
+
+def _to_timestamp(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def expected_executions(standing_order: dict, from_time: int, to_time: int) -> list:
+    """
+    Calculates the scheduled executions of a standing order
+
+    :param standing_order: the standing order
+    :param from_time: earliest execution to return - milliseconds since 1970
+    :param to_time: latest execution to return (inclusive) - milliseconds since 1970
+    :return: sorted list of execution timestamps in milliseconds
+    """
+    first = standing_order.get("firstExecutingTS") or standing_order.get("nextExecutingTS")
+    frequency = standing_order.get("executionFrequency")
+    if first is None or (frequency != FREQUENCY_WEEKLY and frequency not in FREQUENCY_MONTHS):
+        return []
+
+    end = to_time
+    for key in ["stopTS", "userCanceled"]:
+        if standing_order.get(key) is not None:
+            end = min(end, standing_order[key])
+
+    start = _to_datetime(first)
+    day_of_month = standing_order.get("initialDayOfMonth")
+    # skip to the first execution within the range
+    if frequency == FREQUENCY_WEEKLY:
+        index = max(0, (from_time - first) // (7 * DAY_MS))
+    else:
+        range_start = _to_datetime(from_time)
+        elapsed_months = (range_start.year - start.year) * 12 + range_start.month - start.month
+        index = max(0, elapsed_months // FREQUENCY_MONTHS[frequency] - 1)
+
+    executions = []
+    while True:
+        timestamp = _to_timestamp(_execution_time(start, frequency, day_of_month, index))
+        if timestamp > end:
+            break
+        if timestamp >= from_time:
+            executions.append(timestamp)
+        index += 1
+    return executions
+
+
+def _execution_time(start: datetime, frequency: str, day_of_month: int or None, index: int) -> datetime:
+    """
+    :return: the time of the execution with the given index
+    """
+    if frequency == FREQUENCY_WEEKLY:
+        return start + timedelta(weeks=index)
+    # relativedelta clamps the day to the length of the month
+    return start + relativedelta(months=index * FREQUENCY_MONTHS[frequency], day=day_of_month or start.day)
+
+
+class Execution(object):
+    """
+    A scheduled execution of a standing order and the transaction executing it (if any)
+    """
+
+    def __init__(self, expected_ts: int, transaction: dict or None, status: str):
+        """
+        :param expected_ts: the scheduled execution time - milliseconds since 1970
+        :param transaction: the matched transaction
+        :param status: one of the STATUS_* constants
+        """
+        self.expected_ts = expected_ts
+        self.transaction = transaction
+        self.status = status
+
+    @property
+    def delay_days(self) -> float or None:
+        """
+        :return: days between the scheduled and the actual execution
+        """
+        if self.transaction is None:
+            return None
+        return (self.transaction[VISIBLE_TS] - self.expected_ts) / DAY_MS
+
+    def __repr__(self):
+        return "Execution({}, {})".format(_to_datetime(self.expected_ts).date(), self.status)
+
+
+class Reconciliation(object):
+    """
+    Executions of a single standing order
+    """
+
+    def __init__(self, standing_order: dict, executions: list):
+        self.standing_order = standing_order
+        self.executions = executions
+
+    def _with_status(self, status: str) -> list:
+        return [execution for execution in self.executions if execution.status == status]
+
+    @property
+    def on_time(self) -> list:
+        return self._with_status(STATUS_ON_TIME)
+
+    @property
+    def late(self) -> list:
+        return self._with_status(STATUS_LATE)
+
+    @property
+    def missed(self) -> list:
+        return self._with_status(STATUS_MISSED)
+
+    @property
+    def pending(self) -> list:
+        return self._with_status(STATUS_PENDING)
+
+    @property
+    def last_execution(self) -> dict or None:
+        """
+        :return: the most recent transaction executing this standing order
+        """
+        executed = [execution.transaction for execution in self.executions if execution.transaction is not None]
+        return executed[-1] if executed else None
+
+
+class _TransactionIndex(object):
+    """
+    Outgoing transactions indexed by (partner, amount in cents), every bucket sorted by time
+    """
+
+    def __init__(self, transactions: list):
+        self._buckets = {}
+        for transaction in sorted(transactions, key=lambda t: t.get(VISIBLE_TS) or 0):
+            cents = _to_cents(transaction.get(AMOUNT))
+            if cents >= 0:
+                continue
+            for key in self._keys(transaction.get(PARTNER_IBAN), transaction.get(PARTNER_NAME), -cents):
+                timestamps, entries = self._buckets.setdefault(key, ([], []))
+                timestamps.append(transaction.get(VISIBLE_TS) or 0)
+                entries.append(transaction)
+        self._used = set()
+
+    @staticmethod
+    def _keys(iban: str or None, name: str or None, cents: int) -> list:
+        keys = []
+        if iban:
+            keys.append(("iban", normalize_partner_iban(iban), cents))
+        if name:
+            keys.append(("name", normalize_partner_name(name), cents))
+        return keys
+
+    def take(self, iban: str or None, name: str or None, cents: int, earliest: int, latest: int,
+             expected: int) -> dict or None:
+        """
+        Finds the unused transaction closest to the expected time and marks it as used
+
+        :return: the transaction or None
+        """
+        for key in self._keys(iban, name, cents):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            timestamps, entries = bucket
+            best = None
+            for position in range(bisect_left(timestamps, earliest), len(timestamps)):
+                if timestamps[position] > latest:
+                    break
+                transaction = entries[position]
+                if id(transaction) in self._used:
+                    continue
+                if best is None or abs(timestamps[position] - expected) < abs(best[VISIBLE_TS] - expected):
+                    best = transaction
+            if best is not None:
+                self._used.add(id(best))
+                return best
+        return None
+
+
+def reconcile(standing_orders: list, transactions: list, from_time: int, to_time: int,
+              grace_days: float = GRACE_DAYS, tolerance_days: float = TOLERANCE_DAYS) -> list:
+    """
+    Matches the scheduled executions of standing orders with transactions
+
+    :param standing_orders: the standing orders, f.ex. Api.get_standing_orders()["data"]
+    :param transactions: all transactions between from_time and to_time
+    :param from_time: start of the transaction history - milliseconds since 1970
+    :param to_time: end of the transaction history, usually now - milliseconds since 1970
+    :param grace_days: executions delayed by more days are considered late
+    :param tolerance_days: executions delayed by more days are considered missed
+    :return: list of Reconciliation objects in the order of the standing orders
+    """
+    index = _TransactionIndex(transactions)
+    tolerance = int(tolerance_days * DAY_MS)
+    result = []
+    for standing_order in standing_orders:
+        cents = _to_cents(abs(standing_order.get(AMOUNT) or 0))
+        executions = []
+        for expected in expected_executions(standing_order, from_time, to_time):
+            transaction = index.take(standing_order.get(PARTNER_IBAN), standing_order.get(PARTNER_NAME), cents,
+                                     expected - EARLY_TOLERANCE_DAYS * DAY_MS, expected + tolerance, expected)
+            if transaction is not None:
+                delay = (transaction[VISIBLE_TS] - expected) / DAY_MS
+                status = STATUS_LATE if delay > grace_days else STATUS_ON_TIME
+            elif expected + tolerance < to_time:
+                status = STATUS_MISSED
+            else:
+                status = STATUS_PENDING
+            executions.append(Execution(expected, transaction, status))
+        result.append(Reconciliation(standing_order, executions))
+    return result
+
+
+def project_outflows(standing_orders: list, from_time: int, to_time: int) -> list:
+    """
+    Projects the upcoming executions of standing orders
+
+    :param standing_orders: the standing orders
+    :param from_time: start of the projection - milliseconds since 1970
+    :param to_time: end of the projection (inclusive) - milliseconds since 1970
+    :return: list of (timestamp, standing order) tuples sorted by time
+    """
+    outflows = []
+    for standing_order in standing_orders:
+        for timestamp in expected_executions(standing_order, from_time, to_time):
+            outflows.append((timestamp, standing_order))
+    outflows.sort(key=lambda outflow: (outflow[0], outflow[1].get(ID) or ""))
+    return outflows
@@ -0,0 +1,349 @@
+"""
+Deadlines, timeouts and circuit breakers for the http requests of the Api client.
+
+A deadline limits the total time of an operation, f.ex. a token refresh followed by the actual request.
+It is bound to the current thread, every request made within it gets a timeout capped to the remaining time
+and fails immediately once the deadline has passed.
+
+Circuit breakers count consecutive failures per endpoint group. Once a threshold is reached the circuit opens
+and all requests to that group fail fast until a single probe request succeeds after a cool down period.
+
+Backoff and retry_after() calculate the intervals between repeated attempts, f.ex. when polling,
+a RateLimiter limits the number of requests per second shared by many clients.
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from n26 import codec
+
+LOGGER = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+_CURRENT = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a request is started after the deadline of the current operation has passed
+    """
+    pass
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of executing a request while the circuit of its endpoint group is open
+    """
+    pass
+
+
+class Deadline(object):
+    """
+    Point in time an operation has to be finished by
+    """
+
+    def __init__(self, timeout: float):
+        """
+        :param timeout: seconds from now
+        """
+        self.expires_at = time.monotonic() + timeout
+
+    @property
+    def remaining(self) -> float:
+        """
+        :return: the remaining time in seconds, never negative
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        """
+        :raises DeadlineExceeded: if the deadline has passed
+        """
+        if self.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+
+
+def current_deadline() -> Deadline or None:
+    """
+    :return: the deadline of the current thread, if any
+    """
+    return getattr(_CURRENT, "deadline", None)
+
+
+@contextmanager
+def deadline(timeout: float or None):
+    """
+    Limits the total time of all requests made by the current thread within the context.
+    Nested deadlines can only shorten, never extend, the enclosing deadline.
+
+    :param timeout: seconds from now, None doesn't set a deadline
+    """
+    previous = current_deadline()
+    if timeout is None:
+        yield previous
+        return
+
+    new = Deadline(timeout)
+    if previous is not None and previous.expires_at < new.expires_at:
+        new = previous
+    _CURRENT.deadline = new
+    try:
+        yield new
+    finally:
+        _CURRENT.deadline = previous
+
+
+def propagate_deadline(function: callable) -> callable:
+    """
+    Binds the deadline of the current thread to a function, f.ex. before submitting it to a thread pool
+
+    :param function: the function to wrap
+    :return: function running within the deadline of the calling thread
+    """
+    bound = current_deadline()
+    if bound is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        previous = current_deadline()
+        _CURRENT.deadline = bound
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _CURRENT.deadline = previous
+
+    return wrapper
+
+
+def request_timeout(connect_timeout: float or None, read_timeout: float or None) -> tuple or None:
+    """
+    Calculates the timeout of a single request
+
+    :param connect_timeout: the configured connect timeout in seconds
+    :param read_timeout: the configured read timeout in seconds
+    :return: (connect, read) timeout tuple as accepted by requests, capped to the current deadline
+    :raises DeadlineExceeded: if the current deadline has passed
+    """
+    current = current_deadline()
+    if current is None:
+        if connect_timeout is None and read_timeout is None:
+            return None
+        return connect_timeout, read_timeout
+
+    current.check()
+    remaining = current.remaining
+    return (min(connect_timeout, remaining) if connect_timeout is not None else remaining,
+            min(read_timeout, remaining) if read_timeout is not None else remaining)
+
+
+class Backoff(object):
+    """
+    Exponentially growing intervals between attempts
+    """
+
+    def __init__(self, initial: float, maximum: float, factor: float = 2.0):
+        """
+        :param initial: interval after the first attempt in seconds
+        :param maximum: maximum interval in seconds
+        :param factor: growth of the interval per attempt
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+
+    def interval(self, attempt: int) -> float:
+        """
+        :param attempt: the number of the attempt that just finished, starting at 1
+        :return: seconds to wait before the next attempt
+        """
+        return min(self.initial * self.factor ** (attempt - 1), self.maximum)
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the rate of requests of all threads sharing it
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        :param rate: requests per second
+        :param burst: number of requests that may be executed at once after a period of inactivity
+        """
+        if rate <= 0:
+            raise ValueError("Rate must be positive: {}".format(rate))
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        """
+        Blocks until a request may be executed
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # reserve a token, possibly one that becomes available in the future
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def retry_after(response) -> float or None:
+    """
+    :param response: a (failed) response
+    :return: seconds the server asked to wait before the next attempt, either using the Retry-After header
+             (seconds or a http date) or an "interval" field in the json body, None if there is none
+    """
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            LOGGER.debug("Ignoring invalid Retry-After header: {}".format(value))
+
+    try:
+        body = codec.loads(response.content) if response.content else None
+    except ValueError:
+        return None
+    if isinstance(body, dict) and isinstance(body.get("interval"), (int, float)):
+        return max(0.0, float(body["interval"]))
+    return None
+
+
+def endpoint_group(url: str) -> str:
+    """
+    :param url: the request url
+    :return: the group of endpoints the url belongs to, f.ex. "api.tech26.de/api/smrt"
+    """
+    parsed = urlparse(url)
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    return "/".join([parsed.netloc] + segments[:2])
+
+
+class CircuitBreaker(object):
+    """
+    Fails fast after a number of consecutive failures and probes for recovery after a cool down period
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        :param name: name used in errors and log messages
+        :param failure_threshold: consecutive failures opening the circuit
+        :param reset_timeout: seconds until a probe request is let through an open circuit
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return STATE_CLOSED
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return STATE_HALF_OPEN
+        return STATE_OPEN
+
+    def before_request(self):
+        """
+        Must be called before every request
+
+        :raises CircuitOpenError: if the circuit is open or another probe request is in progress
+        """
+        with self._lock:
+            state = self._state()
+            if state == STATE_CLOSED:
+                return
+            if state == STATE_HALF_OPEN and not self._probing:
+                # let a single request through to check if the upstream has recovered
+                self._probing = True
+                return
+        raise CircuitOpenError("Circuit for {} is open after {} consecutive failures".format(
+            self.name, self._failures))
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                LOGGER.info("Circuit for {} closed".format(self.name))
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_aborted(self):
+        """
+        Must be called if a request neither succeeded nor failed, f.ex. it was interrupted,
+        so a probe request doesn't keep the circuit open forever
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+                if self._opened_at is None:
+                    LOGGER.warning("Circuit for {} opened after {} consecutive failures".format(
+                        self.name, self._failures))
+                # (re)start the cool down period
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+class CircuitBreakers(object):
+    """
+    Circuit breakers per endpoint group, created on first use
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        """
+        :param url: the request url
+        :return: the circuit breaker of the endpoint group of the url
+        """
+        group = endpoint_group(url)
+        with self._lock:
+            breaker = self._breakers.get(group)
+            if breaker is None:
+                breaker = CircuitBreaker(group, self.failure_threshold, self.reset_timeout)
+                self._breakers[group] = breaker
+            return breaker
+
+    def states(self) -> dict:
+        """
+        :return: the state of every endpoint group used so far
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.state for breaker in breakers}
@@ -0,0 +1,263 @@
+"""
+Rules engine raising alerts for transactions as returned by Api.get_transactions(),
+f.ex. "more than 500 EUR spent in category X within 24 hours" or "incoming transfer from IBAN Y".
+
+Rules are indexed by the values of the fields they match on, so evaluating a transaction only touches
+the rules that actually match it. Window aggregates are maintained incrementally.
+"""
+from collections import deque, OrderedDict
+
+from n26.const import AMOUNT, CURRENCY
+from n26.models import ID, VISIBLE_TS, TYPE, CATEGORY, PARTNER_IBAN, _to_cents
+
+DIRECTION_INCOMING = "incoming"
+DIRECTION_OUTGOING = "outgoing"
+DIRECTIONS = [DIRECTION_INCOMING, DIRECTION_OUTGOING]
+
+AGGREGATE_SUM = "sum"
+AGGREGATE_COUNT = "count"
+AGGREGATES = [AGGREGATE_SUM, AGGREGATE_COUNT]
+
+# transaction fields rules can match on, mapped to the name of the Rule attribute
+MATCH_FIELDS = OrderedDict([
+    (CATEGORY, "category"),
+    (TYPE, "type"),
+    (PARTNER_IBAN, "partner_iban"),
+    (CURRENCY, "currency"),
+])
+
+# number of transaction ids remembered to ignore transactions processed before
+MAX_SEEN_TRANSACTIONS = 100000
+
+
+def _normalize(field: str, value: str or None) -> str or None:
+    if field == PARTNER_IBAN and value:
+        return value.replace(" ", "").upper()
+    return value
+
+
+class Rule(object):
+    """
+    A rule matching transactions by exact field values, direction and (aggregated) amount
+    """
+
+    def __init__(self, name: str, category: str = None, type: str = None, partner_iban: str = None,
+                 currency: str = None, direction: str = None, threshold: float = None, window: float = None,
+                 aggregate: str = AGGREGATE_SUM):
+        """
+        :param name: name of the rule, used in alerts
+        :param category: category of matching transactions
+        :param type: type of matching transactions, f.ex. n26.const.INCOMING_TRANSFER
+        :param partner_iban: partner iban of matching transactions
+        :param currency: currency of matching transactions
+        :param direction: DIRECTION_INCOMING or DIRECTION_OUTGOING to only match on positive or negative amounts
+        :param threshold: only raise an alert if the aggregate exceeds this value,
+                          the absolute amount in sum aggregates and the number of transactions in count aggregates
+        :param window: time window in seconds to aggregate matching transactions over,
+                       without a window every matching transaction is evaluated on its own
+        :param aggregate: AGGREGATE_SUM or AGGREGATE_COUNT
+        """
+        if direction is not None and direction not in DIRECTIONS:
+            raise ValueError("Unsupported direction: {}".format(direction))
+        if aggregate not in AGGREGATES:
+            raise ValueError("Unsupported aggregate: {}".format(aggregate))
+        if window is not None and window <= 0:
+            raise ValueError("Window must be positive: {}".format(window))
+        if window is not None and threshold is None:
+            raise ValueError("A threshold is required for rules with a window")
+
+        self.name = name
+        self.category = category
+        self.type = type
+        self.partner_iban = _normalize(PARTNER_IBAN, partner_iban)
+        self.currency = currency
+        self.direction = direction
+        self.threshold = threshold
+        self.window = window
+        self.aggregate = aggregate
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Rule':
+        """
+        :param data: dict using the parameter names of the constructor as keys
+        :return: the rule
+        """
+        return cls(**data)
+
+    @property
+    def match_fields(self) -> tuple:
+        """
+        :return: the transaction fields this rule matches on
+        """
+        return tuple(field for field, attribute in MATCH_FIELDS.items() if getattr(self, attribute) is not None)
+
+    @property
+    def match_values(self) -> tuple:
+        return tuple(getattr(self, MATCH_FIELDS[field]) for field in self.match_fields)
+
+    @property
+    def threshold_value(self) -> int or None:
+        """
+        :return: the threshold in the unit of the aggregate (cents for sums)
+        """
+        if self.threshold is None:
+            return None
+        return _to_cents(self.threshold) if self.aggregate == AGGREGATE_SUM else self.threshold
+
+    def __repr__(self):
+        return "Rule({!r})".format(self.name)
+
+
+class Alert(object):
+    """
+    Raised by a rule for a transaction
+    """
+
+    def __init__(self, rule: Rule, transaction: dict, value: int):
+        """
+        :param rule: the rule raising the alert
+        :param transaction: the transaction triggering the alert
+        :param value: the value of the aggregate, in cents for sums
+        """
+        self.rule = rule
+        self.transaction = transaction
+        self.value = value
+
+    @property
+    def amount(self) -> float or int:
+        """
+        :return: the value of the aggregate, in the currency unit for sums
+        """
+        return self.value / 100 if self.rule.aggregate == AGGREGATE_SUM else self.value
+
+    def __repr__(self):
+        return "Alert({!r}, {!r}, {})".format(self.rule.name, self.transaction.get(ID), self.amount)
+
+
+class _Window(object):
+    """
+    Sliding window aggregate of a single rule
+    """
+
+    __slots__ = ('length', 'entries', 'total', 'triggered')
+
+    def __init__(self, length: int):
+        self.length = length
+        self.entries = deque()
+        self.total = 0
+        self.triggered = False
+
+    def add(self, timestamp: int, value: int) -> int:
+        """
+        :param timestamp: the timestamp in milliseconds, must not be older than previously added timestamps
+        :param value: the value to add
+        :return: the aggregate of the window ending at the given timestamp
+        """
+        self.entries.append((timestamp, value))
+        self.total += value
+        cutoff = timestamp - self.length
+        entries = self.entries
+        while entries[0][0] <= cutoff:
+            self.total -= entries.popleft()[1]
+        return self.total
+
+
+class RulesEngine(object):
+    """
+    Evaluates many rules incrementally against a stream of transactions.
+
+    Transactions must be processed in ascending order of their visibleTS (process_all() sorts them).
+    Transactions that have been processed before (by id) are ignored, so the same engine can be fed
+    with overlapping results of repeated get_transactions() calls.
+    """
+
+    def __init__(self, rules: list = None):
+        """
+        :param rules: initial rules
+        """
+        # match fields -> match values -> rules
+        self._indexes = OrderedDict()
+        self._windows = {}
+        self._seen = OrderedDict()
+        self._rule_count = 0
+        for rule in rules or []:
+            self.add_rule(rule)
+
+    @classmethod
+    def from_dicts(cls, rules: list) -> 'RulesEngine':
+        """
+        :param rules: list of rule definitions, see Rule.from_dict()
+        :return: the engine
+        """
+        return cls([Rule.from_dict(rule) for rule in rules])
+
+    def add_rule(self, rule: Rule):
+        """
+        :param rule: the rule to add
+        """
+        index = self._indexes.setdefault(rule.match_fields, {})
+        index.setdefault(rule.match_values, []).append(rule)
+        if rule.window is not None:
+            self._windows[id(rule)] = _Window(int(rule.window * 1000))
+        self._rule_count += 1
+
+    def __len__(self):
+        return self._rule_count
+
+    def _candidates(self, transaction: dict):
+        for fields, index in self._indexes.items():
+            rules = index.get(tuple(_normalize(field, transaction.get(field)) for field in fields))
+            if rules:
+                yield from rules
+
+    def process(self, transaction: dict) -> list:
+        """
+        Evaluates all rules for a single transaction
+
+        :param transaction: the transaction
+        :return: list of raised alerts
+        """
+        transaction_id = transaction.get(ID)
+        if transaction_id is not None:
+            if transaction_id in self._seen:
+                return []
+            self._seen[transaction_id] = None
+            if len(self._seen) > MAX_SEEN_TRANSACTIONS:
+                self._seen.popitem(last=False)
+
+        amount = _to_cents(transaction.get(AMOUNT))
+        timestamp = transaction.get(VISIBLE_TS) or 0
+        alerts = []
+        for rule in self._candidates(transaction):
+            if rule.direction == DIRECTION_INCOMING and amount <= 0:
+                continue
+            if rule.direction == DIRECTION_OUTGOING and amount >= 0:
+                continue
+
+            value = abs(amount) if rule.aggregate == AGGREGATE_SUM else 1
+            threshold = rule.threshold_value
+            window = self._windows.get(id(rule))
+            if window is None:
+                if threshold is None or value > threshold:
+                    alerts.append(Alert(rule, transaction, value))
+                continue
+
+            total = window.add(timestamp, value)
+            exceeded = threshold is None or total > threshold
+            # only alert when the threshold is crossed, not for every following transaction
+            if exceeded and not window.triggered:
+                alerts.append(Alert(rule, transaction, total))
+            window.triggered = exceeded
+        return alerts
+
+    def process_all(self, transactions: list) -> list:
+        """
+        Evaluates all rules for the given transactions in order of their visibleTS
+
+        :param transactions: the transactions, f.ex. as returned by Api.get_transactions()
+        :return: list of raised alerts
+        """
+        alerts = []
+        for transaction in sorted(transactions, key=lambda t: t.get(VISIBLE_TS) or 0):
+            alerts.extend(self.process(transaction))
+        return alerts
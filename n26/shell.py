@@ -0,0 +1,119 @@
+import cmd
+import logging
+import shlex
+import time
+from pathlib import Path
+
+import click
+
+from n26.timing import format_duration
+
+try:
+    import readline
+except ImportError:  # pragma: no cover - not available on all platforms
+    readline = None
+
+LOGGER = logging.getLogger(__name__)
+
+HISTORY_FILE = "~/.n26_history"
+HISTORY_LENGTH = 1000
+
+
+class Shell(cmd.Cmd):
+    """
+    Interactive shell running the commands of a click group
+    """
+
+    intro = "N26 shell, type 'help' for a list of commands or 'exit' to leave."
+    prompt = "n26> "
+
+    def __init__(self, group: click.Group, run_command: callable, on_reload: callable = None,
+                 history_file: str or Path or None = HISTORY_FILE, **kwargs):
+        """
+        :param group: the click group providing the commands
+        :param run_command: function executing a list of command line arguments
+        :param on_reload: function dropping cached data when the "reload" command is used
+        :param history_file: file to store the command history in, None disables the history
+        """
+        super().__init__(**kwargs)
+        self.group = group
+        self.run_command = run_command
+        self.on_reload = on_reload
+        self.history_file = None if history_file is None else Path(history_file).expanduser()
+
+    def _command_names(self) -> list:
+        return sorted(self.group.list_commands(click.Context(self.group))) + ["exit", "help", "reload"]
+
+    def preloop(self):
+        if readline is not None and self.history_file is not None:
+            try:
+                readline.read_history_file(str(self.history_file))
+            except OSError:
+                pass
+            readline.set_history_length(HISTORY_LENGTH)
+        if readline is not None:
+            # command names and options contain dashes
+            readline.set_completer_delims(" \t\n")
+
+    def postloop(self):
+        if readline is not None and self.history_file is not None:
+            try:
+                readline.write_history_file(str(self.history_file))
+            except OSError as e:
+                LOGGER.debug("Unable to write shell history: {}".format(e))
+
+    def emptyline(self):
+        # don't repeat the last command
+        return False
+
+    def default(self, line: str):
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            click.echo("Error: {}".format(e), err=True)
+            return False
+
+        start = time.perf_counter()
+        self.run_command(args)
+        click.echo(click.style("({})".format(format_duration(time.perf_counter() - start)), dim=True), err=True)
+        return False
+
+    def do_help(self, arg: str):
+        """Show help for all commands or a single command"""
+        self.default("{} --help".format(arg) if arg else "--help")
+
+    def do_reload(self, arg: str):
+        """Drop cached reference data like cards and categories"""
+        if self.on_reload is not None:
+            self.on_reload()
+
+    def do_exit(self, arg: str):
+        """Leave the shell"""
+        return True
+
+    def do_EOF(self, arg: str):
+        click.echo()
+        return True
+
+    def completenames(self, text: str, *ignored) -> list:
+        return [name for name in self._command_names() if name.startswith(text)]
+
+    def completedefault(self, text: str, line: str, begidx: int, endidx: int) -> list:
+        args = line[:begidx].split()
+        name = next((arg for arg in args if not arg.startswith("-")), None)
+        if name is None:
+            # only global options so far, f.ex. "-json <tab>"
+            return self.completenames(text)
+        command = self.group.commands.get(name)
+        if command is None:
+            return []
+
+        options = [param for param in command.params if isinstance(param, click.Option)]
+        # complete the choices of the preceding option, f.ex. "statistics --by <tab>"
+        for option in options:
+            if args[-1] in option.opts:
+                choices = getattr(option.type, "choices", None) or []
+                return [choice for choice in choices if choice.startswith(text)]
+
+        names = [name for option in options for name in option.opts + option.secondary_opts] + ["--help"]
+        return [name for name in names if name.startswith(text)]
@@ -0,0 +1,83 @@
+import threading
+from copy import deepcopy
+
+
+class _Call(object):
+    """
+    An in-flight call shared by all callers using the same key
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Deduplicates concurrent calls with the same key.
+
+    While a call for a given key is in flight, additional callers using the same key
+    do not execute the function themselves but wait for the in-flight call and receive
+    a copy of its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._total = 0
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, func: callable):
+        """
+        Executes the given function unless a call with the same key is already in flight
+
+        :param key: hashable key identifying the call
+        :param func: function without parameters to execute
+        :return: the result of the function
+        """
+        with self._lock:
+            self._total += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return deepcopy(call.result)
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            call.done.set()
+
+        # keep the shared result untouched while other callers copy it
+        return deepcopy(call.result) if waiters > 0 else call.result
+
+    def stats(self) -> dict:
+        """
+        :return: the number of calls, actual executions and coalesced calls
+        """
+        with self._lock:
+            return {
+                "calls": self._total,
+                "executed": self._executed,
+                "coalesced": self._coalesced,
+            }
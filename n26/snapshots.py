@@ -0,0 +1,329 @@
+"""
+Compact, append-only store for periodic snapshots of the account and space balances.
+
+Every sample is a fixed-width binary record (seconds since 1970, series number, balance in cents) appended to
+a data file, so a year of per-minute samples of a single series takes about 5 MB. The ids and names of the
+series (the account and each space) are kept in a small index file next to it, one json line per series,
+the line number being the series number.
+
+Records are appended in chronological order, range queries therefore use a binary search on the
+memory mapped data file and only decode the records within the range.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+from n26 import codec
+from n26.filelock import FileLock
+from n26.models import _to_cents
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_DIRECTORY = "~/.config/n26/snapshots/"
+
+DATA_FILE = "snapshots.dat"
+INDEX_FILE = "snapshots.idx"
+LOCK_FILE = "snapshots.lock"
+
+MAGIC = b"N26S"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+# seconds since 1970, series number, balance in cents
+RECORD = struct.Struct("<IHi")
+_TIMESTAMP = struct.Struct("<I")
+
+MIN_CENTS = -2 ** 31
+MAX_CENTS = 2 ** 31 - 1
+MAX_SERIES = 2 ** 16
+
+AGGREGATE_LAST = "last"
+AGGREGATE_MIN = "min"
+AGGREGATE_MAX = "max"
+AGGREGATE_MEAN = "mean"
+
+# bucket sizes in seconds for downsampling
+RESOLUTIONS = {
+    "minute": 60,
+    "hour": 60 * 60,
+    "day": 24 * 60 * 60,
+    "week": 7 * 24 * 60 * 60,
+}
+
+AGGREGATES = {
+    AGGREGATE_LAST: lambda values: values[-1],
+    AGGREGATE_MIN: min,
+    AGGREGATE_MAX: max,
+    AGGREGATE_MEAN: lambda values: round(sum(values) / len(values)),
+}
+
+
+def account_series(account_id: str) -> str:
+    """
+    :param account_id: id of the account
+    :return: the series id of the account balance
+    """
+    return "account/{}".format(account_id)
+
+
+def space_series(space_id: str) -> str:
+    """
+    :param space_id: id of the space
+    :return: the series id of the space balance
+    """
+    return "space/{}".format(space_id)
+
+
+class Snapshot(object):
+    """
+    A single sample of a series
+    """
+    __slots__ = ("timestamp", "series", "balance_cents")
+
+    def __init__(self, timestamp: int, series: str, balance_cents: int):
+        """
+        :param timestamp: milliseconds since 1970, with a precision of seconds
+        :param series: the series id
+        :param balance_cents: the balance in cents
+        """
+        self.timestamp = timestamp
+        self.series = series
+        self.balance_cents = balance_cents
+
+    @property
+    def balance(self) -> float:
+        return self.balance_cents / 100
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "series": self.series,
+            "balance": self.balance,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, Snapshot):
+            return NotImplemented
+        return (self.timestamp, self.series, self.balance_cents) == \
+               (other.timestamp, other.series, other.balance_cents)
+
+    def __repr__(self):
+        return "Snapshot({}, {!r}, {})".format(self.timestamp, self.series, self.balance_cents)
+
+
+class SnapshotStore(object):
+    """
+    Append-only snapshot files in a directory, safe to be used by multiple processes
+    """
+
+    def __init__(self, directory: str or Path = None):
+        """
+        :param directory: directory of the snapshot files, it is created if necessary
+        """
+        self.directory = Path(directory or DEFAULT_DIRECTORY).expanduser()
+        self.data_path = self.directory / DATA_FILE
+        self.index_path = self.directory / INDEX_FILE
+        self._lock = FileLock(self.directory / LOCK_FILE)
+        self._series = []
+        self._numbers = {}
+
+    def _load_index(self):
+        """
+        Reads series that have been added (by another process) since the last time
+        """
+        try:
+            with self.index_path.open("rb") as file:
+                # the last line is incomplete while another process is adding a series
+                lines = file.read().split(b"\n")[:-1]
+        except FileNotFoundError:
+            return
+        for line in lines[len(self._series):]:
+            entry = codec.loads(line)
+            self._numbers[entry["id"]] = len(self._series)
+            self._series.append(entry)
+
+    def series(self) -> list:
+        """
+        :return: all series as dicts with "id" and "name" in the order they have been added
+        """
+        self._load_index()
+        return [dict(entry) for entry in self._series]
+
+    def _series_number(self, series: str, name: str or None) -> int:
+        """
+        :return: the number of the series, the series is added to the index if necessary (requires the lock)
+        """
+        number = self._numbers.get(series)
+        if number is not None:
+            return number
+        if len(self._series) >= MAX_SERIES:
+            raise ValueError("Too many series: {}".format(len(self._series)))
+
+        entry = {"id": series, "name": name}
+        with self.index_path.open("ab") as file:
+            file.write(codec.dumps(entry).encode('utf-8') + b"\n")
+        self._numbers[series] = len(self._series)
+        self._series.append(entry)
+        return self._numbers[series]
+
+    def _open_data_file(self):
+        """
+        :return: the data file opened for appending, positioned after the last complete record (requires the lock)
+        """
+        file = open(str(self.data_path), "a+b")
+        size = file.seek(0, os.SEEK_END)
+        if size == 0:
+            file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            return file
+
+        file.seek(0)
+        self._check_header(file.read(HEADER.size))
+        complete = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+        if complete != size:
+            # an interrupted write left a partial record behind
+            LOGGER.warning("Dropping {} bytes of an incomplete record in {}".format(size - complete, self.data_path))
+            file.truncate(complete)
+        file.seek(complete)
+        return file
+
+    def _check_header(self, header: bytes):
+        if len(header) < HEADER.size:
+            raise ValueError("Invalid snapshot file: {}".format(self.data_path))
+        magic, version, record_size = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("Unsupported snapshot file: {}".format(self.data_path))
+
+    def append(self, balances: dict, timestamp: int = None, names: dict = None):
+        """
+        Appends one sample per series, all taken at the same time
+
+        :param balances: balance in cents by series id
+        :param timestamp: time of the samples in milliseconds since 1970, defaults to now
+        :param names: optional display names by series id, only used for new series
+        :raises ValueError: if the samples are older than the last ones, or a balance exceeds the record format
+        """
+        seconds = int((time.time() * 1000 if timestamp is None else timestamp) // 1000)
+        names = names or {}
+        for series, cents in balances.items():
+            if not MIN_CENTS <= cents <= MAX_CENTS:
+                raise ValueError("Balance of {} out of range: {}".format(series, cents))
+
+        self.directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+        with self._lock:
+            self._load_index()
+            with self._open_data_file() as file:
+                position = file.tell()
+                if position > HEADER.size:
+                    file.seek(position - RECORD.size)
+                    last = RECORD.unpack(file.read(RECORD.size))[0]
+                    if seconds < last:
+                        raise ValueError("Snapshots must be appended in chronological order")
+
+                records = b"".join(
+                    RECORD.pack(seconds, self._series_number(series, names.get(series)), cents)
+                    for series, cents in balances.items())
+                file.write(records)
+
+    def record(self, balance: dict, spaces: list, timestamp: int = None) -> int:
+        """
+        Appends the balances of the account and all spaces
+
+        :param balance: the account balance as returned by Api.get_balance()
+        :param spaces: the spaces as returned by Api.get_spaces()["spaces"]
+        :param timestamp: time of the samples in milliseconds since 1970, defaults to now
+        :return: the number of samples
+        """
+        balances = {account_series(balance["id"]): _to_cents(balance.get("availableBalance"))}
+        names = {account_series(balance["id"]): balance.get("iban")}
+        for space in spaces:
+            series = space_series(space["id"])
+            balances[series] = _to_cents(space.get("balance", {}).get("availableBalance"))
+            names[series] = space.get("name")
+        self.append(balances, timestamp=timestamp, names=names)
+        return len(balances)
+
+    def __len__(self):
+        try:
+            size = self.data_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+        return max(0, size - HEADER.size) // RECORD.size
+
+    def query(self, from_time: int = None, to_time: int = None, series: str = None) -> list:
+        """
+        :param from_time: milliseconds since 1970 (inclusive), None starts with the first sample
+        :param to_time: milliseconds since 1970 (inclusive), None ends with the last sample
+        :param series: only return samples of this series id
+        :return: list of snapshots in chronological order
+        """
+        self._load_index()
+        if series is not None and series not in self._numbers:
+            return []
+        number = self._numbers.get(series)
+
+        try:
+            file = open(str(self.data_path), "rb")
+        except FileNotFoundError:
+            return []
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            count = max(0, size - HEADER.size) // RECORD.size
+            if count == 0:
+                return []
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._check_header(data[:HEADER.size])
+                start = 0 if from_time is None else _bisect(data, count, from_time // 1000)
+                end = count if to_time is None else _bisect(data, count, to_time // 1000 + 1)
+                if start >= end:
+                    return []
+                records = RECORD.iter_unpack(data[HEADER.size + start * RECORD.size:HEADER.size + end * RECORD.size])
+
+                # series are added to the index before their first record, reloading it after mapping the data
+                # makes sure it contains all series even if new ones have been appended since the first load
+                self._load_index()
+                ids = [entry["id"] for entry in self._series]
+                return [Snapshot(seconds * 1000, ids[record_series], cents)
+                        for seconds, record_series, cents in records
+                        if number is None or record_series == number]
+
+    def downsample(self, resolution: int, from_time: int = None, to_time: int = None, series: str = None,
+                   aggregate: str = AGGREGATE_LAST) -> list:
+        """
+        Reduces the samples to one per series and time bucket
+
+        :param resolution: size of the time buckets in seconds
+        :param from_time: milliseconds since 1970 (inclusive)
+        :param to_time: milliseconds since 1970 (inclusive)
+        :param series: only return samples of this series id
+        :param aggregate: one of the AGGREGATE_* functions used to combine the balances of a bucket
+        :return: list of snapshots in chronological order, the timestamp being the start of the bucket
+        """
+        if resolution <= 0:
+            raise ValueError("Resolution must be positive: {}".format(resolution))
+        function = AGGREGATES.get(aggregate)
+        if function is None:
+            raise ValueError("Unsupported aggregate: {}".format(aggregate))
+
+        bucket_size = resolution * 1000
+        buckets = {}
+        for snapshot in self.query(from_time, to_time, series):
+            key = (snapshot.timestamp - snapshot.timestamp % bucket_size, snapshot.series)
+            buckets.setdefault(key, []).append(snapshot.balance_cents)
+        # dicts keep the insertion order, which is chronological
+        return [Snapshot(bucket, series_id, function(values)) for (bucket, series_id), values in buckets.items()]
+
+
+def _bisect(data: mmap.mmap, count: int, seconds: int) -> int:
+    """
+    :return: the index of the first record at or after the given time
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if _TIMESTAMP.unpack_from(data, HEADER.size + middle * RECORD.size)[0] < seconds:
+            low = middle + 1
+        else:
+            high = middle
+    return low
@@ -0,0 +1,120 @@
+"""
+Incremental decoding of JSON arrays.
+
+List endpoints (f.ex. transactions) can return thousands of records. Instead of reading the whole body
+and parsing it at once, iter_json_array() decodes the elements of the top level array one at a time
+while the body is still being received, so only a single record (and the undecoded rest of the
+current chunk) is held in memory.
+"""
+import codecs
+import json
+import logging
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+# bytes read from the response at once
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+_DELIMITER = re.compile(r"[\s,\]]")
+# first characters of elements raw_decode() only returns once they are complete
+_CONTAINER_START = "{[\""
+_DECODER = json.JSONDecoder()
+
+_EXPECT_START = 0
+_EXPECT_FIRST = 1
+_EXPECT_VALUE = 2
+_EXPECT_SEPARATOR = 3
+
+
+def project(record: dict, fields: list or tuple or None) -> dict:
+    """
+    :param record: a decoded record
+    :param fields: the keys to keep, None keeps all
+    :return: the record reduced to the given keys (keys missing in the record are omitted)
+    """
+    if fields is None or not isinstance(record, dict):
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+
+def _decode(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError("Invalid JSON array: {}".format(e))
+
+
+def iter_json_array(chunks, fields: list or tuple = None):
+    """
+    Decodes the elements of a JSON array from a stream of chunks
+
+    :param chunks: iterable of bytes (utf-8) or str chunks, f.ex. response.iter_content()
+    :param fields: optional keys to keep of every (object) element, all others are dropped right away
+    :return: generator of the decoded elements
+    :raises ValueError: if the document is not a valid JSON array
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    position = 0
+    eof = False
+    # what is allowed at the current position
+    expected = _EXPECT_START
+    # length of the pending text at the last failed attempt to decode an element, retrying only once it has
+    # doubled keeps the number of attempts for elements spread over many chunks logarithmic
+    retry_at = 0
+
+    while True:
+        while position < len(buffer) and buffer[position] in _WHITESPACE:
+            position += 1
+        pending = len(buffer) - position
+        if not eof and (pending == 0 or pending < retry_at):
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                chunk = decoder.decode(b"", final=True)
+            elif not isinstance(chunk, str):
+                chunk = decoder.decode(chunk)
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if pending == 0:
+            raise ValueError("Unexpected end of JSON array")
+
+        char = buffer[position]
+        if expected == _EXPECT_START:
+            if char != "[":
+                raise ValueError("Expected a JSON array, got: {!r}".format(buffer[position:position + 20]))
+            expected = _EXPECT_FIRST
+            position += 1
+        elif expected == _EXPECT_SEPARATOR or (expected == _EXPECT_FIRST and char == "]"):
+            if char == "]":
+                return
+            if char != ",":
+                raise ValueError("Expected ',' or ']' in JSON array, got: {!r}".format(char))
+            expected = _EXPECT_VALUE
+            position += 1
+        else:
+            if char not in _CONTAINER_START:
+                # a number or literal is only complete once it is followed by a delimiter
+                end = _DELIMITER.search(buffer, position)
+                if end is None and not eof:
+                    retry_at = pending + 1
+                    continue
+                end = end.start() if end is not None else len(buffer)
+                element = _decode(buffer[position:end])
+            else:
+                try:
+                    element, end = _DECODER.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise ValueError("Invalid JSON array: {}".format(e))
+                    retry_at = 2 * pending
+                    continue
+
+            retry_at = 0
+            expected = _EXPECT_SEPARATOR
+            position = end
+            yield project(element, fields)
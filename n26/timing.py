@@ -0,0 +1,106 @@
+"""
+Lightweight instrumentation to find out where time is spent, f.ex. when running a CLI command with --timings.
+
+Phases are measured using the timed() context manager. Nothing is recorded unless TIMINGS.enabled is set,
+so the instrumentation can stay in place without any measurable overhead.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Timings(object):
+    """
+    Records the duration of (possibly nested) phases.
+    For every record the self time, i.e. the duration without nested phases of the same thread, is tracked too.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._records = []
+
+    @contextmanager
+    def timed(self, name: str):
+        """
+        Measures the duration of the wrapped block
+
+        :param name: name of the phase
+        """
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # accumulates the duration of nested phases
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += duration
+            self.add(name, duration, duration - nested)
+
+    def add(self, name: str, duration: float, self_duration: float = None):
+        """
+        Adds a record measured elsewhere
+
+        :param name: name of the phase
+        :param duration: duration in seconds
+        :param self_duration: duration without nested phases in seconds, defaults to the duration
+        """
+        with self._lock:
+            self._records.append((name, duration, duration if self_duration is None else self_duration))
+
+    def records(self) -> list:
+        """
+        :return: list of (name, duration, self duration) tuples in order of completion
+        """
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> list:
+        """
+        :return: list of (name, count, total duration, total self duration) tuples in order of first completion
+        """
+        summary = {}
+        for name, duration, self_duration in self.records():
+            count, total, total_self = summary.get(name, (0, 0.0, 0.0))
+            summary[name] = (count + 1, total + duration, total_self + self_duration)
+        return [(name,) + values for name, values in summary.items()]
+
+    def clear(self):
+        with self._lock:
+            self._records = []
+
+
+TIMINGS = Timings()
+
+
+def timed(name: str):
+    """
+    Measures the duration of the wrapped block using the global TIMINGS recorder
+
+    :param name: name of the phase
+    """
+    return TIMINGS.timed(name)
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 1:
+        return "{:.2f} s".format(seconds)
+    return "{:.1f} ms".format(seconds * 1000)
+
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+    return "{:.1f} GiB".format(size)
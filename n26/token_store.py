@@ -0,0 +1,516 @@
+"""
+Token stores persist the authentication token data of the Api client.
+
+All stores cache reads where possible, support compare-and-swap updates and provide a lock
+that is used to make sure only one client refreshes the token at a time.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse
+
+from n26 import codec
+from n26.config import TOKEN_STORE_MEMORY, TOKEN_STORE_FILE, TOKEN_STORE_SQLITE, TOKEN_STORE_REDIS, \
+    TOKEN_STORE_AGENT
+from n26.filelock import FileLock, POLL_INTERVAL
+
+LOGGER = logging.getLogger(__name__)
+
+
+def read_token_file(path: str or Path) -> dict:
+    """
+    :return: the token data stored in the given file or an empty dict
+    """
+    LOGGER.debug("Reading token data from {}".format(path))
+    path = Path(path).expanduser().resolve()
+    if not path.exists():
+        return {}
+
+    if not path.is_file():
+        raise IsADirectoryError("File path exists and is not a file: {}".format(path))
+
+    if path.stat().st_size <= 0:
+        # file is empty
+        return {}
+
+    with open(path, "r") as file:
+        return codec.loads(file.read())
+
+
+def write_token_file(token_data: dict, path: str or Path):
+    """
+    Writes token data to the given file.
+    The data is written to a temporary file which is renamed afterwards to never expose
+    a partially written file to other processes.
+    """
+    LOGGER.debug("Writing token data to {}".format(path))
+    path = Path(path).expanduser().resolve()
+    path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+
+    file_descriptor, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=".{}.".format(path.name))
+    try:
+        with os.fdopen(file_descriptor, 'w') as file:
+            file.write(codec.dumps(token_data, indent=2))
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, str(path))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+class TokenStore(object):
+    """
+    Base class for all token stores
+    """
+
+    def read(self) -> dict:
+        """
+        :return: the stored token data or an empty dict
+        """
+        raise NotImplementedError()
+
+    def write(self, token_data: dict):
+        """
+        Replaces the stored token data
+
+        :param token_data: the new token data
+        """
+        raise NotImplementedError()
+
+    def compare_and_swap(self, expected: dict, token_data: dict) -> bool:
+        """
+        Replaces the stored token data only if it still equals the expected data
+
+        :param expected: the token data expected to be stored currently
+        :param token_data: the new token data
+        :return: True if the data has been replaced, False otherwise
+        """
+        with self.lock():
+            if self.read() != (expected or {}):
+                return False
+            self.write(token_data)
+            return True
+
+    def clear(self):
+        """
+        Removes the stored token data
+        """
+        self.write({})
+
+    def ensure_valid(self) -> bool:
+        """
+        Lets the store obtain valid token data on behalf of the client, f.ex. from an agent (see n26.agent)
+
+        :return: True if the store holds valid token data now,
+                 False if the client has to refresh or request a token itself
+        """
+        return False
+
+    def lock(self):
+        """
+        :return: a (reentrant) context manager serializing token refreshes of all clients using this store
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Stores token data in memory of the current process
+    """
+
+    def __init__(self):
+        self._token_data = {}
+        self._lock = threading.RLock()
+
+    def read(self) -> dict:
+        return self._token_data
+
+    def write(self, token_data: dict):
+        self._token_data = token_data
+
+    def lock(self):
+        return self._lock
+
+
+class FileTokenStore(TokenStore):
+    """
+    Stores token data in a JSON file.
+    The parsed content is cached until the file changes on disk.
+    """
+
+    def __init__(self, path: str or Path):
+        self.path = Path(path).expanduser().resolve()
+        self._lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._cache_lock = threading.Lock()
+        self._cache_key = None
+        self._cache = {}
+
+    def _stat_key(self) -> tuple or None:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def read(self) -> dict:
+        key = self._stat_key()
+        if key is None:
+            return {}
+        with self._cache_lock:
+            if key == self._cache_key:
+                return dict(self._cache)
+
+        token_data = read_token_file(self.path)
+        with self._cache_lock:
+            self._cache_key = key
+            self._cache = token_data
+        return dict(token_data)
+
+    def write(self, token_data: dict):
+        write_token_file(token_data, self.path)
+
+    def clear(self):
+        with self._lock:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def lock(self):
+        return self._lock
+
+
+# INSERT ... ON CONFLICT DO UPDATE requires SQLite 3.24
+SQLITE_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+
+class SqliteTokenStore(TokenStore):
+    """
+    Stores token data in a SQLite database which can be shared by multiple processes.
+    Reads are cached until another connection modifies the database.
+    """
+
+    def __init__(self, path: str or Path, key: str = "default"):
+        """
+        :param path: the database file
+        :param key: key of the token data within the database, allows storing multiple tokens in one database
+        """
+        self.path = Path(path).expanduser().resolve()
+        self.key = key
+        self.path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        self._lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        self._connection_lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+        os.chmod(str(self.path), 0o600)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS token_data "
+                                 "(key TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL)")
+        self._cached_data_version = None
+        self._cache = None
+
+    def _data_version(self) -> int:
+        # changes whenever another connection commits a change to the database
+        return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_row(self) -> tuple:
+        row = self._connection.execute("SELECT data, version FROM token_data WHERE key = ?", (self.key,)).fetchone()
+        if row is None:
+            return {}, 0
+        return codec.loads(row[0]), row[1]
+
+    def _upsert(self, token_data: dict):
+        """
+        Inserts or replaces the token data (requires the connection lock and a transaction)
+        """
+        data = codec.dumps(token_data)
+        if SQLITE_UPSERT:
+            self._connection.execute(
+                "INSERT INTO token_data (key, data, version) VALUES (?, ?, 1) "
+                "ON CONFLICT(key) DO UPDATE SET data = excluded.data, version = version + 1",
+                (self.key, data))
+        else:
+            self._connection.execute("UPDATE token_data SET data = ?, version = version + 1 WHERE key = ?",
+                                     (data, self.key))
+            self._connection.execute("INSERT OR IGNORE INTO token_data (key, data, version) VALUES (?, ?, 1)",
+                                     (self.key, data))
+
+    def read(self) -> dict:
+        with self._connection_lock:
+            data_version = self._data_version()
+            if self._cache is None or data_version != self._cached_data_version:
+                self._cache = self._read_row()
+                self._cached_data_version = data_version
+            return dict(self._cache[0])
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs a block in a write transaction which is rolled back if the block fails (requires the connection lock)
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        finally:
+            self._cache = None
+        self._connection.execute("COMMIT")
+
+    def write(self, token_data: dict):
+        with self._connection_lock, self._transaction():
+            self._upsert(token_data)
+
+    def compare_and_swap(self, expected: dict, token_data: dict) -> bool:
+        with self._connection_lock, self._transaction():
+            current, version = self._read_row()
+            if current != (expected or {}):
+                return False
+            self._upsert(token_data)
+            return True
+
+    def clear(self):
+        with self._connection_lock:
+            self._connection.execute("DELETE FROM token_data WHERE key = ?", (self.key,))
+            self._cache = None
+
+    def lock(self):
+        return self._lock
+
+    def close(self):
+        with self._connection_lock:
+            self._connection.close()
+
+
+class RedisError(Exception):
+    """
+    Error reply of a redis server
+    """
+    pass
+
+
+class _RedisConnection(object):
+    """
+    Minimal client for the redis protocol (RESP) over tcp or unix domain sockets
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        """
+        :param url: "redis://host:port/db" or "unix:///path/to/socket"
+        """
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(parsed.path)
+            db = None
+        elif parsed.scheme == "redis":
+            self._socket = socket.create_connection((parsed.hostname or "localhost", parsed.port or 6379), timeout)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            db = parsed.path.strip("/") or None
+        else:
+            raise ValueError("Unsupported redis url: {}".format(url))
+        self._reader = self._socket.makefile("rb")
+        if parsed.password:
+            self.execute("AUTH", parsed.password)
+        if db:
+            self.execute("SELECT", db)
+
+    def execute(self, *args):
+        command = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            value = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            command.append(b"$%d\r\n%s\r\n" % (len(value), value))
+        self._socket.sendall(b"".join(command))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection to redis server closed")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode('utf-8')
+        elif prefix == b"-":
+            raise RedisError(payload.decode('utf-8'))
+        elif prefix == b":":
+            return int(payload)
+        elif prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        elif prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError("Unexpected reply: {}".format(line))
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+
+# deletes a lock only if it is still held by the caller, it may have expired and been acquired by someone else
+RELEASE_LOCK_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then " \
+                      "return redis.call('DEL', KEYS[1]) else return 0 end"
+
+
+class RedisTokenStore(TokenStore):
+    """
+    Stores token data in a redis server (or anything else speaking the redis protocol)
+    so it can be shared by a fleet of workers.
+    Reads are cached locally for a short amount of time.
+    """
+
+    def __init__(self, url: str, key: str = "n26:token_data", cache_ttl: float = 1.0, lock_ttl: float = 60.0,
+                 lock_timeout: float = 120.0):
+        """
+        :param url: "redis://host:port/db" or "unix:///path/to/socket"
+        :param key: key of the token data
+        :param cache_ttl: time in seconds to cache read results locally
+        :param lock_ttl: time in seconds after which a lock is released automatically, f.ex. if its holder crashed
+        :param lock_timeout: maximum time to wait for the lock in seconds
+        """
+        self.url = url
+        self.key = key
+        self.cache_ttl = cache_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self._connection = None
+        self._connection_lock = threading.Lock()
+        self._local_lock = threading.RLock()
+        self._lock_depth = 0
+        self._cache = None
+        self._cache_time = 0
+
+    def _execute(self, *args):
+        with self._connection_lock:
+            if self._connection is None:
+                self._connection = _RedisConnection(self.url)
+            try:
+                return self._connection.execute(*args)
+            except (OSError, ConnectionError):
+                # reconnect on the next call
+                self._connection.close()
+                self._connection = None
+                raise
+
+    def read(self) -> dict:
+        now = time.monotonic()
+        if self._cache is not None and now - self._cache_time < self.cache_ttl:
+            return dict(self._cache)
+
+        value = self._execute("GET", self.key)
+        self._cache = codec.loads(value) if value else {}
+        self._cache_time = now
+        return dict(self._cache)
+
+    def write(self, token_data: dict):
+        self._execute("SET", self.key, codec.dumps(token_data))
+        self._cache = None
+
+    def compare_and_swap(self, expected: dict, token_data: dict) -> bool:
+        with self._connection_lock:
+            if self._connection is None:
+                self._connection = _RedisConnection(self.url)
+            connection = self._connection
+            try:
+                connection.execute("WATCH", self.key)
+                current = connection.execute("GET", self.key)
+                current = codec.loads(current) if current else {}
+                if current != (expected or {}):
+                    connection.execute("UNWATCH")
+                    return False
+                connection.execute("MULTI")
+                connection.execute("SET", self.key, codec.dumps(token_data))
+                # EXEC returns None if the key has been modified since WATCH
+                result = connection.execute("EXEC")
+            except BaseException:
+                # the connection may be left in WATCH or MULTI state, reconnect on the next call
+                connection.close()
+                self._connection = None
+                raise
+        self._cache = None
+        return result is not None
+
+    def clear(self):
+        self._execute("DEL", self.key)
+        self._cache = None
+
+    @contextmanager
+    def lock(self):
+        with self._local_lock:
+            if self._lock_depth > 0:
+                # reentrant use within the same process
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            lock_key = self.key + ":lock"
+            lock_value = uuid.uuid4().hex
+            deadline = time.monotonic() + self.lock_timeout
+            while self._execute("SET", lock_key, lock_value, "NX", "PX", int(self.lock_ttl * 1000)) is None:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError("Unable to acquire lock {}".format(lock_key))
+                time.sleep(POLL_INTERVAL)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                self._execute("EVAL", RELEASE_LOCK_SCRIPT, 1, lock_key, lock_value)
+
+    def close(self):
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+def create_token_store(store_type: str or None, path: str or Path or None = None, url: str = None,
+                       agent_socket: str or Path = None) -> TokenStore:
+    """
+    Creates a token store
+
+    :param store_type: one of the TOKEN_STORE_* types,
+                       None selects a file store if a path is given and a memory store otherwise
+    :param path: file path for file and sqlite stores
+    :param url: url for redis stores
+    :param agent_socket: socket path for agent stores, defaults to n26.agent.DEFAULT_SOCKET_PATH
+    :return: the token store
+    """
+    if store_type is None:
+        store_type = TOKEN_STORE_FILE if path is not None else TOKEN_STORE_MEMORY
+
+    if store_type == TOKEN_STORE_MEMORY:
+        return MemoryTokenStore()
+    elif store_type in [TOKEN_STORE_FILE, TOKEN_STORE_SQLITE]:
+        if path is None:
+            raise ValueError("A login data store path is required for the '{}' token store".format(store_type))
+        return FileTokenStore(path) if store_type == TOKEN_STORE_FILE else SqliteTokenStore(path)
+    elif store_type == TOKEN_STORE_REDIS:
+        if not url:
+            raise ValueError("A token store url is required for the '{}' token store".format(store_type))
+        return RedisTokenStore(url)
+    elif store_type == TOKEN_STORE_AGENT:
+        # imported lazily since the agent depends on the Api client
+        from n26.agent import AgentTokenStore
+        return AgentTokenStore(agent_socket)
+    else:
+        raise ValueError("Unsupported token store: {}".format(store_type))
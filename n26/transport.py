@@ -0,0 +1,292 @@
+"""
+Transports execute the http requests of the Api client.
+
+HttpTransport talks to the N26 servers, RecordingTransport writes all request/response pairs
+of another transport to a cassette file and ReplayTransport serves them back without any network access.
+RateLimitedTransport limits the rate of requests of another transport.
+"""
+import base64
+import gzip
+import itertools
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests import HTTPError
+from requests.structures import CaseInsensitiveDict
+
+from n26 import codec
+from n26.resilience import RateLimiter
+
+LOGGER = logging.getLogger(__name__)
+
+GET = "get"
+POST = "post"
+
+# headers worth keeping in a cassette, everything else (f.ex. cookies) is dropped
+RECORDED_HEADERS = ["Content-Type", "Retry-After", "Date"]
+# authentication endpoints, their responses contain tokens and are never recorded
+UNRECORDED_PATHS = ["/oauth2/", "/api/mfa/"]
+
+
+def _stream_kwargs(stream: bool) -> dict:
+    """
+    :return: keyword arguments passing stream to another transport, it is only passed if set
+             to support transports predating streaming
+    """
+    return {"stream": True} if stream else {}
+
+
+class Transport(object):
+    """
+    Base class for all transports
+    """
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        """
+        Executes a http request
+
+        :param method: the http method (GET, POST)
+        :param url: the full url including query parameters
+        :param headers: request headers
+        :param json: request body to send as json
+        :param data: request body to send form encoded
+        :param timeout: timeout in seconds or a (connect, read) tuple, None waits forever
+        :param stream: don't read the body before returning, it is read using response.iter_content()
+        :return: a response object compatible with requests.Response
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Releases all resources held by this transport
+        """
+        pass
+
+
+class HttpTransport(Transport):
+    """
+    Executes requests using the requests library
+    """
+
+    def __init__(self, session: requests.Session = None):
+        """
+        :param session: optional session to use, f.ex. for connection pooling
+        """
+        self.session = session
+
+    @classmethod
+    def pooled(cls, pool_size: int = 10) -> 'HttpTransport':
+        """
+        Creates a transport reusing connections for all requests
+
+        :param pool_size: maximum number of connections kept open per host, should match the number of threads
+        :return: the transport
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return cls(session)
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        kwargs = {"headers": headers}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if json is not None:
+            kwargs["json"] = json
+        if data is not None:
+            kwargs["data"] = data
+        if stream:
+            kwargs["stream"] = True
+
+        client = self.session if self.session is not None else requests
+        if method == GET:
+            return client.get(url, **kwargs)
+        elif method == POST:
+            return client.post(url, **kwargs)
+        else:
+            raise ValueError("Unsupported method: {}".format(method))
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class RateLimitedTransport(Transport):
+    """
+    Delays the requests of another transport to not exceed the rate of a (shared) RateLimiter
+    """
+
+    def __init__(self, transport: Transport, limiter: RateLimiter):
+        """
+        :param transport: the transport to limit
+        :param limiter: the rate limiter, may be shared by many transports
+        """
+        self.transport = transport
+        self.limiter = limiter
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        self.limiter.acquire()
+        return self.transport.request(method, url, headers=headers, json=json, data=data, timeout=timeout,
+                                      **_stream_kwargs(stream))
+
+    def close(self):
+        self.transport.close()
+
+
+class RecordedResponse(object):
+    """
+    Response replayed from a cassette, implements the parts of requests.Response used by the Api client
+    """
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return codec.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            raise HTTPError("{} Error for url: {}".format(self.status_code, self.url), response=self)
+
+
+def _open_cassette(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(str(path), mode + "t", encoding="utf-8")
+    return open(str(path), mode, encoding="utf-8")
+
+
+def _encode_body(content: bytes) -> dict:
+    try:
+        return {"body": content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {"body_base64": base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(interaction: dict) -> bytes:
+    if "body_base64" in interaction:
+        return base64.b64decode(interaction["body_base64"])
+    return interaction.get("body", "").encode('utf-8')
+
+
+class RecordingTransport(Transport):
+    """
+    Records all request/response pairs of another transport to a cassette file.
+
+    A cassette is a (optionally gzip compressed if the path ends with ".gz") file
+    containing one JSON document per line, readable only by its owner. Request headers and bodies
+    as well as responses of authentication endpoints are never recorded since they contain credentials,
+    replay them using a token store with a (dummy) token.
+    """
+
+    def __init__(self, path: str or Path, transport: Transport = None):
+        """
+        :param path: the cassette file to append to
+        :param transport: the transport to record, defaults to a HttpTransport
+        """
+        self.path = Path(path).expanduser()
+        self.transport = transport or HttpTransport()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        os.close(os.open(str(self.path), os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(str(self.path), 0o600)
+        self._file = _open_cassette(self.path, "a")
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        start = time.perf_counter()
+        # recording reads the whole body, streamed responses are served from memory afterwards
+        response = self.transport.request(method, url, headers=headers, json=json, data=data, timeout=timeout,
+                                          **_stream_kwargs(stream))
+        elapsed = time.perf_counter() - start
+        if any(path in urlparse(url).path for path in UNRECORDED_PATHS):
+            return response
+
+        interaction = {
+            "method": method,
+            "url": url,
+            "status": response.status_code,
+            "headers": {key: response.headers[key] for key in RECORDED_HEADERS if key in response.headers},
+            "elapsed": round(elapsed, 6),
+        }
+        interaction.update(_encode_body(response.content or b""))
+        line = codec.dumps(interaction)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+        return response
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Serves responses from a cassette file written by a RecordingTransport.
+
+    Requests are matched by method and url. Multiple responses recorded for the same request
+    are served in recorded order, after the last one the sequence starts over (unless loop is False).
+    """
+
+    def __init__(self, path: str or Path, latency: float = 0.0, recorded_latency: bool = False,
+                 loop: bool = True):
+        """
+        :param path: the cassette file to read
+        :param latency: additional simulated latency per request in seconds
+        :param recorded_latency: simulate the latency measured when recording
+        :param loop: restart the sequence of responses for a request when exhausted
+        """
+        self.path = Path(path).expanduser()
+        self.latency = latency
+        self.recorded_latency = recorded_latency
+        self.loop = loop
+        self._lock = threading.Lock()
+        self._interactions = {}
+        with _open_cassette(self.path, "r") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                interaction = codec.loads(line)
+                self._interactions.setdefault((interaction["method"], interaction["url"]), []).append(interaction)
+        self._sequences = {
+            key: itertools.cycle(values) if loop else iter(values) for key, values in self._interactions.items()
+        }
+
+    def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                timeout: float or tuple = None, stream: bool = False):
+        key = (method, url)
+        with self._lock:
+            sequence = self._sequences.get(key)
+            interaction = next(sequence, None) if sequence is not None else None
+        if interaction is None:
+            raise ValueError("No recorded response for {} {}".format(method.upper(), url))
+
+        delay = self.latency + (interaction.get("elapsed", 0) if self.recorded_latency else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        return RecordedResponse(url, interaction["status"], interaction.get("headers", {}), _decode_body(interaction))
@@ -1,3 +1,9 @@
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from n26.iban import normalize_iban
+
+
 def create_request_url(url: str, params: dict = None):
     """
     Adds query params to the given url
@@ -23,3 +29,87 @@ def create_request_url(url: str, params: dict = None):
             url += "%s=%s" % (k, v)
 
     return url
+
+
+PERIOD_WEEK = "week"
+PERIOD_MONTH = "month"
+PERIOD_YEAR = "year"
+PERIODS = [PERIOD_WEEK, PERIOD_MONTH, PERIOD_YEAR]
+
+
+def _period_start(value: datetime, period: str) -> datetime:
+    """
+    :param value: a (naive local) datetime
+    :param period: the period type
+    :return: the start of the period containing the given datetime
+    """
+    start = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == PERIOD_WEEK:
+        return start - timedelta(days=start.weekday())
+    elif period == PERIOD_MONTH:
+        return start.replace(day=1)
+    elif period == PERIOD_YEAR:
+        return start.replace(month=1, day=1)
+    else:
+        raise ValueError("Unsupported period: {}".format(period))
+
+
+def _next_period_start(start: datetime, period: str) -> datetime:
+    if period == PERIOD_WEEK:
+        return start + timedelta(days=7)
+    elif period == PERIOD_MONTH:
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    else:
+        return start.replace(year=start.year + 1)
+
+
+def period_start(timestamp: int, period: str) -> int:
+    """
+    :param timestamp: milliseconds since 1970
+    :param period: one of PERIODS
+    :return: the start of the calendar period (in local time) containing the given timestamp in milliseconds
+    """
+    return int(_period_start(datetime.fromtimestamp(timestamp / 1000), period).timestamp() * 1000)
+
+
+def split_time_range(from_time: int, to_time: int, period: str) -> List[Tuple[int, int]]:
+    """
+    Splits a time range into calendar periods (in local time).
+    The first and last period are clipped to the given range.
+
+    :param from_time: start of the range - milliseconds since 1970
+    :param to_time: end of the range (inclusive) - milliseconds since 1970
+    :param period: one of PERIODS
+    :return: list of (from, to) tuples in milliseconds, "to" being inclusive
+    """
+    if period not in PERIODS:
+        raise ValueError("Unsupported period: {}".format(period))
+
+    result = []
+    start = _period_start(datetime.fromtimestamp(from_time / 1000), period)
+    while True:
+        next_start = _next_period_start(start, period)
+        period_from = max(int(start.timestamp() * 1000), from_time)
+        period_to = min(int(next_start.timestamp() * 1000) - 1, to_time)
+        if period_from > to_time:
+            break
+        result.append((period_from, period_to))
+        start = next_start
+
+    return result
+
+
+def normalize_partner_iban(iban: str or None) -> str or None:
+    """
+    :param iban: the IBAN of a transaction partner or contact, may be missing
+    :return: the IBAN in electronic format, None if there is none
+    """
+    return normalize_iban(iban) if iban else None
+
+
+def normalize_partner_name(name: str or None) -> str or None:
+    """
+    :param name: the name of a transaction partner or contact, may be missing
+    :return: the casefolded name with collapsed whitespace, None if there is none
+    """
+    return " ".join(name.casefold().split()) if name else None
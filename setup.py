@@ -39,6 +39,10 @@ setup(
     download_url='https://github.com/femueller/python-n26/tarball/{version}'.format(version=VERSION),
     version=VERSION,
     install_requires=read_requirements(),
+    extras_require={
+        'fast-json': ['orjson'],
+        'zstd': ['zstandard'],
+    },
     test_requires=['mock', 'pytest'],
     packages=[
         'n26'
@@ -0,0 +1,94 @@
+import os
+import stat
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from n26 import api
+from n26.agent import Agent, AgentClient, AgentError, AgentTokenStore, OP_READ, OP_STATUS, OP_TOKEN
+from n26.token_store import MemoryTokenStore
+from tests.test_api_base import N26TestBase, mock_auth_token, read_response_file
+
+
+class AgentTests(N26TestBase):
+    """Authentication agent tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.socket_path = Path(self._directory.name) / "agent.sock"
+        self.agent = Agent(api.Api(self.config, token_store=MemoryTokenStore()), self.socket_path)
+        self.agent.start()
+
+    def tearDown(self):
+        self.agent.stop()
+        self._directory.cleanup()
+        super().tearDown()
+
+    def _client_api(self) -> api.Api:
+        return api.Api(self.config, token_store=AgentTokenStore(self.socket_path))
+
+    @mock_auth_token
+    def test_clients_share_the_token_of_the_agent(self):
+        self.assertEqual(stat.S_IMODE(os.stat(str(self.socket_path)).st_mode), 0o600)
+
+        first = self._client_api()
+        second = self._client_api()
+        expected = read_response_file("auth_token.json")["access_token"]
+        self.assertEqual(first.get_token(), expected)
+        self.assertEqual(second.get_token(), expected)
+        # refreshes are handled by the agent as well
+        second.refresh_authentication()
+        self.assertEqual(second.get_token(), expected)
+
+        # only the agent has requested a token
+        self.assertEqual(api.Api._request_token.call_count, 1)
+        api.Api._refresh_token.assert_not_called()
+
+        status = AgentClient(self.socket_path).request(OP_STATUS)
+        self.assertTrue(status["authenticated"])
+        self.assertEqual(status["pid"], os.getpid())
+
+        # clients can't log out or replace the token of the agent
+        first.token_store.clear()
+        with self.assertRaises(PermissionError):
+            first.token_store.write({})
+        self.assertEqual(self.agent.api.token_data["access_token"], expected)
+
+    @mock_auth_token
+    def test_clients_never_receive_the_refresh_token(self):
+        client = AgentClient(self.socket_path)
+        for op in [OP_TOKEN, OP_READ]:
+            token_data = client.request(op)["token_data"]
+            self.assertEqual(sorted(token_data), ["access_token", "expiration_time"])
+        self.assertIn("refresh_token", self.agent.api.token_data)
+
+        for op in ["write", "cas", "clear"]:
+            with self.assertRaisesRegex(AgentError, "Unsupported operation"):
+                client.request(op, token_data={}, expected={})
+        client.close()
+
+    @mock_auth_token
+    def test_agent_refreshes_before_expiration(self):
+        self.agent.stop()
+        client = api.Api(self.config, token_store=MemoryTokenStore())
+        client.token_data = dict(read_response_file("auth_token.json"), expiration_time=time.time() + 30)
+        self.agent = Agent(client, self.socket_path, refresh_margin=60)
+        self.agent.start()
+
+        for _ in range(100):
+            if self.agent.refreshes:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.agent.refreshes, 1)
+        self.assertEqual(client.token_data["access_token"], read_response_file("refresh_token.json")["access_token"])
+
+    def test_only_one_agent_per_socket(self):
+        with self.assertRaises(FileExistsError):
+            Agent(api.Api(self.config, token_store=MemoryTokenStore()), self.socket_path).start()
+
+    def test_stop_removes_socket(self):
+        self.agent.stop()
+        self.assertFalse(self.socket_path.exists())
+        with self.assertRaises(ConnectionError):
+            AgentClient(self.socket_path).request(OP_STATUS)
@@ -1,6 +1,16 @@
+from unittest import mock
+
+from requests import HTTPError
+
 from n26 import api, config
 from n26.api import BASE_URL_DE, POST, GET
-from tests.test_api_base import N26TestBase, mock_auth_token, mock_requests
+from n26.transport import RecordedResponse
+from tests.test_api_base import N26TestBase, mock_auth_token, mock_requests, read_response_file
+
+
+def _token_response(status_code: int, body: str = "", headers: dict = None) -> RecordedResponse:
+    headers = dict({"Content-Type": "application/json"}, **(headers or {}))
+    return RecordedResponse(BASE_URL_DE + "/oauth2/token", status_code, headers, body.encode("utf-8"))
 
 
 class ApiTests(N26TestBase):
@@ -46,3 +56,31 @@ class ApiTests(N26TestBase):
         api_client = api.Api(conf)
         self.assertIsNotNone(api_client.config)
         self.assertEqual(api_client.config, conf)
+
+    def test_mfa_polling_backs_off_and_honors_retry_after(self):
+        responses = [
+            _token_response(400, '{"error": "authorization_pending"}'),
+            _token_response(429, headers={"Retry-After": "2"}),
+            _token_response(400, '{"error": "authorization_pending", "interval": 0.1}'),
+            _token_response(200, read_response_file("auth_token.json", to_json=False).decode("utf-8")),
+        ]
+        with mock.patch('n26.transport.requests.post', side_effect=responses) as post, \
+                mock.patch('tenacity.nap.time.sleep') as sleep:
+            tokens = self._underTest._complete_authentication_flow("mfa-token")
+
+        self.assertEqual(tokens, read_response_file("auth_token.json"))
+        self.assertEqual(post.call_count, 4)
+        # growing intervals, unless the server asks for a longer one
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [0.5, 2.0, 1.125])
+
+    def test_mfa_polling_stops_on_hard_errors(self):
+        for response in [_token_response(401, '{"error": "unauthorized"}'),
+                         _token_response(400, '{"error": "expired_token"}'),
+                         _token_response(400, '{"error": "invalid_grant"}'),
+                         _token_response(400, '<html>Bad Request</html>')]:
+            with mock.patch('n26.transport.requests.post', return_value=response) as post, \
+                    mock.patch('tenacity.nap.time.sleep') as sleep:
+                with self.assertRaises(HTTPError):
+                    self._underTest._complete_authentication_flow("mfa-token")
+            self.assertEqual(post.call_count, 1)
+            sleep.assert_not_called()
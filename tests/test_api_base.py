@@ -83,7 +83,11 @@ def mock_requests(method: str, response_file: str or None, url_regex: str = None
             is_json = response_file.endswith('.json') if response_file else False
             response = read_response_file(response_file, to_json=is_json)
             content = "" if response is None else response
-            mock_request.return_value.content = content if not is_json else str(content)
+            mock_request.return_value.status_code = 200
+            mock_request.return_value.content = content if not is_json else json.dumps(content).encode("utf-8")
+            mock_request.return_value.iter_content.side_effect = lambda chunk_size=1: (
+                mock_request.return_value.content[i:i + chunk_size]
+                for i in range(0, len(mock_request.return_value.content), chunk_size))
             mock_request.return_value.json.return_value = response
             mock_request.return_value.headers = {
                 "Content-Type": "application/json" if is_json else ""
@@ -96,13 +100,13 @@ def mock_requests(method: str, response_file: str or None, url_regex: str = None
             import n26
             from n26.api import GET, POST
             if method is GET:
-                original = n26.api.requests.get
+                original = n26.transport.requests.get
             elif method is POST:
-                original = n26.api.requests.post
+                original = n26.transport.requests.post
             else:
                 raise AttributeError("Unsupported method: {}".format(method))
 
-            with mock.patch('n26.api.requests.{}'.format(method)) as mock_request:
+            with mock.patch('n26.transport.requests.{}'.format(method)) as mock_request:
                 add_side_effects(mock_request, original)
                 result = function(*args, **kwargs)
                 return result
@@ -0,0 +1,123 @@
+import time
+import unittest
+from datetime import date
+from tempfile import TemporaryDirectory
+
+from n26 import archive as archive_module
+from n26.api import Api, GET
+from n26.archive import ResponseArchive, ArchiveTransport, BLOCK, HEADER, day_range
+from n26.config import ARCHIVE_COMPRESSION_ZSTD
+from n26.token_store import MemoryTokenStore
+from n26.transport import RecordedResponse
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BALANCE_URL = "https://api.tech26.de/api/accounts"
+SPACES_URL = "https://api.tech26.de/api/spaces"
+
+
+def _response(url: str, response_file: str) -> RecordedResponse:
+    return RecordedResponse(url, 200, {"Content-Type": "application/json"},
+                            read_response_file(response_file, to_json=False))
+
+
+class ArchiveTests(N26TestBase):
+    """Response archive tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.archive = ResponseArchive(self._directory.name, block_size=1)
+
+    def tearDown(self):
+        self._directory.cleanup()
+        super().tearDown()
+
+    def _fill(self, days: list):
+        for day in days:
+            from_time, _ = day_range(day)
+            self.archive.append(GET, BALANCE_URL, _response(BALANCE_URL, "balance.json"), timestamp=from_time + 1000)
+            self.archive.append(GET, SPACES_URL, _response(SPACES_URL, "spaces.json"), timestamp=from_time + 2000)
+
+    def test_query_by_day_and_endpoint(self):
+        self._fill([date(2023, 10, 1), date(2023, 10, 2), date(2023, 10, 3)])
+        # one block per response due to the block size
+        self.assertEqual(self.archive.index_path.stat().st_size, HEADER.size + 6 * BLOCK.size)
+        self.assertEqual(self.archive.endpoints(), ["/api/accounts", "/api/spaces"])
+
+        responses = list(self.archive.day(date(2023, 10, 2)))
+        self.assertEqual([response.url for response in responses], [BALANCE_URL, SPACES_URL])
+        self.assertEqual(responses[0].timestamp, day_range(date(2023, 10, 2))[0] + 1000)
+        self.assertEqual(responses[0].parse(), read_response_file("balance.json"))
+
+        responses = list(self.archive.query(endpoint="/api/spaces"))
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(responses[0].parse()["spaces"][1]["name"], "Vacation")
+        self.assertEqual(list(self.archive.query(endpoint="/api/unknown")), [])
+
+    def test_only_matching_blocks_are_decompressed(self):
+        self._fill([date(2023, 10, day) for day in range(1, 31)])
+        decompressed = []
+        original = archive_module._decompress
+
+        def _decompress(block: bytes) -> bytes:
+            decompressed.append(block)
+            return original(block)
+
+        archive_module._decompress = _decompress
+        try:
+            self.assertEqual(len(list(self.archive.day(date(2023, 10, 15), endpoint="/api/spaces"))), 1)
+        finally:
+            archive_module._decompress = original
+        self.assertEqual(len(decompressed), 1)
+
+    def test_responses_are_journaled_until_flush(self):
+        archive = ResponseArchive(self._directory.name)
+        archive.append(GET, BALANCE_URL, _response(BALANCE_URL, "balance.json"))
+        self.assertFalse(archive.index_path.exists())
+        self.assertEqual(len(list(archive.query(endpoint="/api/accounts"))), 1)
+        archive.flush()
+        self.assertEqual(archive.journal_path.stat().st_size, 0)
+        self.assertEqual(len(list(archive.query(endpoint="/api/accounts"))), 1)
+
+    def test_journaled_responses_survive_a_crash(self):
+        archive = ResponseArchive(self._directory.name)
+        archive.append(GET, BALANCE_URL, _response(BALANCE_URL, "balance.json"))
+        # a process killed while writing leaves an incomplete line behind
+        with archive.journal_path.open("ab") as journal:
+            journal.write(b'{"timestamp": ')
+
+        recovered = ResponseArchive(self._directory.name)
+        self.assertEqual([response.url for response in recovered.query()], [BALANCE_URL])
+        recovered.flush()
+        self.assertEqual(len(list(recovered.query(endpoint="/api/accounts"))), 1)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zstd(self):
+        archive = ResponseArchive(self._directory.name, compression=ARCHIVE_COMPRESSION_ZSTD, block_size=1)
+        archive.append(GET, BALANCE_URL, _response(BALANCE_URL, "balance.json"))
+        self.assertEqual(next(archive.query()).parse(), read_response_file("balance.json"))
+
+    @mock_requests(method=GET, response_file="balance.json")
+    def test_api_archives_responses(self):
+        self.config.ARCHIVE_DIR.value = self._directory.name + "/"
+        try:
+            start = int(time.time() * 1000)
+            self._underTest.get_balance()
+            self._underTest.archive.flush()
+        finally:
+            self.config.ARCHIVE_DIR.value = None
+
+        responses = list(ResponseArchive(self._directory.name).query(from_time=start))
+        self.assertEqual([response.url for response in responses], [BALANCE_URL])
+
+        # replay the archived response into a client without network access
+        token_store = MemoryTokenStore()
+        token_store.write(dict(read_response_file("auth_token.json"), expiration_time=time.time() + 600))
+        replay = Api(self.config, transport=ArchiveTransport(ResponseArchive(self._directory.name)),
+                     token_store=token_store)
+        self.assertEqual(replay.get_balance(), read_response_file("balance.json"))
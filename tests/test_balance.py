@@ -1,5 +1,14 @@
+from datetime import date, datetime, timedelta
+from unittest import mock
+
 from n26.api import GET
-from tests.test_api_base import N26TestBase, mock_requests
+from n26.balance_history import daily_balances, intraday_balances, day_start
+from n26.models import TransactionBatch
+from tests.test_api_base import N26TestBase, mock_requests, mock_auth_token
+
+
+def _timestamp(day: date, hour: int) -> int:
+    return int(datetime(day.year, day.month, day.day, hour).timestamp() * 1000)
 
 
 class BalanceTest(N26TestBase):
@@ -10,3 +19,65 @@ class BalanceTest(N26TestBase):
         from n26.cli import balance
         result = self._run_cli_cmd(balance)
         self.assertRegex(result.output, r"\d*\.\d* \w*.*")
+
+    def test_daily_and_intraday_balances(self):
+        first = date(2019, 3, 1)
+        days = [first + timedelta(days=offset) for offset in range(4)]
+        batch = TransactionBatch.from_dicts([
+            {"id": "3", "visibleTS": _timestamp(days[3], 9), "amount": -5.0},
+            {"id": "1", "visibleTS": _timestamp(days[0], 12), "amount": 100.0},
+            {"id": "2", "visibleTS": _timestamp(days[2], 8), "amount": -20.5},
+            {"id": "4", "visibleTS": _timestamp(days[3], 18), "amount": 1.0},
+        ])
+        # current balance after all transactions
+        self.assertEqual(daily_balances(10000, batch, days), [12450, 12450, 10400, 10000])
+        self.assertEqual(daily_balances(10000, batch, days[:2]), [12450, 12450])
+        self.assertEqual([balance for _, balance in intraday_balances(10000, batch)], [12450, 10400, 9900, 10000])
+
+    @mock_auth_token
+    def test_balance_history_is_cached(self):
+        today = date.today()
+        from_time = day_start(today - timedelta(days=10))
+        transactions = TransactionBatch.from_dicts([
+            {"id": "1", "visibleTS": day_start(today - timedelta(days=5)) + 1000, "amount": -50.0},
+            {"id": "2", "visibleTS": day_start(today - timedelta(days=1)) + 1000, "amount": 25.0},
+        ])
+
+        with mock.patch.object(self._underTest, 'get_balance', return_value={"availableBalance": 100.0}), \
+                mock.patch.object(self._underTest, 'get_transaction_batch', return_value=transactions) as fetch:
+            history = self._underTest.get_balance_history(from_time=from_time)
+            self.assertEqual(len(history), 11)
+            self.assertEqual(history[0], {"date": (today - timedelta(days=10)).isoformat(), "balance": 125.0})
+            self.assertEqual(history[5]["balance"], 75.0)
+            self.assertEqual(history[-1]["balance"], 100.0)
+            self.assertEqual(fetch.call_args[1]["from_time"], from_time)
+
+            # settled days are cached, only recent days are fetched again
+            self.assertEqual(self._underTest.get_balance_history(from_time=from_time), history)
+            self.assertEqual(fetch.call_args[1]["from_time"], day_start(today - timedelta(days=3)))
+
+    @mock_auth_token
+    def test_truncated_balance_history_is_not_cached(self):
+        today = date.today()
+        from_time = day_start(today - timedelta(days=10))
+        transactions = TransactionBatch.from_dicts([
+            {"id": "1", "visibleTS": day_start(today - timedelta(days=5)) + 1000, "amount": -50.0},
+            {"id": "2", "visibleTS": day_start(today - timedelta(days=1)) + 1000, "amount": 25.0},
+        ])
+
+        with mock.patch.object(self._underTest, 'get_balance', return_value={"availableBalance": 100.0}), \
+                mock.patch.object(self._underTest, 'get_transaction_batch', return_value=transactions) as fetch:
+            self._underTest.get_balance_history(from_time=from_time, limit=2)
+            self._underTest.get_balance_history(from_time=from_time, limit=2)
+            self.assertEqual(fetch.call_args[1]["from_time"], from_time)
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    @mock_requests(method=GET, response_file="transactions.json", url_regex=r"/api/smrt/transactions")
+    def test_balance_history_cli(self):
+        from n26.cli import balance
+        result = self._run_cli_cmd(balance, ["--history", "--from", "2019-03-15", "--to", "2019-03-20"])
+        self.assertIn("2019-03-15", result.output)
+        self.assertIn("2019-03-20", result.output)
+
+        result = self._run_cli_cmd(balance, ["--intraday", "--from", "2019-03-15", "--to", "2019-04-30"])
+        self.assertIn("100.00", result.output)
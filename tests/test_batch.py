@@ -0,0 +1,49 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from n26.api import GET
+from n26.transport import HttpTransport
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
+
+
+class BatchTests(N26TestBase):
+    """Batch command tests"""
+
+    def _run_batch(self, directory: str, commands: list, args: list = None) -> any:
+        from n26.cli import cli
+        commands_path = os.path.join(directory, "commands")
+        with open(commands_path, "w") as file:
+            file.write("\n".join(commands))
+        # the mocked requests module functions are not used by pooled sessions
+        with mock.patch('n26.transport.HttpTransport.pooled', return_value=HttpTransport()):
+            return self._run_cli_cmd(cli, ["batch", commands_path] + (args or []), ignore_exceptions=True)
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    @mock_requests(method=GET, response_file="spaces.json", url_regex=r"/api/spaces$")
+    def test_batch_tagged_output(self):
+        with TemporaryDirectory() as directory:
+            with mock.patch('n26.api.Api.refresh_authentication') as refresh_authentication:
+                result = self._run_batch(directory, ["# comment", "balance", "", "n26 -json spaces"],
+                                         ["--parallel", "2"])
+            self.assertEqual(result.exit_code, 0, result.output)
+            # authenticated once for the whole batch
+            self.assertEqual(refresh_authentication.call_count, 1)
+
+            lines = result.output.splitlines()
+            self.assertTrue(any(line.startswith("[1:balance] ") and "EUR" in line for line in lines))
+            spaces_output = "\n".join(line[len("[2:spaces] "):] for line in lines if line.startswith("[2:spaces] "))
+            self.assertEqual(json.loads(spaces_output), read_response_file("spaces.json")["spaces"])
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    def test_batch_output_dir_and_failures(self):
+        with TemporaryDirectory() as directory:
+            output_dir = os.path.join(directory, "output")
+            result = self._run_batch(directory, ["-json balance", "unknown-command"], ["--output-dir", output_dir])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn("[2:unknown-command] Error", result.output)
+            self.assertIn("1 of 2 commands failed", result.output)
+
+            with open(os.path.join(output_dir, "01-balance.json")) as file:
+                self.assertEqual(json.load(file), read_response_file("balance.json"))
@@ -0,0 +1,59 @@
+import glob
+import json
+import os
+import unittest
+
+from n26 import codec
+
+
+def _fixture_files() -> list:
+    directory = os.path.join(os.path.dirname(__file__), 'api_responses')
+    return sorted(glob.glob(os.path.join(directory, '*.json')))
+
+
+class CodecTests(unittest.TestCase):
+    """JSON codec tests"""
+
+    def setUp(self):
+        self._previous_backend = codec.get_backend()
+
+    def tearDown(self):
+        codec.set_backend(self._previous_backend)
+
+    def test_stdlib_always_available(self):
+        self.assertIn(codec.BACKEND_STDLIB, codec.available_backends())
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            codec.set_backend("unknown")
+
+    def test_backends_match_stdlib_for_fixtures(self):
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            for file_path in _fixture_files():
+                with open(file_path, 'rb') as file:
+                    content = file.read()
+                expected = json.loads(content)
+                with self.subTest(backend=backend, file=os.path.basename(file_path)):
+                    self.assertEqual(codec.loads(content), expected)
+                    self.assertEqual(codec.dumps(expected, indent=2), json.dumps(expected, indent=2))
+                    self.assertEqual(codec.dumps(expected), json.dumps(expected))
+
+    def test_backends_escape_non_ascii(self):
+        data = {"street": "Einbahnstraße", "emoji": "\U0001F4B6", "url": "https://n26.com/"}
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.dumps(data, indent=2), json.dumps(data, indent=2))
+                self.assertEqual(codec.dumps(data, indent=2, ensure_ascii=False),
+                                 json.dumps(data, indent=2, ensure_ascii=False))
+
+    def test_backends_match_stdlib_for_floats(self):
+        data = {"values": [0.1, 1.0, -0.0, 1e16, 1.5e-07, 1e300, 123456789.123, float("nan"), float("inf")],
+                "amount": {"value": -12.5, "limit": 1e+22}}
+        for backend in codec.available_backends():
+            codec.set_backend(backend)
+            with self.subTest(backend=backend):
+                self.assertEqual(codec.dumps(data, indent=2), json.dumps(data, indent=2))
+                self.assertEqual(codec.dumps(data), json.dumps(data))
+                self.assertEqual(codec.dumps({"value": 0.1}, indent=2), json.dumps({"value": 0.1}, indent=2))
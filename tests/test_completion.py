@@ -0,0 +1,72 @@
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from click.shell_completion import ShellComplete
+
+from n26 import api
+from n26.api import GET
+from n26.completion import CompletionCache, SOURCE_CARDS, SOURCE_CATEGORIES, complete
+from n26.token_store import MemoryTokenStore
+from tests.test_api_base import N26TestBase, mock_requests
+
+
+class CompletionTests(N26TestBase):
+    """Shell completion tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.config.CACHE_DIR.value = self._directory.name + "/"
+
+    def tearDown(self):
+        self.config.CACHE_DIR.value = None
+        self._directory.cleanup()
+        super().tearDown()
+
+    def _refresh(self, source: str) -> bool:
+        # an existing login, refreshes never start a new one
+        self._underTest.authenticate()
+        return CompletionCache(self._underTest).refresh(source)
+
+    @patch("n26.completion.subprocess.Popen")
+    def test_stale_cache_is_refreshed_in_background(self, popen):
+        self.assertEqual(complete(self._underTest, SOURCE_CARDS, ""), [])
+        popen.assert_called_once()
+        self.assertEqual(popen.call_args[0][0][-2:], ["n26.completion", SOURCE_CARDS])
+
+        # no second refresh while the first one is still running
+        complete(self._underTest, SOURCE_CARDS, "")
+        popen.assert_called_once()
+
+    @patch("n26.completion.subprocess.Popen")
+    @mock_requests(method=GET, response_file="cards.json")
+    def test_complete_cached_cards(self, popen):
+        self.assertTrue(self._refresh(SOURCE_CARDS))
+
+        items = complete(self._underTest, SOURCE_CARDS, "22")
+        self.assertEqual([item.value for item in items], ["22345678-1234-abcd-abcd-1234567890ab"])
+        self.assertEqual(items[0].help, "MAESTRO 765432******1234")
+        popen.assert_not_called()
+
+    @patch("n26.completion.subprocess.Popen")
+    @mock_requests(method=GET, response_file="categories.json")
+    def test_complete_last_category(self, popen):
+        self._refresh(SOURCE_CATEGORIES)
+
+        items = complete(self._underTest, SOURCE_CATEGORIES, "micro-v2-atm,micro-v2-ba", separator=",")
+        self.assertEqual([item.value for item in items], ["micro-v2-atm,micro-v2-bars-restaurants"])
+
+    @patch("n26.completion.subprocess.Popen")
+    @mock_requests(method=GET, response_file="cards.json")
+    def test_cli_completion(self, popen):
+        from n26.cli import cli
+        self._refresh(SOURCE_CARDS)
+
+        completions = ShellComplete(cli, {}, "n26", "_N26_COMPLETE").get_completions(["card-block", "--card"], "1")
+        self.assertEqual([item.value for item in completions], ["12345678-1234-abcd-abcd-1234567890ab"])
+
+    def test_refresh_never_starts_a_login(self):
+        client = api.Api(self.config, token_store=MemoryTokenStore())
+        with patch.object(api.Api, "_request_token") as request_token:
+            self.assertFalse(CompletionCache(client).refresh(SOURCE_CARDS))
+        request_token.assert_not_called()
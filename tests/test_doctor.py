@@ -0,0 +1,122 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from n26 import api
+from n26.doctor import diagnose, percentile, PHASE_DNS, PHASE_TCP, PHASE_TLS, PHASE_TOKEN, PHASE_REFRESH, \
+    PHASE_REQUEST, TOKEN_STATE_VALID, TOKEN_STATE_EXPIRED, TOKEN_STATE_MISSING
+from n26.token_store import MemoryTokenStore
+from tests.test_api_base import N26TestBase, read_response_file
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers authenticated requests like the api"""
+
+    def do_GET(self):
+        authorized = self.headers.get("Authorization") == "Bearer {}".format(
+            read_response_file("auth_token.json")["access_token"])
+        body = json.dumps(read_response_file("account_info.json") if authorized else {"error": "unauthorized"})
+        self.send_response(200 if authorized else 401)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode("utf-8"))
+
+    def log_message(self, *args):
+        pass
+
+
+class DoctorTests(N26TestBase):
+    """Connectivity diagnostics tests"""
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.config.AUTH_BASE_URL.value = self.url
+
+    def tearDown(self):
+        self.config.AUTH_BASE_URL.value = "https://api.tech26.de"
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def _client(self, token_data: dict = None) -> api.Api:
+        token_store = MemoryTokenStore()
+        if token_data is not None:
+            token_store.write(token_data)
+        return api.Api(self.config, token_store=token_store)
+
+    def test_percentile(self):
+        samples = [5, 1, 4, 2, 3]
+        self.assertEqual(percentile(samples, 50), 3)
+        self.assertEqual(percentile(samples, 99), 5)
+        self.assertEqual(percentile(samples, 0), 1)
+        self.assertIsNone(percentile([], 50))
+
+    def test_diagnose_stand_in_server(self):
+        token_data = dict(read_response_file("auth_token.json"), expiration_time=time.time() + 600)
+        report = diagnose(self._client(token_data), count=3, api_url=self.url)
+
+        stats = {(row["phase"], row["target"]): row for row in report.stats()}
+        host = self.url[len("http://"):]
+        # auth server and api are the same host, it is only probed once
+        self.assertEqual(sorted(stats), sorted([(PHASE_DNS, host), (PHASE_TCP, host), (PHASE_TOKEN, ""),
+                                                (PHASE_REQUEST, host)]))
+        self.assertNotIn(PHASE_TLS, [phase for phase, _ in stats])
+        for row in stats.values():
+            self.assertEqual(row["count"], 3)
+            self.assertEqual(row["errors"], 0)
+            self.assertLessEqual(row["min"], row["p50"])
+            self.assertLessEqual(row["p50"], row["p99"])
+
+        self.assertEqual(report.token_state, TOKEN_STATE_VALID)
+        self.assertFalse(report.token_refreshed)
+        self.assertAlmostEqual(report.token_expires_in, 600, delta=5)
+        self.assertLess(abs(report.clock_skew), 2)
+        self.assertAlmostEqual(report.token_expires_in_server_time, 600, delta=5)
+
+    def test_diagnose_reports_the_token_before_refreshing_it(self):
+        token_data = dict(read_response_file("auth_token.json"), expiration_time=time.time() - 60)
+        client = self._client(token_data)
+
+        def refresh():
+            client.token_data = dict(token_data, expiration_time=time.time() + 600)
+
+        with mock.patch.object(client, "refresh_authentication", side_effect=refresh) as refresh_authentication:
+            report = diagnose(client, count=3, api_url=self.url)
+
+        refresh_authentication.assert_called_once_with()
+        self.assertEqual(report.token_state, TOKEN_STATE_EXPIRED)
+        self.assertLess(report.token_expires_in, 0)
+        self.assertTrue(report.token_refreshed)
+        host = self.url[len("http://"):]
+        self.assertEqual(len(report.samples[(PHASE_REFRESH, host)]), 1)
+        self.assertEqual(len(report.samples[(PHASE_REQUEST, host)]), 3)
+
+    def test_diagnose_without_login(self):
+        client = self._client()
+        report = diagnose(client, count=2, api_url=self.url)
+
+        self.assertEqual(report.token_state, TOKEN_STATE_MISSING)
+        self.assertEqual(len(report.errors[(PHASE_TOKEN, "")]), 2)
+        self.assertNotIn(PHASE_REQUEST, [phase for phase, _ in report.samples])
+        self.assertIsNone(report.clock_skew)
+
+    def test_diagnose_unreachable_server(self):
+        self.config.AUTH_BASE_URL.value = "http://127.0.0.1:1"
+        report = diagnose(self._client(), count=1, api_url=self.url)
+        self.assertEqual(len(report.errors[(PHASE_TCP, "127.0.0.1:1")]), 1)
+
+    def test_doctor_cli(self):
+        from n26.cli import cli
+        token_data = dict(read_response_file("auth_token.json"), expiration_time=time.time() + 600)
+        with mock.patch("n26.cli.API_CLIENT", self._client(token_data)):
+            result = self._run_cli_cmd(cli, ["doctor", "--count", "2", "--api-url", self.url])
+
+        self.assertIn("request", result.output)
+        self.assertIn("Clock skew", result.output)
+        self.assertIn(TOKEN_STATE_VALID, result.output)
@@ -0,0 +1,93 @@
+from unittest import mock
+
+from requests import HTTPError
+
+from n26.api import GET
+from n26.enrichment import Enricher, CATEGORY_NAME, CONTACT_ID, CONTACT_NAME
+from tests.test_api_base import N26TestBase, mock_requests, mock_auth_token, read_response_file
+
+
+def _enricher() -> Enricher:
+    return Enricher(read_response_file("categories.json"), read_response_file("contacts.json"))
+
+
+class EnrichmentTests(N26TestBase):
+    """Enrichment tests"""
+
+    def test_enrich_transactions(self):
+        enricher = _enricher()
+        transactions = [
+            {"id": "1", "category": "micro-v2-food-groceries", "partnerIban": "de84 1008 0000 0616 2162 00"},
+            {"id": "2", "category": "micro-v2-unknown", "partnerName": "  cyberport   GMBH"},
+            {"id": "3", "partnerName": "Somebody else"},
+        ]
+
+        result = enricher.enrich_transactions(iter(transactions))
+        first = next(result)
+        self.assertEqual(first[CATEGORY_NAME], "Food & Groceries")
+        self.assertEqual(first[CONTACT_ID], "0fffffff-1234-abcd-abcd-1234567890ab")
+        self.assertEqual(first[CONTACT_NAME], "ADAC Berlin-Brandenburg")
+
+        second, third = list(result)
+        # unknown categories fall back to the id
+        self.assertEqual(second[CATEGORY_NAME], "micro-v2-unknown")
+        self.assertEqual(second[CONTACT_NAME], "Cyberport GmbH")
+        self.assertNotIn(CATEGORY_NAME, third)
+        self.assertNotIn(CONTACT_NAME, third)
+        # the input is not modified
+        self.assertNotIn(CATEGORY_NAME, transactions[0])
+
+    def test_enrich_statistics(self):
+        statistics = read_response_file("statistics.json")
+        enriched = _enricher().enrich_statistics(statistics)
+        for key in ["items", "incomeItems", "expenseItems"]:
+            self.assertEqual(len(enriched[key]), len(statistics[key]))
+            self.assertTrue(all(not item[CATEGORY_NAME].startswith("micro-v2") for item in enriched[key]))
+        self.assertEqual(enriched["total"], statistics["total"])
+        self.assertNotIn(CATEGORY_NAME, statistics["items"][0])
+
+    @mock_auth_token
+    def test_get_enricher_is_cached(self):
+        with mock.patch.object(self._underTest, 'get_available_categories',
+                               return_value=read_response_file("categories.json")) as categories, \
+                mock.patch.object(self._underTest, 'get_contacts',
+                                  return_value=read_response_file("contacts.json")) as contacts:
+            enricher = self._underTest.get_enricher()
+            self.assertEqual(enricher.category_name("micro-v2-atm"), "ATM")
+            self._underTest.get_enricher()
+            self.assertEqual(categories.call_count, 1)
+            self.assertEqual(contacts.call_count, 1)
+
+            # expired entries are fetched again
+            self._underTest.get_enricher(max_age=0)
+            self.assertEqual(categories.call_count, 2)
+
+    @mock_requests(method=GET, response_file="transactions.json")
+    def test_transactions_cli_shows_category_names(self):
+        from n26.cli import transactions
+        with mock.patch('n26.cli.API_CLIENT.get_enricher', return_value=_enricher()):
+            result = self._run_cli_cmd(transactions, ["--from", "01/30/2019", "--to", "30.01.2020", "--enrich"])
+        self.assertIn("Category", result.output)
+        self.assertIn("Bars & Restaurants", result.output)
+
+    @mock_requests(method=GET, response_file="transactions.json")
+    def test_transactions_cli_without_enrichment(self):
+        from n26.cli import transactions
+        result = self._run_cli_cmd(transactions, ["--from", "01/30/2019", "--to", "30.01.2020"])
+        self.assertNotIn("Category", result.output)
+
+    @mock_requests(method=GET, response_file="statistics.json")
+    def test_statistics_cli_without_enrichment(self):
+        from n26.cli import statistics
+        with mock.patch('n26.cli.API_CLIENT.get_enricher', side_effect=HTTPError("503 Server Error")):
+            result = self._run_cli_cmd(statistics, ["--enrich"])
+        # category ids are shown if the categories can't be retrieved
+        self.assertIn("micro-v2-income", result.output)
+
+    @mock_requests(method=GET, response_file="statistics.json")
+    def test_statistics_cli_is_not_enriched_by_default(self):
+        from n26.cli import statistics
+        with mock.patch('n26.cli.API_CLIENT.get_enricher') as get_enricher:
+            result = self._run_cli_cmd(statistics)
+        get_enricher.assert_not_called()
+        self.assertIn("micro-v2-income", result.output)
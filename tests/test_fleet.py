@@ -0,0 +1,66 @@
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from n26.api import GET
+from n26.fleet import find_configs, run_fleet, OPERATION_BALANCE, OPERATION_SPACES, STATUS_OK, STATUS_ERROR
+from n26.resilience import RateLimiter
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
+
+ACCOUNT_CONFIG = """n26:
+  username: {}@example.com
+  password: $upersecret
+  device_token: 5a136085-abd8-4e71-9402-e0a61dd1dc81
+"""
+
+
+class FleetTests(N26TestBase):
+    """Fleet tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.config_dir = Path(self._directory.name)
+        (self.config_dir / "alice.yml").write_text(ACCOUNT_CONFIG.format("alice"))
+        (self.config_dir / "bob.toml").write_text(
+            '[n26]\nusername = "bob@example.com"\npassword = "secret"\n'
+            'device_token = "5a136085-abd8-4e71-9402-e0a61dd1dc81"\n')
+        # the device token is missing
+        (self.config_dir / "broken.yaml").write_text("n26:\n  username: broken@example.com\n")
+        (self.config_dir / "notes.txt").write_text("not a config")
+
+    def tearDown(self):
+        self._directory.cleanup()
+        super().tearDown()
+
+    def test_find_configs(self):
+        self.assertEqual([path.name for path in find_configs(self.config_dir)],
+                         ["alice.yml", "bob.toml", "broken.yaml"])
+
+    @mock_requests(method=GET, response_file="balance.json")
+    def test_run_fleet(self):
+        report = run_fleet(find_configs(self.config_dir), OPERATION_BALANCE, max_workers=3)
+        self.assertEqual([result.account for result in report.results], ["alice", "bob", "broken"])
+        self.assertEqual([result.status for result in report.results], [STATUS_OK, STATUS_OK, STATUS_ERROR])
+        self.assertIn("device_token", report.failed[0].error)
+
+        rows = report.rows()
+        self.assertEqual([row["account"] for row in rows], ["alice", "bob"])
+        self.assertEqual(rows[0]["availableBalance"], read_response_file("balance.json")["availableBalance"])
+
+    @mock_requests(method=GET, response_file="spaces.json")
+    def test_fleet_cli(self):
+        from n26.cli import cli
+        result = self._run_cli_cmd(cli, ["fleet", str(self.config_dir), OPERATION_SPACES], ignore_exceptions=True)
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("alice", result.output)
+        self.assertIn("3 entries", result.output)
+        self.assertIn("1 of 3 accounts failed", result.output)
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(20)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        # the first request is executed right away, the others every 50ms
+        self.assertTrue(time.monotonic() - start >= 0.19)
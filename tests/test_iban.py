@@ -0,0 +1,111 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from n26 import api
+from n26.iban import validate_iban, validate_bic, validate_transfer, build_bank_index, BankIndex, bank_code
+from tests.test_api_base import N26TestBase, mock_auth_token
+
+VALID_IBAN = "DE89 3704 0044 0532 0130 00"
+
+
+class IbanTests(N26TestBase):
+    """IBAN and BIC validation tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.index_path = Path(self._directory.name) / "bank_codes.idx"
+        build_bank_index([
+            ("DE", "37040044", "COBADEFFXXX"),
+            ("DE", "10011001", "NTSBDEB1XXX"),
+            ("GB", "WEST", "WESTGB2L"),
+            ("DE", "50010517", "INGDDEFFXXX"),
+        ], self.index_path)
+        self.index = BankIndex(self.index_path)
+
+    def tearDown(self):
+        self.index.close()
+        self._directory.cleanup()
+        super().tearDown()
+
+    def test_validate_iban(self):
+        self.assertEqual(validate_iban(VALID_IBAN.lower()), "DE89370400440532013000")
+        self.assertEqual(validate_iban("GB82WEST12345698765432"), "GB82WEST12345698765432")
+        self.assertEqual(bank_code("DE89370400440532013000"), ("DE", "37040044"))
+
+        for invalid, reason in [
+            ("DE88370400440532013000", "check digits"),
+            ("DE8937040044053201300", "have 22 characters"),
+            ("XX89370400440532013000", "country code"),
+            ("DE89-3704-0044", "format"),
+        ]:
+            with self.subTest(iban=invalid):
+                with self.assertRaisesRegex(ValueError, reason):
+                    validate_iban(invalid)
+
+    def test_validate_bic(self):
+        self.assertEqual(validate_bic(" ntsbdeb1xxx "), "NTSBDEB1XXX")
+        self.assertEqual(validate_bic("NTSBDEB1"), "NTSBDEB1")
+        with self.assertRaises(ValueError):
+            validate_bic("NTSB1")
+
+    def test_bank_index(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.bics("DE", "37040044"), ["COBADEFFXXX"])
+        self.assertEqual(self.index.bics("DE", "12345678"), [])
+        self.assertEqual(self.index.bics("GB", "WEST"), ["WESTGB2L"])
+
+    def test_missing_bank_index(self):
+        missing = BankIndex(Path(self._directory.name) / "missing.idx")
+        with self.assertRaisesRegex(ValueError, "missing.idx"):
+            validate_transfer(VALID_IBAN, "", missing)
+
+    def test_validate_transfer(self):
+        # derived from the index
+        self.assertEqual(validate_transfer(VALID_IBAN, "", self.index), ("DE89370400440532013000", "COBADEFFXXX"))
+        # branch codes of the same institution are accepted
+        self.assertEqual(validate_transfer(VALID_IBAN, "COBADEFF370", self.index)[1], "COBADEFF370")
+        with self.assertRaisesRegex(ValueError, "COBADEFFXXX"):
+            validate_transfer(VALID_IBAN, "NTSBDEB1XXX", self.index)
+        # without an index only the format is checked
+        self.assertEqual(validate_transfer(VALID_IBAN, "NTSBDEB1XXX"), ("DE89370400440532013000", "NTSBDEB1XXX"))
+
+    @mock_auth_token
+    def test_create_transaction_validates_before_encrypting_the_pin(self):
+        with patch.object(api.Api, "encrypt_user_pin") as encrypt_user_pin:
+            with self.assertRaises(ValueError):
+                self._underTest.create_transaction("DE88370400440532013000", "", "Name", "Reference", 1.0, "1234")
+        encrypt_user_pin.assert_not_called()
+
+    @mock_auth_token
+    def test_cli_fails_for_missing_bank_index(self):
+        from click.testing import CliRunner
+        from n26.cli import cli
+        self.config.BANK_INDEX_PATH.value = str(Path(self._directory.name) / "missing.idx")
+        try:
+            result = CliRunner().invoke(cli, ["transaction"], input=VALID_IBAN + "\n")
+        finally:
+            self.config.BANK_INDEX_PATH.value = None
+
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("missing.idx", result.output)
+        self.assertNotIn("IBAN", result.output)
+
+    @mock_auth_token
+    def test_cli_asks_again_for_invalid_iban(self):
+        from click.testing import CliRunner
+        from n26.cli import cli
+        self.config.BANK_INDEX_PATH.value = str(self.index_path)
+        try:
+            with patch.object(api.Api, "create_transaction") as create_transaction:
+                create_transaction.return_value = {}
+                result = CliRunner().invoke(cli, ["transaction"], input="\n".join([
+                    "DE88370400440532013000", VALID_IBAN, "", "Name", "Reference", "1.00", "1234", ""]))
+        finally:
+            self.config.BANK_INDEX_PATH.value = None
+
+        self.assertIn("Invalid IBAN check digits", result.output)
+        self.assertIn("Using BIC COBADEFFXXX", result.output)
+        create_transaction.assert_called_once_with("DE89370400440532013000", "COBADEFFXXX", "Name", "Reference",
+                                                   "1.00", "1234")
@@ -0,0 +1,50 @@
+from n26 import api
+from n26.api import GET
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
+
+
+class OverviewTests(N26TestBase):
+    """Overview tests"""
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    @mock_requests(method=GET, response_file="spaces.json", url_regex=r"/api/spaces$")
+    @mock_requests(method=GET, response_file="cards.json", url_regex=r"/api/v2/cards$")
+    @mock_requests(method=GET, response_file="account_limits.json", url_regex=r"/api/settings/account/limits$")
+    @mock_requests(method=GET, response_file="account_statuses.json", url_regex=r"/api/me/statuses$")
+    @mock_requests(method=GET, response_file="transactions.json", url_regex=r"/api/smrt/transactions")
+    def test_get_overview(self):
+        result = self._underTest.get_overview()
+        self.assertEqual(result[api.OVERVIEW_ERRORS], {})
+        self.assertEqual(result[api.OVERVIEW_BALANCE], read_response_file("balance.json"))
+        self.assertEqual(result[api.OVERVIEW_SPACES], read_response_file("spaces.json"))
+        self.assertEqual(result[api.OVERVIEW_CARDS], read_response_file("cards.json"))
+        self.assertEqual(result[api.OVERVIEW_LIMITS], read_response_file("account_limits.json"))
+        self.assertEqual(result[api.OVERVIEW_STATUSES], read_response_file("account_statuses.json"))
+        self.assertEqual(result[api.OVERVIEW_TRANSACTIONS], read_response_file("transactions.json"))
+
+    @mock_requests(method=GET, response_file="balance.json")
+    def test_get_overview_partial_failure(self):
+        from unittest import mock
+
+        with mock.patch.object(self._underTest, 'get_cards', side_effect=ValueError("cards unavailable")):
+            result = self._underTest.get_overview()
+
+        self.assertIsNone(result[api.OVERVIEW_CARDS])
+        self.assertEqual(result[api.OVERVIEW_ERRORS], {api.OVERVIEW_CARDS: "cards unavailable"})
+        self.assertEqual(result[api.OVERVIEW_BALANCE], read_response_file("balance.json"))
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    @mock_requests(method=GET, response_file="spaces.json", url_regex=r"/api/spaces$")
+    @mock_requests(method=GET, response_file="cards.json", url_regex=r"/api/v2/cards$")
+    @mock_requests(method=GET, response_file="account_limits.json", url_regex=r"/api/settings/account/limits$")
+    @mock_requests(method=GET, response_file="account_statuses.json", url_regex=r"/api/me/statuses$")
+    @mock_requests(method=GET, response_file="transactions.json", url_regex=r"/api/smrt/transactions")
+    def test_overview_cli(self):
+        from n26.cli import overview
+        result = self._run_cli_cmd(overview)
+        self.assertIn("Balance: 100.0 EUR", result.output)
+        self.assertIn("Main Account", result.output)
+        self.assertIn("123456******1234", result.output)
+        self.assertIn("ATM_DAILY_ACCOUNT", result.output)
+        self.assertIn("PAIRED", result.output)
+        self.assertIn("Partner Name", result.output)
@@ -0,0 +1,133 @@
+import time
+from unittest import mock
+
+import requests
+
+from n26.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, deadline, current_deadline, \
+    endpoint_group, request_timeout, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+from n26.transport import RecordedResponse
+from tests.test_api_base import N26TestBase, mock_auth_token, read_response_file
+
+
+def _response(status_code: int = 200, response_file: str = "balance.json") -> RecordedResponse:
+    return RecordedResponse("https://api.tech26.de", status_code, {"Content-Type": "application/json"},
+                            read_response_file(response_file, to_json=False))
+
+
+class ResilienceTests(N26TestBase):
+    """Deadline, timeout and circuit breaker tests"""
+
+    def test_deadline_caps_request_timeouts(self):
+        self.assertEqual(request_timeout(5.0, 30.0), (5.0, 30.0))
+        self.assertIsNone(request_timeout(None, None))
+
+        with deadline(10) as outer:
+            connect, read = request_timeout(5.0, 30.0)
+            self.assertEqual(connect, 5.0)
+            self.assertTrue(9 < read <= 10)
+
+            # nested deadlines can't extend the enclosing one
+            with deadline(60) as inner:
+                self.assertIs(inner, outer)
+            with deadline(1):
+                self.assertTrue(request_timeout(5.0, 30.0)[0] <= 1)
+            self.assertIs(current_deadline(), outer)
+        self.assertIsNone(current_deadline())
+
+        with deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                request_timeout(5.0, 30.0)
+
+    def test_endpoint_group(self):
+        self.assertEqual(endpoint_group("https://api.tech26.de/api/smrt/transactions?limit=5"),
+                         "api.tech26.de/api/smrt")
+        self.assertEqual(endpoint_group("https://api.tech26.de/oauth2/token"), "api.tech26.de/oauth2/token")
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+        breaker.before_request()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        # only a single probe is let through
+        breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+        # a failed probe opens the circuit again
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+        time.sleep(0.06)
+        breaker.before_request()
+        breaker.record_success()
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        breaker.before_request()
+
+    @mock_auth_token
+    def test_requests_use_configured_timeouts(self):
+        with mock.patch('n26.transport.requests.get', return_value=_response()) as get:
+            self._underTest.get_balance()
+        self.assertEqual(get.call_args[1]["timeout"], (5.0, 30.0))
+
+    @mock_auth_token
+    def test_circuit_opens_after_failures(self):
+        with mock.patch('n26.transport.requests.get', side_effect=requests.ConnectionError("unreachable")) as get:
+            for _ in range(self.config.CIRCUIT_BREAKER_THRESHOLD.value):
+                with self.assertRaises(requests.ConnectionError):
+                    self._underTest.get_balance()
+            with self.assertRaises(CircuitOpenError):
+                self._underTest.get_balance()
+        self.assertEqual(get.call_count, self.config.CIRCUIT_BREAKER_THRESHOLD.value)
+
+        # other endpoint groups are not affected
+        with mock.patch('n26.transport.requests.get', return_value=_response(response_file="contacts.json")):
+            self._underTest.get_contacts()
+
+    @mock_auth_token
+    def test_aborted_probe_lets_the_next_request_probe(self):
+        breaker = self._underTest.circuit_breakers.for_url("https://api.tech26.de/api/accounts")
+        breaker._opened_at = time.monotonic() - breaker.reset_timeout
+        with mock.patch('n26.transport.requests.get', side_effect=KeyboardInterrupt()):
+            with self.assertRaises(KeyboardInterrupt):
+                self._underTest.get_balance()
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+
+        with mock.patch('n26.transport.requests.get', return_value=_response()):
+            self._underTest.get_balance()
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    @mock_auth_token
+    def test_server_errors_count_as_failures(self):
+        breaker = self._underTest.circuit_breakers.for_url("https://api.tech26.de/api/accounts")
+        with mock.patch('n26.transport.requests.get', return_value=_response(status_code=503)):
+            with self.assertRaises(requests.HTTPError):
+                self._underTest.get_balance()
+        self.assertEqual(breaker._failures, 1)
+
+        with mock.patch('n26.transport.requests.get', return_value=_response(status_code=404)):
+            with self.assertRaises(requests.HTTPError):
+                self._underTest.get_balance()
+        self.assertEqual(breaker._failures, 0)
+
+    @mock_auth_token
+    def test_cli_deadline(self):
+        from n26.cli import cli
+
+        def slow_get(*args, **kwargs):
+            # the server takes longer than the remaining time
+            connect_timeout, read_timeout = kwargs["timeout"]
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout("Read timed out. (read timeout={})".format(read_timeout))
+
+        with mock.patch('n26.transport.requests.get', side_effect=slow_get) as get:
+            result = self._run_cli_cmd(cli, ["--deadline", "0.05", "balance"], ignore_exceptions=True)
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("Read timed out", result.output)
+        self.assertTrue(get.call_args[1]["timeout"][1] <= 0.05)
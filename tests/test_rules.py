@@ -0,0 +1,71 @@
+from unittest import mock
+
+from n26.const import AMOUNT, INCOMING_TRANSFER
+from n26.models import ID, VISIBLE_TS, CATEGORY, PARTNER_IBAN, TYPE
+from n26.rules import Rule, RulesEngine, DIRECTION_OUTGOING, DIRECTION_INCOMING, AGGREGATE_COUNT
+from tests.test_api_base import N26TestBase, read_response_file
+
+HOUR_MS = 60 * 60 * 1000
+
+
+def _transaction(id: str, hours: float, amount: float, category: str = "micro-v2-food-groceries", **kwargs) -> dict:
+    transaction = {ID: id, VISIBLE_TS: int(hours * HOUR_MS), AMOUNT: amount, CATEGORY: category}
+    transaction.update(kwargs)
+    return transaction
+
+
+class RulesTests(N26TestBase):
+    """Rules engine tests"""
+
+    def test_window_sum(self):
+        engine = RulesEngine([Rule("groceries", category="micro-v2-food-groceries", direction=DIRECTION_OUTGOING,
+                                   threshold=500, window=24 * 60 * 60)])
+        alerts = engine.process_all([
+            _transaction("1", 0, -300),
+            _transaction("2", 1, 1000),  # incoming, ignored
+            _transaction("3", 2, -150.5, category="micro-v2-leisure"),  # other category
+            _transaction("4", 3, -250),  # 550 within 24h
+            _transaction("5", 4, -10),  # still above, no additional alert
+            _transaction("6", 30, -400),  # window restarted
+            _transaction("7", 31, -200),
+        ])
+        self.assertEqual([(alert.transaction[ID], alert.amount) for alert in alerts], [("4", 550.0), ("7", 600.0)])
+
+    def test_single_transaction_rules(self):
+        engine = RulesEngine.from_dicts([
+            {"name": "from landlord", "partner_iban": "DE12 3456 7890 1234 5678 90", "direction": DIRECTION_INCOMING},
+            {"name": "large transfer", "type": INCOMING_TRANSFER, "threshold": 1000},
+            {"name": "frequent", "category": "micro-v2-income", "aggregate": AGGREGATE_COUNT, "threshold": 1,
+             "window": 60 * 60},
+        ])
+        transaction = _transaction("1", 0, 40.0, category="micro-v2-income",
+                                   **{PARTNER_IBAN: "DE12345678901234567890", TYPE: INCOMING_TRANSFER})
+        self.assertEqual([alert.rule.name for alert in engine.process(transaction)], ["from landlord"])
+        # transactions are only processed once
+        self.assertEqual(engine.process(transaction), [])
+
+        second = _transaction("2", 0.5, 2000.0, category="micro-v2-income", **{TYPE: INCOMING_TRANSFER})
+        self.assertEqual(sorted(alert.rule.name for alert in engine.process(second)), ["frequent", "large transfer"])
+
+    def test_only_matching_rules_are_evaluated(self):
+        engine = RulesEngine([Rule("iban {}".format(i), partner_iban="DE{:020d}".format(i)) for i in range(5000)])
+        self.assertEqual(len(engine), 5000)
+        with mock.patch('n26.rules.Alert', wraps=lambda rule, transaction, value: rule) as alert:
+            alerts = engine.process(_transaction("1", 0, 1, **{PARTNER_IBAN: "DE{:020d}".format(42)}))
+        self.assertEqual(alerts, [engine._indexes[(PARTNER_IBAN,)][("DE{:020d}".format(42),)][0]])
+        self.assertEqual(alert.call_count, 1)
+
+    def test_api_transactions(self):
+        transactions = read_response_file("transactions.json")
+        # the ids in the response file are not unique
+        for index, transaction in enumerate(transactions):
+            transaction[ID] = str(index)
+        engine = RulesEngine([Rule("income", category="micro-v2-income")])
+        alerts = engine.process_all(transactions)
+        self.assertEqual(len(alerts), len([t for t in transactions if t[CATEGORY] == "micro-v2-income"]))
+
+    def test_invalid_rules(self):
+        with self.assertRaises(ValueError):
+            Rule("invalid", direction="sideways")
+        with self.assertRaises(ValueError):
+            Rule("invalid", window=60)
@@ -0,0 +1,40 @@
+from unittest import mock
+
+from n26.api import GET
+from tests.test_api_base import N26TestBase, mock_requests
+
+
+class ShellTests(N26TestBase):
+    """Interactive shell tests"""
+
+    @mock_requests(method=GET, response_file="balance.json", url_regex=r"/api/accounts$")
+    @mock_requests(method=GET, response_file="cards.json", url_regex=r"/api/v2/cards$")
+    def test_shell(self):
+        from click.testing import CliRunner
+        from n26 import api
+        from n26.cli import cli
+
+        execute_request = api.Api._execute_request
+        with mock.patch('n26.shell.readline', None), \
+                mock.patch('n26.transport.HttpTransport.pooled', return_value=api.HttpTransport()), \
+                mock.patch('n26.api.Api._execute_request', autospec=True, side_effect=execute_request) as request:
+            result = CliRunner().invoke(cli, ["shell"], input="balance\ncards\n-json cards\nreload\ncards\nexit\n")
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("EUR", result.output)
+        self.assertIn("123456******1234", result.output)
+        # latency of every command
+        self.assertEqual(result.output.count(" ms)"), 4)
+        # cards are cached until reloaded
+        card_requests = [call for call in request.call_args_list if call[0][2].endswith("/api/v2/cards")]
+        self.assertEqual(len(card_requests), 2)
+
+    def test_completion(self):
+        from n26.cli import cli
+        from n26.shell import Shell
+
+        shell = Shell(cli, run_command=lambda args: None, history_file=None)
+        self.assertIn("card-block", shell.completenames("card-"))
+        self.assertEqual(shell.completedefault("m", "statistics --by m", 16, 17), ["month"])
+        self.assertIn("--limit", shell.completedefault("--l", "transactions --l", 13, 16))
+        self.assertIn("balance", shell.completedefault("bal", "-json bal", 6, 9))
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from n26.singleflight import SingleFlight
+from tests.test_api_base import N26TestBase, mock_auth_token, read_response_file
+
+
+class SingleFlightTests(unittest.TestCase):
+    """SingleFlight tests"""
+
+    def test_concurrent_calls_are_coalesced(self):
+        single_flight = SingleFlight()
+        executions = []
+        callers = 8
+        barrier = threading.Barrier(callers)
+
+        def slow():
+            executions.append(1)
+            time.sleep(0.2)
+            return {"value": [1, 2, 3]}
+
+        def call(_):
+            barrier.wait()
+            return single_flight.do("key", slow)
+
+        with ThreadPoolExecutor(max_workers=callers) as executor:
+            results = list(executor.map(call, range(callers)))
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(result == {"value": [1, 2, 3]} for result in results))
+        # every caller receives its own copy
+        self.assertEqual(len({id(result) for result in results}), callers)
+        self.assertEqual(single_flight.stats(), {"calls": callers, "executed": 1, "coalesced": callers - 1})
+
+    def test_different_keys_are_not_coalesced(self):
+        single_flight = SingleFlight()
+        self.assertEqual(single_flight.do("a", lambda: 1), 1)
+        self.assertEqual(single_flight.do("b", lambda: 2), 2)
+        self.assertEqual(single_flight.do("a", lambda: 3), 3)
+        self.assertEqual(single_flight.stats()["coalesced"], 0)
+
+    def test_errors_are_shared(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(single_flight.do, "key", failing)
+            started.wait()
+            second = executor.submit(single_flight.do, "key", failing)
+            for future in [first, second]:
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(single_flight.stats()["executed"], 1)
+
+
+class ApiSingleFlightTests(N26TestBase):
+    """Request coalescing in the Api client"""
+
+    @mock_auth_token
+    def test_concurrent_get_requests_are_coalesced(self):
+        balance = read_response_file("balance.json")
+
+        def slow_get(*args, **kwargs):
+            time.sleep(0.2)
+            response = mock.Mock()
+            response.status_code = 200
+            response.content = json.dumps(balance)
+            response.headers = {"Content-Type": "application/json"}
+            return response
+
+        callers = 4
+        barrier = threading.Barrier(callers)
+
+        def call(_):
+            barrier.wait()
+            return self._underTest.get_balance()
+
+        with mock.patch('n26.transport.requests.get', side_effect=slow_get) as get:
+            with ThreadPoolExecutor(max_workers=callers) as executor:
+                results = list(executor.map(call, range(callers)))
+
+        self.assertEqual(get.call_count, 1)
+        self.assertTrue(all(result == balance for result in results))
+        self.assertEqual(self._underTest.get_request_stats()["coalesced"], callers - 1)
@@ -0,0 +1,109 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from n26.api import GET
+from n26.snapshots import SnapshotStore, Snapshot, RECORD, HEADER, AGGREGATE_MAX, account_series, space_series
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
+
+ACCOUNT = account_series("account")
+SPACE = space_series("space")
+MINUTE = 60 * 1000
+
+
+class SnapshotTests(N26TestBase):
+    """Snapshot store tests"""
+
+    def setUp(self):
+        super().setUp()
+        self._directory = TemporaryDirectory()
+        self.store = SnapshotStore(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+        super().tearDown()
+
+    def _append_minutes(self, count: int):
+        for minute in range(count):
+            self.store.append({ACCOUNT: 10000 + minute, SPACE: -minute}, timestamp=minute * MINUTE,
+                              names={ACCOUNT: "Main", SPACE: "Vacation"})
+
+    def test_append_and_query(self):
+        self._append_minutes(180)
+        self.assertEqual(len(self.store), 360)
+        self.assertEqual(Path(self.store.data_path).stat().st_size, HEADER.size + 360 * RECORD.size)
+        self.assertEqual(self.store.series(), [{"id": ACCOUNT, "name": "Main"}, {"id": SPACE, "name": "Vacation"}])
+
+        self.assertEqual(self.store.query(from_time=10 * MINUTE, to_time=11 * MINUTE), [
+            Snapshot(10 * MINUTE, ACCOUNT, 10010),
+            Snapshot(10 * MINUTE, SPACE, -10),
+            Snapshot(11 * MINUTE, ACCOUNT, 10011),
+            Snapshot(11 * MINUTE, SPACE, -11),
+        ])
+        self.assertEqual([snapshot.balance for snapshot in self.store.query(from_time=178 * MINUTE, series=SPACE)],
+                         [-1.78, -1.79])
+        self.assertEqual(self.store.query(from_time=200 * MINUTE), [])
+        self.assertEqual(self.store.query(series="space/unknown"), [])
+
+        # another store reads the series added by this one
+        self.assertEqual(len(SnapshotStore(self._directory.name).query(series=ACCOUNT)), 180)
+
+    def test_downsample(self):
+        self._append_minutes(180)
+        self.assertEqual(self.store.downsample(60 * 60, series=ACCOUNT), [
+            Snapshot(0, ACCOUNT, 10059),
+            Snapshot(60 * MINUTE, ACCOUNT, 10119),
+            Snapshot(120 * MINUTE, ACCOUNT, 10179),
+        ])
+        self.assertEqual([snapshot.balance_cents for snapshot in
+                          self.store.downsample(60 * 60, series=SPACE, aggregate=AGGREGATE_MAX)], [0, -60, -120])
+        with self.assertRaises(ValueError):
+            self.store.downsample(60, aggregate="median")
+
+    def test_append_is_chronological(self):
+        self._append_minutes(2)
+        with self.assertRaises(ValueError):
+            self.store.append({ACCOUNT: 1}, timestamp=0)
+
+    def test_incomplete_record_is_dropped(self):
+        self._append_minutes(2)
+        with open(str(self.store.data_path), "ab") as file:
+            file.write(b"\x01\x02\x03")
+        self.assertEqual(len(self.store.query()), 4)
+
+        self.store.append({ACCOUNT: 1}, timestamp=5 * MINUTE)
+        self.assertEqual(self.store.query(from_time=5 * MINUTE), [Snapshot(5 * MINUTE, ACCOUNT, 1)])
+
+    def test_query_while_a_new_series_is_appended(self):
+        self._append_minutes(2)
+        reader = SnapshotStore(self._directory.name)
+        load_index = reader._load_index
+
+        def load_index_then_append():
+            load_index()
+            reader._load_index = load_index
+            # another process adds a series between loading the index and mapping the data
+            self.store.append({space_series("new"): 5}, timestamp=3 * MINUTE, names={space_series("new"): "New"})
+
+        reader._load_index = load_index_then_append
+        self.assertEqual(reader.query(from_time=3 * MINUTE), [Snapshot(3 * MINUTE, space_series("new"), 5)])
+
+    def test_incomplete_index_line_is_ignored(self):
+        self._append_minutes(1)
+        with open(str(self.store.index_path), "ab") as file:
+            file.write(b'{"id": "space/par')
+        self.assertEqual(len(SnapshotStore(self._directory.name).query()), 2)
+
+    @mock_requests(method=GET, response_file="spaces.json", url_regex=".*/spaces")
+    @mock_requests(method=GET, response_file="balance.json", url_regex=".*/accounts")
+    def test_snapshot_cli(self):
+        from n26.cli import cli
+        self.config.SNAPSHOT_DIR.value = self._directory.name + "/"
+        try:
+            result = self._run_cli_cmd(cli, ["snapshot"])
+            self.assertIn("Recorded 4 balances", result.output)
+
+            result = self._run_cli_cmd(cli, ["snapshots", "--resolution", "day"])
+            self.assertIn(read_response_file("balance.json")["iban"], result.output)
+            self.assertIn("Vacation", result.output)
+        finally:
+            self.config.SNAPSHOT_DIR.value = None
@@ -1,6 +1,6 @@
 from n26.api import GET
 
-from tests.test_api_base import N26TestBase, mock_requests
+from tests.test_api_base import N26TestBase, mock_requests, read_response_file
 
 
 class StandingOrdersTests(N26TestBase):
@@ -19,3 +19,45 @@ class StandingOrdersTests(N26TestBase):
         self.assertIn('MONTHLY', result.output)
         self.assertIn('YEARLY', result.output)
         self.assertIn('10/30/18', result.output)
+
+    def test_reconcile(self):
+        from datetime import datetime, timezone
+        from n26.reconcile import reconcile, project_outflows, STATUS_ON_TIME, STATUS_LATE, STATUS_MISSED, \
+            STATUS_PENDING
+
+        def timestamp(*args) -> int:
+            return int(datetime(*args, tzinfo=timezone.utc).timestamp() * 1000)
+
+        standing_order = read_response_file("standing_orders.json")["data"][0]
+        transactions = [
+            {"id": "jan", "visibleTS": timestamp(2019, 1, 1, 10), "amount": -123.45,
+             "partnerIban": "DE12 3456 7890 1234 5678 90", "partnerName": "Someone"},
+            {"id": "feb", "visibleTS": timestamp(2019, 2, 5), "amount": -123.45,
+             "partnerIban": "DE12345678901234567890"},
+            # different amount
+            {"id": "other", "visibleTS": timestamp(2019, 3, 1), "amount": -23.45,
+             "partnerIban": "DE12345678901234567890"},
+            # no iban, matched by name
+            {"id": "apr", "visibleTS": timestamp(2019, 4, 2), "amount": -123.45, "partnerName": "someone"},
+        ]
+
+        reconciliation, = reconcile([standing_order], transactions, timestamp(2019, 1, 1), timestamp(2019, 5, 3))
+        self.assertEqual([(execution.status, execution.transaction and execution.transaction["id"])
+                          for execution in reconciliation.executions],
+                         [(STATUS_ON_TIME, "jan"), (STATUS_LATE, "feb"), (STATUS_MISSED, None),
+                          (STATUS_ON_TIME, "apr"), (STATUS_PENDING, None)])
+        self.assertEqual(reconciliation.last_execution["id"], "apr")
+
+        upcoming = project_outflows([standing_order], timestamp(2019, 5, 2), timestamp(2019, 8, 1))
+        self.assertEqual([ts for ts, _ in upcoming], [timestamp(2019, 6, 1), timestamp(2019, 7, 1),
+                                                      timestamp(2019, 8, 1)])
+
+    @mock_requests(method=GET, response_file="standing_orders.json", url_regex=r"/api/transactions/so")
+    @mock_requests(method=GET, response_file="transactions.json", url_regex=r"/api/smrt/transactions")
+    def test_reconcile_cli(self):
+        from n26.cli import standing_orders
+        result = self._run_cli_cmd(standing_orders, ["--reconcile", "--horizon", "62"])
+        self.assertIn("Someone", result.output)
+        self.assertIn("Missed", result.output)
+        self.assertIn("Upcoming executions (next 62 days)", result.output)
+        self.assertIn("123.45", result.output)
@@ -1,8 +1,17 @@
-from n26.api import GET
+import time
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from unittest import mock
 
+from n26.api import GET
+from n26.util import split_time_range, period_start, PERIOD_MONTH, PERIOD_WEEK, PERIOD_YEAR
 from tests.test_api_base import N26TestBase, mock_requests
 
 
+def _ms(*args) -> int:
+    return int(datetime(*args).timestamp() * 1000)
+
+
 class StatisticsTests(N26TestBase):
     """Statistics tests"""
 
@@ -11,3 +20,63 @@ class StatisticsTests(N26TestBase):
         from n26.cli import statistics
         result = self._run_cli_cmd(statistics)
         self.assertIsNotNone(result.output)
+
+    def test_split_time_range(self):
+        periods = split_time_range(_ms(2019, 1, 15), _ms(2019, 4, 2), PERIOD_MONTH)
+        self.assertEqual(periods, [
+            (_ms(2019, 1, 15), _ms(2019, 2, 1) - 1),
+            (_ms(2019, 2, 1), _ms(2019, 3, 1) - 1),
+            (_ms(2019, 3, 1), _ms(2019, 4, 1) - 1),
+            (_ms(2019, 4, 1), _ms(2019, 4, 2)),
+        ])
+        self.assertEqual(len(split_time_range(_ms(2019, 12, 1), _ms(2020, 1, 31), PERIOD_MONTH)), 2)
+        self.assertEqual(len(split_time_range(_ms(2015, 6, 1), _ms(2020, 1, 1), PERIOD_YEAR)), 6)
+        # 2019-01-07 is a monday
+        self.assertEqual(split_time_range(_ms(2019, 1, 9), _ms(2019, 1, 20), PERIOD_WEEK),
+                         [(_ms(2019, 1, 9), _ms(2019, 1, 14) - 1), (_ms(2019, 1, 14), _ms(2019, 1, 20))])
+
+    @mock_requests(method=GET, response_file="statistics.json")
+    def test_get_statistics_by_period_caches_closed_periods(self):
+        now = int(time.time() * 1000)
+        from_time = now - 100 * 24 * 60 * 60 * 1000
+        periods = split_time_range(from_time, now, PERIOD_MONTH)
+
+        with TemporaryDirectory() as cache_dir:
+            with mock.patch.object(self.config.CACHE_DIR, '_value', cache_dir + "/"):
+                with mock.patch.object(self._underTest, 'get_statistics',
+                                       wraps=self._underTest.get_statistics) as get_statistics:
+                    result = self._underTest.get_statistics_by_period(from_time, now, PERIOD_MONTH)
+                    self.assertEqual(len(result), len(periods))
+                    self.assertEqual([(r["from"], r["to"]) for r in result], periods)
+                    self.assertEqual(get_statistics.call_count, len(periods))
+
+                    # a new client only fetches the ongoing period
+                    from n26 import api
+                    client = api.Api(self.config)
+                    with mock.patch.object(client, 'get_statistics', wraps=client.get_statistics) as second:
+                        second_result = client.get_statistics_by_period(from_time, now, PERIOD_MONTH)
+                        self.assertEqual(second.call_count, 1)
+                        self.assertEqual(second_result, result)
+
+    @mock_requests(method=GET, response_file="statistics.json")
+    def test_get_statistics_by_period_never_caches_the_ongoing_period(self):
+        now = int(time.time() * 1000)
+        # ends before now but within the ongoing period
+        from_time = period_start(now, PERIOD_MONTH)
+        to_time = max(from_time, now - 1000)
+
+        with TemporaryDirectory() as cache_dir:
+            with mock.patch.object(self.config.CACHE_DIR, '_value', cache_dir + "/"):
+                self._underTest.get_statistics_by_period(from_time, to_time, PERIOD_MONTH)
+
+                from n26 import api
+                client = api.Api(self.config)
+                with mock.patch.object(client, 'get_statistics', wraps=client.get_statistics) as second:
+                    client.get_statistics_by_period(from_time, to_time, PERIOD_MONTH)
+                    self.assertEqual(second.call_count, 1)
+
+    @mock_requests(method=GET, response_file="statistics.json")
+    def test_statistics_by_period_cli(self):
+        from n26.cli import statistics
+        result = self._run_cli_cmd(statistics, ["--by", "month", "--from", "2019-01-01", "--to", "2019-03-31"])
+        self.assertEqual(result.output.count("649.02"), 3)
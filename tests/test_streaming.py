@@ -0,0 +1,43 @@
+import json
+import unittest
+
+from n26.streaming import iter_json_array
+
+
+def _chunks(document: bytes, size: int) -> list:
+    return [document[i:i + size] for i in range(0, len(document), size)]
+
+
+class StreamingTests(unittest.TestCase):
+    """Incremental JSON array decoding tests"""
+
+    def test_elements_split_across_chunks(self):
+        elements = [{"id": i, "amount": -1.5 * i, "text": "Café \"]," * (i % 3), "tags": [i, None]}
+                    for i in range(50)] + [12345, -0.5e3, "]", [], {}, True, None]
+        document = json.dumps(elements, ensure_ascii=False).encode("utf-8")
+        for size in [1, 3, 64, len(document)]:
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_array(_chunks(document, size))), elements)
+
+    def test_decoding_overlaps_with_reading(self):
+        read = []
+
+        def chunks():
+            for chunk in _chunks(b'[{"id": 1}, {"id": 2}, {"id": 3}]', 4):
+                read.append(chunk)
+                yield chunk
+
+        elements = iter_json_array(chunks())
+        self.assertEqual(next(elements), {"id": 1})
+        self.assertLess(len(read), 5)
+
+    def test_fields(self):
+        document = b'[{"id": 1, "amount": 2.5, "text": "x"}, {"id": 2}]'
+        self.assertEqual(list(iter_json_array([document], fields=["id", "amount"])),
+                         [{"id": 1, "amount": 2.5}, {"id": 2}])
+
+    def test_invalid_documents(self):
+        self.assertEqual(list(iter_json_array([b" [ ] "])), [])
+        for document in [b"", b"{}", b"[1,]", b"[,1]", b"[1 2]", b"[1", b'[{"id": ']:
+            with self.subTest(document=document), self.assertRaises(ValueError):
+                list(iter_json_array(_chunks(document, 1)))
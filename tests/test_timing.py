@@ -0,0 +1,47 @@
+import os
+import pstats
+from tempfile import TemporaryDirectory
+
+from n26.api import GET
+from n26.timing import Timings
+from tests.test_api_base import N26TestBase, mock_requests
+
+
+class TimingTests(N26TestBase):
+    """Timing instrumentation tests"""
+
+    def test_nested_phases(self):
+        timings = Timings()
+        with timings.timed("ignored"):
+            pass
+        self.assertEqual(timings.records(), [])
+
+        timings.enabled = True
+        with timings.timed("outer"):
+            with timings.timed("inner"):
+                pass
+            with timings.timed("inner"):
+                pass
+
+        summary = {name: (count, total, total_self) for name, count, total, total_self in timings.summary()}
+        self.assertEqual(summary["inner"][0], 2)
+        count, total, total_self = summary["outer"]
+        self.assertEqual(count, 1)
+        self.assertAlmostEqual(total_self, total - summary["inner"][1])
+
+    @mock_requests(method=GET, response_file="balance.json")
+    def test_timings_option(self):
+        from n26.cli import cli
+        result = self._run_cli_cmd(cli, ["--timings", "--trace-memory", "balance"])
+        for phase in ["import", "config", "auth", "http GET /api/accounts", "decode", "render", "total"]:
+            self.assertIn(phase, result.output)
+        self.assertIn("Peak memory allocated", result.output)
+
+    @mock_requests(method=GET, response_file="balance.json")
+    def test_profile_option(self):
+        from n26.cli import cli
+        with TemporaryDirectory() as directory:
+            profile_path = os.path.join(directory, "balance.prof")
+            self._run_cli_cmd(cli, ["--profile", profile_path, "balance"])
+            stats = pstats.Stats(profile_path)
+            self.assertGreater(stats.total_calls, 0)
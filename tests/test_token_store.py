@@ -0,0 +1,344 @@
+import json
+import multiprocessing
+import os
+import socketserver
+import threading
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from n26 import api
+from n26.filelock import FileLock
+from n26.token_store import TokenStore, MemoryTokenStore, FileTokenStore, SqliteTokenStore, RedisTokenStore
+from tests.test_api_base import N26TestBase, read_response_file
+
+
+def _create_config(token_path: str):
+    from container_app_conf.source.yaml_source import YamlSource
+    from n26.config import Config
+    conf = Config(singleton=False, data_sources=[YamlSource("test_creds", "./tests/")])
+    conf.LOGIN_DATA_STORE_PATH.value = token_path
+    return conf
+
+
+def _write_expired_token(token_path: str):
+    token_data = read_response_file("auth_token.json")
+    token_data[api.EXPIRATION_TIME_KEY] = time.time() - 10
+    api.Api._write_token_file(token_data, token_path)
+
+
+def _refresh_in_process(token_path: str, counter_path: str, start_event):
+    """
+    Runs in a separate process: refreshes the token and records every call to the token endpoint
+    """
+
+    def refresh(_, refresh_token: str) -> dict:
+        with open(counter_path, 'a') as file:
+            file.write(refresh_token + "\n")
+        time.sleep(0.3)
+        return read_response_file("refresh_token.json")
+
+    with mock.patch('n26.api.Api._refresh_token', new=refresh):
+        api_client = api.Api(_create_config(token_path))
+        start_event.wait()
+        api_client.get_token()
+
+
+class TokenStoreLockingTests(N26TestBase):
+    """Token store locking tests"""
+
+    def test_write_token_file_is_atomic_and_private(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            api.Api._write_token_file({"access_token": "a" * 100}, token_path)
+            api.Api._write_token_file({"access_token": "b"}, token_path)
+            self.assertEqual(api.Api._read_token_file(token_path), {"access_token": "b"})
+            self.assertEqual(os.stat(token_path).st_mode & 0o777, 0o600)
+            # no temporary files are left behind
+            self.assertEqual(os.listdir(directory), ["token_data"])
+
+    def test_file_lock_is_reentrant_and_exclusive(self):
+        with TemporaryDirectory() as directory:
+            lock_path = Path(directory) / "lock"
+            lock = FileLock(lock_path)
+            with lock:
+                with lock:
+                    pass
+                # a different lock object on the same file behaves like another process
+                other = FileLock(lock_path, timeout=0.2)
+                with self.assertRaises(TimeoutError):
+                    other.acquire()
+            with FileLock(lock_path, timeout=0.2):
+                pass
+
+    def test_single_refresh_across_processes(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            counter_path = os.path.join(directory, "refresh_calls")
+            _write_expired_token(token_path)
+
+            start_event = multiprocessing.Event()
+            processes = [multiprocessing.Process(target=_refresh_in_process,
+                                                 args=(token_path, counter_path, start_event))
+                         for _ in range(4)]
+            for process in processes:
+                process.start()
+            start_event.set()
+            for process in processes:
+                process.join(timeout=30)
+                self.assertEqual(process.exitcode, 0)
+
+            with open(counter_path) as file:
+                self.assertEqual(len(file.readlines()), 1)
+            with open(token_path) as file:
+                token_data = json.load(file)
+            self.assertEqual(token_data[api.ACCESS_TOKEN_KEY], read_response_file("refresh_token.json")["access_token"])
+
+    def test_forced_refresh_uses_concurrent_result(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            _write_expired_token(token_path)
+            api_client = api.Api(_create_config(token_path))
+
+            class ConcurrentRefresh(object):
+                """simulates another process refreshing the token while waiting for the lock"""
+
+                def __enter__(self):
+                    refreshed = read_response_file("refresh_token.json")
+                    refreshed[api.EXPIRATION_TIME_KEY] = time.time() + 600
+                    api.Api._write_token_file(refreshed, token_path)
+
+                def __exit__(self, *args):
+                    pass
+
+            with mock.patch('n26.api.Api._refresh_token') as refresh_token:
+                with mock.patch.object(api_client, '_token_lock', return_value=ConcurrentRefresh()):
+                    api_client.refresh_authentication()
+                refresh_token.assert_not_called()
+            self.assertTrue(api_client.is_authenticated())
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the small subset of the redis protocol used by the RedisTokenStore
+    """
+
+    def _read_command(self) -> list or None:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _write_bulk(self, value: bytes or None):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        else:
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+
+    def handle(self):
+        data = self.server.data
+        watched = {}
+        queued = None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].decode().upper()
+            with self.server.lock:
+                if queued is not None and command != "EXEC":
+                    queued.append(args)
+                    self.wfile.write(b"+QUEUED\r\n")
+                elif command == "GET":
+                    self._write_bulk(data.get(args[1]))
+                elif command == "SET":
+                    if b"NX" in args[3:] and args[1] in data:
+                        self._write_bulk(None)
+                    else:
+                        data[args[1]] = args[2]
+                        self.server.versions[args[1]] = self.server.versions.get(args[1], 0) + 1
+                        self.wfile.write(b"+OK\r\n")
+                elif command == "DEL":
+                    existed = data.pop(args[1], None) is not None
+                    self.server.versions[args[1]] = self.server.versions.get(args[1], 0) + 1
+                    self.wfile.write(b":%d\r\n" % existed)
+                elif command == "WATCH":
+                    watched[args[1]] = self.server.versions.get(args[1], 0)
+                    self.wfile.write(b"+OK\r\n")
+                elif command == "EVAL":
+                    # only the compare-and-delete script releasing locks
+                    key, value = args[3], args[4]
+                    released = data.get(key) == value
+                    if released:
+                        del data[key]
+                    self.wfile.write(b":%d\r\n" % released)
+                elif command == "UNWATCH":
+                    watched.clear()
+                    self.wfile.write(b"+OK\r\n")
+                elif command == "MULTI":
+                    queued = []
+                    self.wfile.write(b"+OK\r\n")
+                elif command == "EXEC":
+                    commands, queued = queued, None
+                    if any(self.server.versions.get(key, 0) != version for key, version in watched.items()):
+                        self.wfile.write(b"*-1\r\n")
+                    else:
+                        for _, key, value in commands:
+                            data[key] = value
+                            self.server.versions[key] = self.server.versions.get(key, 0) + 1
+                        self.wfile.write(b"*%d\r\n" % len(commands) + b"+OK\r\n" * len(commands))
+                    watched.clear()
+                else:
+                    self.wfile.write(b"-ERR unknown command\r\n")
+
+
+class _RespServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+
+class TokenStoreBackendTests(N26TestBase):
+    """Token store backend tests"""
+
+    def _assert_store_behaviour(self, store: TokenStore, other: TokenStore):
+        self.assertEqual(store.read(), {})
+        store.write({"access_token": "a"})
+        self.assertEqual(other.read(), {"access_token": "a"})
+
+        # stale expectations are rejected
+        self.assertFalse(store.compare_and_swap({"access_token": "x"}, {"access_token": "b"}))
+        self.assertTrue(other.compare_and_swap({"access_token": "a"}, {"access_token": "b"}))
+        self.assertEqual(store.read(), {"access_token": "b"})
+
+        with store.lock():
+            with store.lock():
+                store.write({"access_token": "c"})
+        self.assertEqual(other.read(), {"access_token": "c"})
+
+        other.clear()
+        self.assertEqual(store.read(), {})
+
+    def test_memory_store(self):
+        store = MemoryTokenStore()
+        self._assert_store_behaviour(store, store)
+
+    def test_file_store(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            self._assert_store_behaviour(FileTokenStore(token_path), FileTokenStore(token_path))
+
+    def test_file_store_caches_reads(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            store = FileTokenStore(token_path)
+            store.write({"access_token": "a"})
+            self.assertEqual(store.read(), {"access_token": "a"})
+            with mock.patch('n26.token_store.read_token_file') as read_token_file:
+                self.assertEqual(store.read(), {"access_token": "a"})
+                read_token_file.assert_not_called()
+
+    def test_sqlite_store(self):
+        with TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "token_data.db")
+            store = SqliteTokenStore(database_path)
+            other = SqliteTokenStore(database_path)
+            try:
+                self._assert_store_behaviour(store, other)
+            finally:
+                store.close()
+                other.close()
+
+    def test_sqlite_store_without_upsert(self):
+        # SQLite before 3.24
+        with mock.patch("n26.token_store.SQLITE_UPSERT", False):
+            self.test_sqlite_store()
+
+    def test_sqlite_store_rolls_back_failed_writes(self):
+        with TemporaryDirectory() as directory:
+            database_path = os.path.join(directory, "token_data.db")
+            store = SqliteTokenStore(database_path)
+            other = SqliteTokenStore(database_path)
+            try:
+                with mock.patch.object(store, "_upsert", side_effect=ValueError("broken")):
+                    with self.assertRaises(ValueError):
+                        store.write({"access_token": "a"})
+                self.assertFalse(store._connection.in_transaction)
+                # the database isn't left locked
+                other.write({"access_token": "b"})
+                self.assertEqual(store.read(), {"access_token": "b"})
+            finally:
+                store.close()
+                other.close()
+
+    def test_redis_store(self):
+        server = _RespServer()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = "redis://127.0.0.1:{}/".format(server.server_address[1])
+            store = RedisTokenStore(url, cache_ttl=0)
+            other = RedisTokenStore(url, cache_ttl=0)
+            self._assert_store_behaviour(store, other)
+            # the lock is released again
+            self.assertNotIn(b"n26:token_data:lock", server.data)
+            store.close()
+            other.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_redis_store_failures(self):
+        server = _RespServer()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            url = "redis://127.0.0.1:{}/".format(server.server_address[1])
+            store = RedisTokenStore(url, cache_ttl=0, lock_timeout=0.1)
+            other = RedisTokenStore(url, cache_ttl=0)
+            store.write({"access_token": "a"})
+
+            # a failure between WATCH and EXEC must not leave the connection in a transaction
+            with mock.patch("n26.token_store.codec.loads", side_effect=ValueError("invalid")):
+                with self.assertRaises(ValueError):
+                    store.compare_and_swap({"access_token": "a"}, {"access_token": "b"})
+            self.assertIsNone(store._connection)
+            self.assertEqual(store.read(), {"access_token": "a"})
+
+            with other.lock():
+                with self.assertRaises(TimeoutError):
+                    with store.lock():
+                        pass
+                # the lock expired and has been acquired by someone else, it must not be released
+                server.data[b"n26:token_data:lock"] = b"someone else"
+            self.assertEqual(server.data[b"n26:token_data:lock"], b"someone else")
+            store.close()
+            other.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_store_selected_by_config(self):
+        with TemporaryDirectory() as directory:
+            token_path = os.path.join(directory, "token_data")
+            conf = _create_config(token_path)
+            api_client = api.Api(conf)
+            self.assertIsInstance(api_client.token_store, FileTokenStore)
+
+            conf.TOKEN_STORE.value = "sqlite"
+            self.assertIsInstance(api_client.token_store, SqliteTokenStore)
+            api_client.token_data = {"access_token": "a"}
+            self.assertEqual(api_client.token_data, {"access_token": "a"})
+            api_client.token_store.close()
+
+            store = MemoryTokenStore()
+            self.assertIs(api.Api(conf, token_store=store).token_store, store)
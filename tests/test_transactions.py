@@ -11,3 +11,37 @@ class TransactionsTests(N26TestBase):
         from n26.cli import transactions
         result = self._run_cli_cmd(transactions, ["--from", "01/30/2019", "--to", "30.01.2020"])
         self.assertIsNotNone(result.output)
+
+    @mock_requests(method=GET, response_file="transactions.json")
+    def test_iter_transactions(self):
+        expected = self._underTest.get_transactions()
+        self.assertEqual(list(self._underTest.iter_transactions()), expected)
+
+        projected = list(self._underTest.iter_transactions(fields=["id", "amount", "unknown"]))
+        self.assertEqual(projected, [{"id": t["id"], "amount": t["amount"]} for t in expected])
+
+    @mock_requests(method=GET, response_file="transactions.json")
+    def test_get_transaction_batch(self):
+        expected = self._underTest.get_transactions()
+        result = self._underTest.get_transaction_batch()
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(result[0].amount_cents, int(round(expected[0]['amount'] * 100)))
+        self.assertEqual(result[0]['visibleTS'], expected[0]['visibleTS'])
+        self.assertEqual(result[-1].category, expected[-1]['category'])
+        self.assertEqual(result.total_cents(), int(round(sum(t['amount'] for t in expected) * 100)))
+
+    @mock_requests(method=GET, response_file="transactions.json")
+    def test_transaction_batch_slice_and_filter(self):
+        batch = self._underTest.get_transaction_batch()
+
+        sliced = batch[1:3]
+        self.assertEqual(len(sliced), 2)
+        self.assertEqual(sliced[0].to_dict(), batch[1].to_dict())
+
+        incoming = batch.filter(type="CT")
+        self.assertTrue(len(incoming) > 0)
+        self.assertTrue(all(row.type == "CT" for row in incoming))
+        self.assertEqual(len(batch.filter(category="does-not-exist")), 0)
+
+        expenses = batch.filter(lambda row: row.amount < 0)
+        self.assertTrue(all(row.amount_cents < 0 for row in expenses))
@@ -0,0 +1,120 @@
+import os
+import stat
+import time
+from tempfile import TemporaryDirectory
+
+from requests import HTTPError
+
+from n26 import api
+from n26.api import GET, POST, BASE_URL_DE
+from n26.resilience import RateLimiter
+from n26.transport import Transport, HttpTransport, RecordingTransport, ReplayTransport, RecordedResponse, \
+    RateLimitedTransport
+from tests.test_api_base import N26TestBase, mock_requests, mock_auth_token, read_response_file
+
+
+class TransportTests(N26TestBase):
+    """Transport tests"""
+
+    def _record_balance(self, cassette: str):
+        @mock_requests(method=GET, response_file="balance.json")
+        def record():
+            transport = RecordingTransport(cassette, HttpTransport())
+            try:
+                return api.Api(self.config, transport=transport).get_balance()
+            finally:
+                transport.close()
+
+        return record()
+
+    @mock_auth_token
+    def test_record_and_replay(self):
+        for file_name in ["cassette.jsonl", "cassette.jsonl.gz"]:
+            with TemporaryDirectory() as directory, self.subTest(file_name=file_name):
+                cassette = "{}/{}".format(directory, file_name)
+                recorded = self._record_balance(cassette)
+                self.assertEqual(recorded, read_response_file("balance.json"))
+
+                api_client = api.Api(self.config, transport=ReplayTransport(cassette))
+                # responses are replayed in a loop
+                for _ in range(3):
+                    self.assertEqual(api_client.get_balance(), recorded)
+
+    @mock_auth_token
+    def test_replay_without_loop(self):
+        with TemporaryDirectory() as directory:
+            cassette = "{}/cassette.jsonl".format(directory)
+            self._record_balance(cassette)
+
+            api_client = api.Api(self.config, transport=ReplayTransport(cassette, loop=False))
+            api_client.get_balance()
+            with self.assertRaises(ValueError):
+                api_client.get_balance()
+
+    @mock_auth_token
+    def test_replay_simulated_latency(self):
+        with TemporaryDirectory() as directory:
+            cassette = "{}/cassette.jsonl".format(directory)
+            self._record_balance(cassette)
+
+            api_client = api.Api(self.config, transport=ReplayTransport(cassette, latency=0.1))
+            start = time.perf_counter()
+            api_client.get_balance()
+            self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+
+    @mock_auth_token
+    def test_replay_unknown_request(self):
+        with TemporaryDirectory() as directory:
+            cassette = "{}/cassette.jsonl".format(directory)
+            self._record_balance(cassette)
+
+            api_client = api.Api(self.config, transport=ReplayTransport(cassette))
+            with self.assertRaises(ValueError):
+                api_client.get_spaces()
+
+    def test_recorded_response_errors(self):
+        response = RecordedResponse(BASE_URL_DE + "/api/me", 401, {"Content-Type": "application/json"}, b"{}")
+        self.assertEqual(response.headers["content-type"], "application/json")
+        with self.assertRaises(HTTPError) as context:
+            response.raise_for_status()
+        self.assertEqual(context.exception.response.status_code, 401)
+
+    def test_tokens_are_not_recorded(self):
+        class TokenTransport(Transport):
+            def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                        timeout: float or tuple = None, stream: bool = False):
+                response_file = "refresh_token.json" if url.endswith("/oauth2/token") else "account_info.json"
+                return RecordedResponse(url, 200, {"Content-Type": "application/json"},
+                                        read_response_file(response_file, to_json=False))
+
+        with TemporaryDirectory() as directory:
+            cassette = "{}/cassette.jsonl".format(directory)
+            transport = RecordingTransport(cassette, TokenTransport())
+            try:
+                transport.request(POST, BASE_URL_DE + "/oauth2/token", data={"grant_type": "refresh_token"})
+                transport.request(GET, BASE_URL_DE + "/api/me")
+            finally:
+                transport.close()
+
+            with open(cassette) as file:
+                content = file.read()
+            self.assertEqual(len(content.splitlines()), 1)
+            self.assertNotIn("access_token", content)
+            self.assertEqual(stat.S_IMODE(os.stat(cassette).st_mode), 0o600)
+
+    @mock_auth_token
+    def test_wrapped_transports_without_stream_support(self):
+        class LegacyTransport(Transport):
+            def request(self, method: str, url: str, headers: dict = None, json: dict = None, data: dict = None,
+                        timeout: float or tuple = None):
+                return RecordedResponse(url, 200, {"Content-Type": "application/json"},
+                                        read_response_file("balance.json", to_json=False))
+
+        with TemporaryDirectory() as directory:
+            transport = RecordingTransport("{}/cassette.jsonl".format(directory),
+                                           RateLimitedTransport(LegacyTransport(), RateLimiter(100)))
+            try:
+                self.assertEqual(api.Api(self.config, transport=transport).get_balance(),
+                                 read_response_file("balance.json"))
+            finally:
+                transport.close()